@@ -3,7 +3,7 @@ import duckdb
 from datetime import date, datetime, timezone
 
 from src.config import configuration
-from src.utils.db import get_connection
+from src.utils.db import get_connection, attach_postgres_duckdb
 
 from src.utils.logger import get_logger
 
@@ -11,49 +11,140 @@ from src.utils.etl import (
     # etl functions that you will create
     extract_pandas,
     extract_duckdb,
+    extract_polars,
     load_pandas,
     load_duckdb,
+    load_polars,
     transform_pandas,
-    transform_duckdb
+    transform_parallel_pandas,
+    transform_duckdb,
+    transform_polars
 )
-
-def main():
+from src.utils.profiler import (
+    profile_pandas,
+    profile_duckdb,
+    check_profile
+)
+from src.utils.query_profile import profile_queries
+from src.utils.engine_select import resolve_engine
+from src.utils.watcher import watch_directory
+from src.utils.socrata import SOCRATA_FILE_NAME, fetch_socrata, read_watermark, save_watermark
+from src.utils.summaries import SummaryDelta
+from src.utils.jobs import run_coordinator, run_worker
+
+def run_pipeline(file_name: str, engine, con=None, summary_delta=None):
+    """
+    Run the ETL for one input file, or for POSTGRES_SOURCE when `file_name` is None;
+    `con` reuses an open DuckDB connection and `summary_delta` describes what changed in the input.
+    """
     logger = get_logger(log_level=configuration.LOG_LEVEL)
-    engine = get_connection()
-    logger.info("Starting")
+    transform_engine = resolve_engine(file_name)
 
-    if configuration.TRANSFORM_ENGINE == "pandas":
+    if transform_engine == "pandas":
 
-        df = extract_pandas(configuration.FILE_NAME)
-        logger.debug(df.shape)
-        logger.debug(df.columns)
+        if configuration.PARALLEL_BUCKETS > 1:
+            df = transform_parallel_pandas(file_name)
+        else:
+            df = extract_pandas(file_name)
+            logger.debug(df.shape)
+            logger.debug(df.columns)
 
-        df = transform_pandas(df)
+            df = transform_pandas(df)
 
         print("Columns after transform:", df.columns.tolist())
         print("Preview of transformed data:")
         print(df.head(5))
 
-        load_pandas(df, engine)
+        if configuration.PROFILE_DATA:
+            check_profile(profile_pandas(df), "fhv_active_profile.json")
+
+        load_pandas(df, engine, summary_delta)
         
 
-    elif configuration.TRANSFORM_ENGINE == "duckdb":
+    elif transform_engine == "duckdb":
     
-        con, table_name = extract_duckdb(f"data/{configuration.FILE_NAME}")
+        # PROFILE_QUERIES records every statement of the run, from the extract to the load
+        with profile_queries(con or duckdb.connect(database=":memory:"), "fhv_duckdb_query_profile.json") as con:
+            con, table_name = extract_duckdb(f"data/{file_name}" if file_name else None, con=con)
+
+            con, table_name = transform_duckdb(con, table_name)
 
-        con, table_name = transform_duckdb(con, table_name)
+            df_preview = con.execute(f"SELECT * FROM {table_name} ORDER BY vehicle_license_number LIMIT 5").fetchdf()
+            print("Columns after transform:", df_preview.columns.tolist())
+            print("Preview of transformed data:")
+            print(df_preview)
 
-        df_preview = con.execute(f"SELECT * FROM {table_name} ORDER BY vehicle_license_number LIMIT 5").fetchdf()
-        print("Columns after transform:", df_preview.columns.tolist())
+            if configuration.PROFILE_DATA:
+                check_profile(profile_duckdb(con, table_name), "fhv_active_profile.json")
+
+            load_duckdb(con, table_name, engine, summary_delta)
+
+    elif transform_engine == "polars":
+
+        # Run the plan once; the preview, the profile and the load reuse the collected frame
+        df = transform_polars(extract_polars(file_name)).collect()
+
+        print("Columns after transform:", df.columns)
         print("Preview of transformed data:")
-        print(df_preview)
- 
-        load_duckdb(con, table_name, table_name)
+        print(df.head(5))
 
+        if configuration.PROFILE_DATA:
+            check_profile(profile_pandas(df.to_pandas()), "fhv_active_profile.json")
 
+        load_polars(df.lazy(), engine, summary_delta)
 
 
-    
+def run_socrata(file_name: str, engine):
+    """Refresh data/<file_name> from the Socrata API and run the ETL on it when anything changed."""
+    logger = get_logger(log_level=configuration.LOG_LEVEL)
+
+    previous = read_watermark(file_name) if configuration.SOCRATA_INCREMENTAL else None
+    watermark, changed_keys = fetch_socrata(file_name)
+    if watermark is None:
+        logger.info("Nothing to load")
+        return
+
+    run_pipeline(file_name, engine, summary_delta=SummaryDelta(watermark, previous, changed_keys))
+    save_watermark(file_name, watermark)
+
+
+def run_daemon(engine):
+    """
+    Keep the interpreter, the connection pool and an attached DuckDB connection warm,
+    and run the ETL for every file that lands in data/.
+    """
+    con = None
+    if configuration.TRANSFORM_ENGINE in ("duckdb", "auto"):
+        con = duckdb.connect(database=":memory:")
+        attach_postgres_duckdb(con)
+
+    watch_directory(
+        "data",
+        configuration.DAEMON_FILE_PATTERN,
+        lambda file_name: run_pipeline(file_name, engine, con),
+        configuration.DAEMON_POLL_SECONDS,
+        process_existing=configuration.DAEMON_PROCESS_EXISTING
+    )
+
+
+def main():
+    logger = get_logger(log_level=configuration.LOG_LEVEL)
+    engine = get_connection()
+    logger.info("Starting")
+
+    if configuration.RUN_MODE == "daemon":
+        run_daemon(engine)
+    elif configuration.RUN_MODE == "coordinator":
+        run_coordinator(engine, configuration.JOB_INPUT_PATTERN or configuration.FILE_NAME)
+    elif configuration.RUN_MODE == "worker":
+        run_worker(engine)
+    elif configuration.EXTRACT_SOURCE == "socrata":
+        run_socrata(configuration.FILE_NAME or SOCRATA_FILE_NAME, engine)
+    elif configuration.EXTRACT_SOURCE == "postgres":
+        run_pipeline(None, engine)
+    else:
+        run_pipeline(configuration.FILE_NAME, engine)
+
 
 
 if __name__ == "__main__":
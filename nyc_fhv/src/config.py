@@ -31,9 +31,89 @@ class Config(object):
     LOG_LEVEL = int(os.environ.get("LOG_LEVEL", 20))
     FILE_NAME = os.getenv("FILE_NAME")
 
+    # "batch" processes FILE_NAME once, "daemon" keeps running and processes new files in data/,
+    # "coordinator" shards the files matching JOB_INPUT_PATTERN into a Postgres job table and
+    # loads the result once "worker" processes (on any host sharing data/) have processed them
+    RUN_MODE = os.getenv("RUN_MODE")
+    if RUN_MODE not in ("batch", "daemon", "coordinator", "worker"):
+        RUN_MODE = "batch"
+    DAEMON_FILE_PATTERN = os.getenv("DAEMON_FILE_PATTERN", "*.csv")
+    DAEMON_POLL_SECONDS = float(os.getenv("DAEMON_POLL_SECONDS", 0.5))
+    DAEMON_PROCESS_EXISTING = os.getenv("DAEMON_PROCESS_EXISTING", "false").lower() == "true"
+    JOB_INPUT_PATTERN = os.getenv("JOB_INPUT_PATTERN")
+    # Split uncompressed CSVs into byte ranges of this size (0 = one shard per file)
+    JOB_SHARD_MB = float(os.getenv("JOB_SHARD_MB", 0))
+    JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", 3))
+    JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", 1))
+    JOB_IDLE_SECONDS = float(os.getenv("JOB_IDLE_SECONDS", 30))
+
+    # "file" reads data/FILE_NAME as is, "socrata" first refreshes it from the NYC Open Data API,
+    # "postgres" streams POSTGRES_SOURCE (a table name or a SELECT) from the database instead (batch mode)
+    EXTRACT_SOURCE = os.getenv("EXTRACT_SOURCE")
+    if EXTRACT_SOURCE not in ("file", "socrata", "postgres"):
+        EXTRACT_SOURCE = "file"
+    POSTGRES_SOURCE = os.getenv("POSTGRES_SOURCE")
+    POSTGRES_BATCH_ROWS = int(os.getenv("POSTGRES_BATCH_ROWS", 50_000))
+    SOCRATA_URL = os.getenv("SOCRATA_URL", "https://data.cityofnewyork.us/resource/8wbx-tsch.json")
+    SOCRATA_APP_TOKEN = os.getenv("SOCRATA_APP_TOKEN")
+    SOCRATA_PAGE_SIZE = int(os.getenv("SOCRATA_PAGE_SIZE", 50_000))
+    SOCRATA_CONCURRENCY = int(os.getenv("SOCRATA_CONCURRENCY", 4))
+    SOCRATA_INCREMENTAL = os.getenv("SOCRATA_INCREMENTAL", "true").lower() == "true"
+    SOCRATA_TIMEOUT_SECONDS = float(os.getenv("SOCRATA_TIMEOUT_SECONDS", 60))
+    SOCRATA_RETRIES = int(os.getenv("SOCRATA_RETRIES", 3))
+    # Save every API response here, to be replayed with `python -m src.utils.socrata <dir>`
+    SOCRATA_RECORD_DIR = os.getenv("SOCRATA_RECORD_DIR")
+
+    # "direct" replaces the live table in place, "bulk" loads an UNLOGGED staging table
+    # (synchronous_commit off, indexes built afterwards) and swaps it in with one rename
+    LOAD_PROFILE = os.getenv("LOAD_PROFILE")
+    if LOAD_PROFILE not in ("direct", "bulk"):
+        LOAD_PROFILE = "direct"
+    BULK_MAINTENANCE_WORK_MEM = os.getenv("BULK_MAINTENANCE_WORK_MEM", "1GB")
+
+    # Load through a staging table in batches of LOAD_BATCH_ROWS, each committed with a
+    # watermark in etl_load_state, so a retried load skips the batches already committed
+    LOAD_CHECKPOINTS = os.getenv("LOAD_CHECKPOINTS", "false").lower() == "true"
+    LOAD_BATCH_ROWS = int(os.getenv("LOAD_BATCH_ROWS", 100_000))
+
+    # "stored" loads days_until_expiration as a column, "view" loads only expiration_date
+    # and publishes days_until_expiration through a view computed at read time
+    DAYS_UNTIL_EXPIRATION = os.getenv("DAYS_UNTIL_EXPIRATION")
+    if DAYS_UNTIL_EXPIRATION not in ("stored", "view"):
+        DAYS_UNTIL_EXPIRATION = "stored"
+
+    # Comma-separated references from data/reference/ to join onto the cleaned rows (e.g. "bases,vins")
+    ENRICH_REFERENCES = os.getenv("ENRICH_REFERENCES", "")
+
+    # Maintain <table>_summary counts by license type, wheelchair access and expiration date,
+    # updated from the changed keys alone on incremental Socrata runs
+    SUMMARY_TABLES = os.getenv("SUMMARY_TABLES", "false").lower() == "true"
+
+    # "auto" picks pandas, polars or duckdb per input file from its size and the free memory/cores
     TRANSFORM_ENGINE = os.getenv("TRANSFORM_ENGINE")
-    if TRANSFORM_ENGINE not in ("pandas", "duckdb"):
-        TRANSFORM_ENGINE = "pandas"
+    if TRANSFORM_ENGINE not in ("pandas", "duckdb", "polars", "auto"):
+        TRANSFORM_ENGINE = "auto"
+    AUTO_ENGINE_MEMORY_FRACTION = float(os.getenv("AUTO_ENGINE_MEMORY_FRACTION", 0.6))
+    AUTO_ENGINE_PANDAS_MAX_MB = float(os.getenv("AUTO_ENGINE_PANDAS_MAX_MB", 256))
+
+    # Run the pandas transform over this many key-hash buckets in a process pool (0 = single process),
+    # with PARALLEL_WORKERS processes (0 = one per core); larger inputs are spilled to disk while partitioning
+    PARALLEL_BUCKETS = int(os.getenv("PARALLEL_BUCKETS", 0))
+    PARALLEL_WORKERS = int(os.getenv("PARALLEL_WORKERS", 0))
+    PARALLEL_SPILL_MB = float(os.getenv("PARALLEL_SPILL_MB", 256))
+
+    # Reorder projections/filters ahead of costly steps when provably safe
+    OPTIMIZE_STEPS = os.getenv("OPTIMIZE_STEPS", "true").lower() == "true"
+
+    # Development sampling: percentage of duplicate-key groups to keep (0 = full run)
+    SAMPLE_PERCENT = float(os.getenv("SAMPLE_PERCENT", 0))
+    SAMPLE_TABLE_SUFFIX = os.getenv("SAMPLE_TABLE_SUFFIX", "_sample")
+
+    # Profile the final result and fail the run when a data-quality threshold is breached
+    PROFILE_DATA = os.getenv("PROFILE_DATA", "false").lower() == "true"
+
+    # Record DuckDB's JSON profile of every statement the DuckDB transform steps run
+    PROFILE_QUERIES = os.getenv("PROFILE_QUERIES", "false").lower() == "true"
 
 
 @lru_cache
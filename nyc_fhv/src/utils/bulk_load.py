@@ -0,0 +1,117 @@
+import pandas as pd
+from sqlalchemy import text
+
+from src.config import configuration
+from .db import attach_postgres_duckdb
+from .logger import get_logger
+
+# Bulk-load profile (LOAD_PROFILE=bulk).
+# Rows are written into an UNLOGGED staging table by sessions running with
+# synchronous_commit=off, so the copy neither writes WAL nor waits for fsync.
+# Indexes are built after the data is in, with a larger maintenance_work_mem,
+# the table is made LOGGED (durable) and finally renamed over the live table in
+# one short transaction. Readers keep seeing the previous table until that commit.
+
+BULK_ALIAS = "postgres_bulk"
+
+
+def bulk_session_settings() -> dict:
+    return {
+        "synchronous_commit": "off",
+        "maintenance_work_mem": configuration.BULK_MAINTENANCE_WORK_MEM,
+    }
+
+
+def staging_table_name(target: str) -> str:
+    return f"{target}_staging"
+
+
+def _set_local(conn):
+    """Apply the bulk-load settings to the current transaction only."""
+
+    for name, value in bulk_session_settings().items():
+        conn.execute(text(f"SET LOCAL {name} = '{value}'"))
+
+
+def create_indexes(conn, table: str, indexes: list):
+    """Create `<table>_idx<i>` on each column list in `indexes`, skipping existing ones."""
+
+    for i, columns in enumerate(indexes):
+        column_list = ", ".join(f'"{col}"' for col in columns)
+        conn.execute(text(f'CREATE INDEX IF NOT EXISTS "{table}_idx{i}" ON "{table}" ({column_list})'))
+
+
+def publish_staging(engine, staging: str, target: str, indexes: list = (), before_swap=None, after_swap=None):
+    """
+    Index the staging table, make it LOGGED and swap it in place of `target` atomically.
+    `indexes` is a list of column lists; index names follow the table through the swap.
+    `before_swap` / `after_swap` are called with the connection inside the swap transaction,
+    e.g. to drop and recreate views that depend on `target`.
+    """
+
+    logger = get_logger(log_level=configuration.LOG_LEVEL)
+
+    with engine.begin() as conn:
+        _set_local(conn)
+        create_indexes(conn, staging, indexes)
+        conn.execute(text(f'ALTER TABLE "{staging}" SET LOGGED'))
+
+    with engine.begin() as conn:
+        if before_swap:
+            before_swap(conn)
+        conn.execute(text(f'DROP TABLE IF EXISTS "{target}_old"'))
+        conn.execute(text(f'ALTER TABLE IF EXISTS "{target}" RENAME TO "{target}_old"'))
+        conn.execute(text(f'ALTER TABLE "{staging}" RENAME TO "{target}"'))
+        conn.execute(text(f'DROP TABLE IF EXISTS "{target}_old"'))
+        for i in range(len(indexes)):
+            conn.execute(text(f'ALTER INDEX "{staging}_idx{i}" RENAME TO "{target}_idx{i}"'))
+        if after_swap:
+            after_swap(conn)
+
+    logger.info(f"Swapped {staging} in as {target}")
+
+
+#PANDAS --------------------------------------------------------------------------------------
+
+def bulk_load_pandas(df: pd.DataFrame, engine, target: str, indexes: list = (), **swap_hooks):
+    """Load a DataFrame through an UNLOGGED staging table and swap it in as `target`."""
+
+    staging = staging_table_name(target)
+
+    with engine.begin() as conn:
+        _set_local(conn)
+        conn.execute(text(f'DROP TABLE IF EXISTS "{staging}"'))
+        df.head(0).to_sql(staging, conn, index=False)
+        conn.execute(text(f'ALTER TABLE "{staging}" SET UNLOGGED'))
+        df.to_sql(staging, conn, if_exists="append", index=False)
+
+    publish_staging(engine, staging, target, indexes, **swap_hooks)
+
+
+#DUCKDB --------------------------------------------------------------------------------------
+
+def bulk_load_duckdb(con, table_name: str, engine, target: str, indexes: list = (), **swap_hooks):
+    """
+    Copy a DuckDB table through an UNLOGGED staging table and swap it in as `target`.
+    DuckDB writes the rows over its own Postgres sessions, attached with the bulk-load settings.
+    """
+
+    staging = staging_table_name(target)
+    attach_postgres_duckdb(con, BULK_ALIAS, bulk_session_settings())
+
+    with engine.begin() as conn:
+        conn.execute(text(f'DROP TABLE IF EXISTS "{staging}"'))
+
+    con.execute("CALL pg_clear_cache()")
+    con.execute(f"CREATE TABLE {BULK_ALIAS}.public.{staging} AS SELECT * FROM {table_name} LIMIT 0")
+
+    with engine.begin() as conn:
+        conn.execute(text(f'ALTER TABLE "{staging}" SET UNLOGGED'))
+
+    con.execute(f"INSERT INTO {BULK_ALIAS}.public.{staging} SELECT * FROM {table_name}")
+
+    publish_staging(engine, staging, target, indexes, **swap_hooks)
+
+    # The swap renamed tables behind DuckDB's back
+    con.execute("CALL pg_clear_cache()")
+
@@ -0,0 +1,243 @@
+import hashlib
+import time
+
+import pandas as pd
+from sqlalchemy import inspect, text
+
+from src.config import configuration
+from .bulk_load import publish_staging
+from .db import attach_postgres_duckdb
+from .logger import get_logger
+
+# Resumable checkpointed loads (LOAD_CHECKPOINTS=true).
+#
+# The rows are copied into <target>_checkpoint in numbered batches of LOAD_BATCH_ROWS.
+# Each batch commits together with the load's watermark in etl_load_state: the position
+# of the first row not loaded yet (its offset in the DataFrame, its rowid in DuckDB).
+# An interrupted load leaves its committed batches behind, and the next load of the same
+# rows into the same target, recognised by a fingerprint of their values and order,
+# carries on from the watermark. Once every batch is in, the staging table is swapped in
+# like the bulk-load profile and the state row is deleted in the swap transaction.
+# The staging table is logged: an UNLOGGED one is emptied by a server crash, which is one
+# of the interruptions this has to survive. Rows that differ from the interrupted load's
+# (e.g. days_until_expiration computed on another day) are loaded from the start.
+
+STATE_TABLE = "etl_load_state"
+
+
+def create_state_table(engine):
+    with engine.begin() as conn:
+        # IF NOT EXISTS alone still fails when loads start at the same time
+        conn.execute(text("SELECT pg_advisory_xact_lock(hashtext(:name))"), {"name": STATE_TABLE})
+        conn.execute(text(f"""
+            CREATE TABLE IF NOT EXISTS {STATE_TABLE} (
+                target TEXT PRIMARY KEY,
+                fingerprint TEXT NOT NULL,
+                total_rows BIGINT NOT NULL,
+                watermark BIGINT NOT NULL DEFAULT 0,
+                batches INTEGER NOT NULL DEFAULT 0,
+                rows BIGINT NOT NULL DEFAULT 0,
+                started_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+                updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+            )
+        """))
+
+
+def checkpoint_table_name(target: str) -> str:
+    return f"{target}_checkpoint"
+
+
+def resume_load(engine, target: str, fingerprint: str):
+    """
+    Return the state of an interrupted load of the same rows into `target`, or None to start over.
+    The staging table must still hold exactly the rows of the committed batches.
+    """
+
+    logger = get_logger(log_level=configuration.LOG_LEVEL)
+    staging = checkpoint_table_name(target)
+    create_state_table(engine)
+
+    with engine.connect() as conn:
+        state = conn.execute(
+            text(f"SELECT * FROM {STATE_TABLE} WHERE target = :target"), {"target": target}
+        ).mappings().first()
+        if state is None:
+            return None
+
+        if state["fingerprint"] != fingerprint:
+            logger.info(f"Discarding the interrupted load into {target}: the rows have changed")
+            return None
+
+        staged = conn.execute(text(f'SELECT COUNT(*) FROM "{staging}"')).scalar() if inspect(conn).has_table(staging) else None
+        if staged != state["rows"]:
+            logger.warning(f"Discarding the interrupted load into {target}: {staging} does not match its checkpoint")
+            return None
+
+    logger.info(
+        f"Resuming the load into {target} after batch {state['batches']} "
+        f"({state['rows']} of {state['total_rows']} rows already loaded)"
+    )
+
+    return dict(state)
+
+
+def reset_load(engine, target: str, fingerprint: str, total_rows: int, create_staging) -> dict:
+    """Drop any previous staging table, record a new load of `fingerprint` and create the staging table with `create_staging()`."""
+
+    with engine.begin() as conn:
+        conn.execute(text(f'DROP TABLE IF EXISTS "{checkpoint_table_name(target)}"'))
+        conn.execute(
+            text(f"""
+                INSERT INTO {STATE_TABLE} (target, fingerprint, total_rows)
+                VALUES (:target, :fingerprint, :total_rows)
+                ON CONFLICT (target) DO UPDATE
+                SET fingerprint = EXCLUDED.fingerprint, total_rows = EXCLUDED.total_rows,
+                    watermark = 0, batches = 0, rows = 0, started_at = now(), updated_at = now()
+            """),
+            {"target": target, "fingerprint": fingerprint, "total_rows": total_rows}
+        )
+
+    # Created once the DROP is committed, as DuckDB creates it over its own Postgres session
+    create_staging()
+
+    return {"watermark": 0, "batches": 0, "rows": 0}
+
+
+def publish_checkpoint(engine, target: str, indexes: list = (), before_swap=None, after_swap=None):
+    """Swap the completed staging table in as `target` and delete the load's state in the same transaction."""
+
+    def finish(conn):
+        if after_swap:
+            after_swap(conn)
+        conn.execute(text(f"DELETE FROM {STATE_TABLE} WHERE target = :target"), {"target": target})
+
+    publish_staging(engine, checkpoint_table_name(target), target, indexes, before_swap, finish)
+
+
+def _log_batches(target: str, state: dict, batches: int, started: float):
+    get_logger(log_level=configuration.LOG_LEVEL).info(
+        f"Loaded {batches} batches into {checkpoint_table_name(target)} in {time.perf_counter() - started:.3f}s "
+        f"({state['batches'] - batches} resumed)"
+    )
+
+
+#PANDAS --------------------------------------------------------------------------------------
+
+def fingerprint_pandas(df: pd.DataFrame) -> str:
+    """Hash of the columns, values and order of the rows of `df`."""
+
+    digest = hashlib.sha256("|".join(f"{col}:{dtype}" for col, dtype in df.dtypes.items()).encode())
+    digest.update(pd.util.hash_pandas_object(df, index=False).values.tobytes())
+
+    return digest.hexdigest()
+
+
+def checkpointed_load_pandas(df: pd.DataFrame, engine, target: str, indexes: list = (), **swap_hooks):
+    """Load a DataFrame through the checkpointed staging table, from where an interrupted load stopped, and swap it in as `target`."""
+
+    logger = get_logger(log_level=configuration.LOG_LEVEL)
+    staging = checkpoint_table_name(target)
+    fingerprint = fingerprint_pandas(df)
+    batch_rows = configuration.LOAD_BATCH_ROWS
+
+    state = resume_load(engine, target, fingerprint)
+    if state is None:
+        state = reset_load(
+            engine, target, fingerprint, len(df),
+            lambda: df.head(0).to_sql(staging, engine, index=False)
+        )
+
+    started = time.perf_counter()
+    batches = 0
+    for start in range(state["watermark"], len(df), batch_rows):
+        batch = df.iloc[start:start + batch_rows]
+        with engine.begin() as conn:
+            batch.to_sql(staging, conn, if_exists="append", index=False)
+            conn.execute(
+                text(f"""
+                    UPDATE {STATE_TABLE}
+                    SET watermark = :watermark, batches = batches + 1, rows = rows + :rows, updated_at = now()
+                    WHERE target = :target
+                """),
+                {"target": target, "watermark": start + len(batch), "rows": len(batch)}
+            )
+        batches += 1
+        state["batches"] += 1
+        logger.debug(f"{target}: batch {state['batches']} committed, watermark {start + len(batch)}")
+
+    _log_batches(target, state, batches, started)
+    publish_checkpoint(engine, target, indexes, **swap_hooks)
+
+
+#DUCKDB --------------------------------------------------------------------------------------
+
+def fingerprint_duckdb(con, table_name: str):
+    """Row count and hash of the columns, values and order of the rows of DuckDB table `table_name`."""
+
+    columns = con.execute(f"SELECT column_name, column_type FROM (DESCRIBE {table_name})").fetchall()
+    rows, rows_hash = con.execute(f"SELECT COUNT(*), bit_xor(hash(rowid, t)) FROM {table_name} AS t").fetchone()
+
+    digest = hashlib.sha256("|".join(f"{col}:{dtype}" for col, dtype in columns).encode())
+    digest.update(str(rows_hash).encode())
+
+    return rows, digest.hexdigest()
+
+
+def checkpointed_load_duckdb(con, table_name: str, engine, target: str, indexes: list = (), **swap_hooks):
+    """
+    Copy a DuckDB table through the checkpointed staging table, from where an interrupted load stopped,
+    and swap it in as `target`. Each batch and its watermark are written in one DuckDB transaction,
+    which is a single transaction on the attached database.
+    """
+
+    logger = get_logger(log_level=configuration.LOG_LEVEL)
+    staging = checkpoint_table_name(target)
+    alias = attach_postgres_duckdb(con)
+    rows, fingerprint = fingerprint_duckdb(con, table_name)
+
+    def create_staging():
+        con.execute("CALL pg_clear_cache()")
+        con.execute(f"CREATE TABLE {alias}.public.{staging} AS SELECT * FROM {table_name} LIMIT 0")
+
+    state = resume_load(engine, target, fingerprint)
+    if state is None:
+        state = reset_load(engine, target, fingerprint, rows, create_staging)
+    con.execute("CALL pg_clear_cache()")
+
+    started = time.perf_counter()
+    batches = 0
+    watermark = state["watermark"]
+    while True:
+        end, batch_rows = con.execute(f"""
+            SELECT MAX(rowid) + 1, COUNT(*)
+            FROM (SELECT rowid FROM {table_name} WHERE rowid >= {watermark} ORDER BY rowid LIMIT {configuration.LOAD_BATCH_ROWS})
+        """).fetchone()
+        if not batch_rows:
+            break
+
+        con.execute("BEGIN")
+        try:
+            con.execute(f"INSERT INTO {alias}.public.{staging} SELECT * FROM {table_name} WHERE rowid >= {watermark} AND rowid < {end}")
+            con.execute(
+                f"""
+                    UPDATE {alias}.public.{STATE_TABLE}
+                    SET watermark = ?, batches = batches + 1, rows = rows + ?, updated_at = now()
+                    WHERE target = ?
+                """,
+                [end, batch_rows, target]
+            )
+            con.execute("COMMIT")
+        except Exception:
+            con.execute("ROLLBACK")
+            raise
+
+        watermark = end
+        batches += 1
+        state["batches"] += 1
+        logger.debug(f"{target}: batch {state['batches']} committed, watermark {watermark}")
+
+    _log_batches(target, state, batches, started)
+    publish_checkpoint(engine, target, indexes, **swap_hooks)
+
+    # The swap renamed tables behind DuckDB's back
+    con.execute("CALL pg_clear_cache()")
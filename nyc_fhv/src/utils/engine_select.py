@@ -0,0 +1,188 @@
+import bz2
+import gzip
+import io
+import lzma
+import os
+
+import pandas as pd
+import polars as pl
+
+from src.config import configuration
+from .logger import get_logger
+
+# Automatic engine selection (TRANSFORM_ENGINE=auto).
+# The input is sized from its bytes on disk, the compression ratio measured on a
+# sample and the average text width of the sampled rows. Parsing the same sample
+# with pandas and Polars gives the in-memory bytes per row of each engine.
+# Engines are tried from cheapest to most robust:
+#   pandas - whole file in memory, single core
+#   polars - columnar in memory, multi-core
+#   duckdb - spills to disk past its memory limit, so it always fits
+# Polars and DuckDB only read plain and gzip-compressed CSVs; other compressed
+# inputs always go to pandas.
+
+COMPRESSION_OPENERS = {".gz": gzip.open, ".bz2": bz2.open, ".xz": lzma.open}
+
+# Compressions the Polars and DuckDB readers decompress themselves
+NATIVE_COMPRESSIONS = {".gz"}
+
+ENGINE_SAMPLE_ROWS = 10_000
+
+# Peak memory of a run as a multiple of the parsed input (copies made by the transform steps)
+ENGINE_PEAK_FACTORS = {"pandas": 3.0, "polars": 2.0}
+
+
+def _read_sample(file_path: str):
+    """
+    Return (header + first rows as bytes, decompressed/compressed ratio, reached end of file).
+    """
+
+    opener = COMPRESSION_OPENERS.get(os.path.splitext(file_path)[1].lower())
+
+    with open(file_path, "rb") as raw:
+        stream = opener(raw) if opener else raw
+        lines = []
+        for line in stream:
+            lines.append(line)
+            if len(lines) > ENGINE_SAMPLE_ROWS:
+                break
+        at_end = len(lines) <= ENGINE_SAMPLE_ROWS
+        compressed_read = raw.tell()
+
+    sample = b"".join(lines)
+    ratio = len(sample) / compressed_read if opener and compressed_read else 1.0
+
+    return sample, ratio, at_end
+
+
+def inspect_input(file_path: str) -> dict:
+    """Estimate the rows and the pandas/Polars in-memory size of a CSV from a sample."""
+
+    file_bytes = os.path.getsize(file_path)
+    sample, ratio, at_end = _read_sample(file_path)
+
+    header_bytes = len(sample.split(b"\n", 1)[0]) + 1
+    sampled_rows = max(len(sample.splitlines()) - 1, 1)
+    row_width = max(len(sample) - header_bytes, 1) / sampled_rows
+
+    text_bytes = file_bytes * ratio
+    rows = sampled_rows if at_end else int(text_bytes / row_width)
+    if configuration.SAMPLE_PERCENT:
+        rows = int(rows * configuration.SAMPLE_PERCENT / 100)
+
+    pandas_row = pd.read_csv(io.BytesIO(sample), low_memory=False).memory_usage(deep=True).sum() / sampled_rows
+    polars_row = pl.read_csv(io.BytesIO(sample), infer_schema_length=None).estimated_size() / sampled_rows
+
+    return {
+        "file_bytes": file_bytes,
+        "compressed": ratio != 1.0,
+        "compression_ratio": ratio,
+        "text_bytes": int(text_bytes),
+        "row_width": row_width,
+        "rows": rows,
+        "pandas_bytes": int(rows * pandas_row),
+        "polars_bytes": int(rows * polars_row),
+    }
+
+
+def _read_int(path: str):
+    """Read a single integer from a sysfs/procfs file, or None when unavailable/unlimited."""
+
+    try:
+        with open(path) as f:
+            value = f.read().strip()
+        return int(value) if value.isdigit() else None
+    except OSError:
+        return None
+
+
+def available_memory():
+    """
+    Bytes of memory this process can still use: MemAvailable, capped by a cgroup limit
+    when running in a container. None when it cannot be determined.
+    """
+
+    available = None
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    available = int(line.split()[1]) * 1024
+                    break
+    except OSError:
+        try:
+            available = os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+        except (ValueError, OSError, AttributeError):
+            pass
+
+    limit = _read_int("/sys/fs/cgroup/memory.max")
+    usage = _read_int("/sys/fs/cgroup/memory.current")
+    if limit is not None and usage is not None:
+        available = min(available, limit - usage) if available is not None else limit - usage
+
+    return available
+
+
+def available_cores() -> int:
+    """Cores this process may run on."""
+
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def choose_engine(file_path: str):
+    """
+    Pick the cheapest engine whose estimated peak memory fits the memory budget.
+    Returns the engine name and a readable reason.
+    """
+
+    extension = os.path.splitext(file_path)[1].lower()
+    if extension in COMPRESSION_OPENERS and extension not in NATIVE_COMPRESSIONS:
+        return "pandas", f"only pandas reads {extension} input"
+
+    source = inspect_input(file_path)
+    memory = available_memory()
+    cores = available_cores()
+
+    if memory is None:
+        return "duckdb", "available memory unknown"
+
+    budget = memory * configuration.AUTO_ENGINE_MEMORY_FRACTION
+    pandas_peak = source["pandas_bytes"] * ENGINE_PEAK_FACTORS["pandas"]
+    # A compressed file is decompressed into memory before Polars parses it
+    polars_peak = source["polars_bytes"] * ENGINE_PEAK_FACTORS["polars"]
+    if source["compressed"]:
+        polars_peak += source["text_bytes"]
+
+    sizes = (
+        f"~{source['rows']:,} rows, {source['text_bytes'] / 2**20:,.0f} MiB of text "
+        f"({source['file_bytes'] / 2**20:,.0f} MiB on disk), budget {budget / 2**20:,.0f} MiB, {cores} cores"
+    )
+
+    small = source["text_bytes"] <= configuration.AUTO_ENGINE_PANDAS_MAX_MB * 2**20
+    if pandas_peak <= budget and (small or cores == 1):
+        return "pandas", f"pandas peak ~{pandas_peak / 2**20:,.0f} MiB fits; {sizes}"
+
+    if polars_peak <= budget:
+        return "polars", f"polars peak ~{polars_peak / 2**20:,.0f} MiB fits; {sizes}"
+
+    return "duckdb", f"in-memory engines exceed the budget (polars peak ~{polars_peak / 2**20:,.0f} MiB); {sizes}"
+
+
+def resolve_engine(file_name: str) -> str:
+    """
+    Return the configured TRANSFORM_ENGINE, choosing one for `file_name` when it is `auto`.
+    A file name of None stands for the Postgres source.
+    """
+
+    if configuration.TRANSFORM_ENGINE != "auto":
+        return configuration.TRANSFORM_ENGINE
+
+    if file_name is None:
+        transform_engine, reason = "duckdb", "a Postgres source cannot be sized up front"
+    else:
+        transform_engine, reason = choose_engine(f"data/{file_name}")
+    get_logger(log_level=configuration.LOG_LEVEL).info(f"TRANSFORM_ENGINE=auto chose {transform_engine}: {reason}")
+
+    return transform_engine
@@ -0,0 +1,178 @@
+import os
+
+import pandas as pd
+import polars as pl
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from src.config import configuration
+from .logger import get_logger
+from .sampling import normalize_key_pandas
+
+# Enrichment of the cleaned rows with local reference tables (ENRICH_REFERENCES).
+#
+# Each reference is a CSV in data/reference/ holding a join key plus the columns to
+# add. It is read once and kept as one row per key, both on disk as Parquet in
+# data/reference/.cache/ and in memory for the rest of the process. The cache
+# records the CSV's size and mtime and is rebuilt as soon as the CSV changes.
+# References are small next to the FHV table, so they are broadcast: the pandas
+# engine probes a unique key index and DuckDB and Polars hash-join against them.
+
+REFERENCE_DIR = "data/reference"
+REFERENCE_CACHE_DIR = f"{REFERENCE_DIR}/.cache"
+
+# Join key of each known reference, data/reference/<name>.csv
+REFERENCE_KEYS = {
+    "bases": "base_number",
+    "vins": "vehicle_vin_number",
+}
+
+# name -> (fingerprint, Arrow table, DataFrame indexed by the key)
+_REFERENCES = {}
+
+
+def enabled_references() -> list:
+    names = [name.strip() for name in configuration.ENRICH_REFERENCES.split(",") if name.strip()]
+
+    unknown = [name for name in names if name not in REFERENCE_KEYS]
+    if unknown:
+        raise ValueError(f"Unknown references {unknown}, expected some of {sorted(REFERENCE_KEYS)}")
+
+    return names
+
+
+def enrichment_join_keys() -> frozenset:
+    """Columns the cleaned rows must keep for the enabled references to join on."""
+
+    return frozenset(REFERENCE_KEYS[name] for name in enabled_references())
+
+
+def file_fingerprint(path: str) -> str:
+    """Size and modification time of `path`, which change whenever the file is rewritten."""
+
+    stat = os.stat(path)
+    return f"{stat.st_size}-{stat.st_mtime_ns}"
+
+
+def _build_reference(name: str, path: str) -> pa.Table:
+    """Read a reference CSV into one row per (trimmed) key."""
+
+    logger = get_logger(log_level=configuration.LOG_LEVEL)
+    key = REFERENCE_KEYS[name]
+
+    df = pd.read_csv(path, dtype={key: str})
+    df[key] = df[key].str.strip()
+    df = df.dropna(subset=[key])
+
+    duplicates = df[key].duplicated()
+    if duplicates.any():
+        logger.warning(f"Reference {name}: {duplicates.sum()} duplicate {key} values, keeping the first")
+        df = df[~duplicates]
+
+    return pa.Table.from_pandas(df, preserve_index=False)
+
+
+def load_reference(name: str):
+    """
+    Return the (Arrow table, key-indexed DataFrame) of a reference,
+    from memory or the Parquet cache when the CSV has not changed since.
+    """
+
+    path = f"{REFERENCE_DIR}/{name}.csv"
+    fingerprint = file_fingerprint(path)
+
+    cached = _REFERENCES.get(name)
+    if cached and cached[0] == fingerprint:
+        return cached[1], cached[2]
+
+    cache_path = f"{REFERENCE_CACHE_DIR}/{name}.parquet"
+    metadata = pq.read_schema(cache_path).metadata if os.path.exists(cache_path) else None
+
+    if metadata and metadata.get(b"fingerprint") == fingerprint.encode():
+        table = pq.read_table(cache_path)
+    else:
+        table = _build_reference(name, path)
+        table = table.replace_schema_metadata({"fingerprint": fingerprint, "source": path})
+        os.makedirs(REFERENCE_CACHE_DIR, exist_ok=True)
+        pq.write_table(table, f"{cache_path}.tmp")
+        os.replace(f"{cache_path}.tmp", cache_path)
+        get_logger(log_level=configuration.LOG_LEVEL).info(f"Reference {name}: cached {table.num_rows} rows")
+
+    index = table.to_pandas().set_index(REFERENCE_KEYS[name])
+    _REFERENCES[name] = (fingerprint, table, index)
+
+    return table, index
+
+
+def reference_columns() -> frozenset:
+    """Columns the enabled references add."""
+
+    columns = set()
+    for name in enabled_references():
+        columns.update(c for c in load_reference(name)[0].column_names if c != REFERENCE_KEYS[name])
+
+    return frozenset(columns)
+
+
+#PANDAS --------------------------------------------------------------------------------------
+
+def enrich_pandas(df: pd.DataFrame) -> pd.DataFrame:
+    """Left-join the enabled references by probing their key indexes."""
+
+    for name in enabled_references():
+        _, index = load_reference(name)
+        columns = [col for col in index.columns if col not in df.columns]
+
+        keys = df[REFERENCE_KEYS[name]]
+        if not pd.api.types.is_string_dtype(keys):
+            keys = normalize_key_pandas(keys)
+
+        matched = index.reindex(keys.to_numpy(), columns=columns)
+        for col in columns:
+            df[col] = matched[col].to_numpy()
+
+    return df
+
+
+#DUCKDB --------------------------------------------------------------------------------------
+
+def enrich_duckdb(con, table_name: str):
+    """Left-join the enabled references, registered as Arrow tables."""
+
+    for name in enabled_references():
+        key = REFERENCE_KEYS[name]
+        table, _ = load_reference(name)
+        con.register(f"reference_{name}", table)
+
+        existing = set(con.execute(f"DESCRIBE {table_name}").fetchdf()["column_name"])
+        select = "".join(f', r."{col}"' for col in table.column_names if col != key and col not in existing)
+
+        con.execute(f"""
+            CREATE OR REPLACE TABLE {table_name} AS
+            SELECT t.*{select}
+            FROM {table_name} t
+            LEFT JOIN reference_{name} r ON CAST(t."{key}" AS VARCHAR) = r."{key}"
+        """)
+
+    return table_name
+
+
+#POLARS --------------------------------------------------------------------------------------
+
+def enrich_polars(lf: pl.LazyFrame) -> pl.LazyFrame:
+    """Left-join the enabled references into the lazy plan."""
+
+    for name in enabled_references():
+        key = REFERENCE_KEYS[name]
+        table, _ = load_reference(name)
+
+        existing = set(lf.collect_schema().names())
+        columns = [col for col in table.column_names if col != key and col not in existing]
+        reference = pl.from_arrow(table).lazy().select(pl.col(key).alias("_reference_key"), *columns)
+
+        lf = lf.join(
+            reference, left_on=pl.col(key).cast(pl.String), right_on="_reference_key",
+            how="left", maintain_order="left"
+        ).drop("_reference_key", strict=False)
+
+    return lf
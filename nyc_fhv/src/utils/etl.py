@@ -1,6 +1,21 @@
+import os
+from functools import partial
+
 import duckdb
 import pandas as pd
+import polars as pl
 from src.config import configuration
+from .db import get_connection, attach_postgres_duckdb
+from .bulk_load import bulk_load_pandas, bulk_load_duckdb, create_indexes
+from .checkpoint import checkpointed_load_pandas, checkpointed_load_duckdb
+from .expiration import load_target, relation_kind, release_table_name, publish_expiration_view, expiration_view_enabled
+from .summaries import SummaryDelta, retract_summary, refresh_summary, retract_summary_duckdb, refresh_summary_duckdb
+from .enrichment import enrich_pandas, enrich_duckdb, enrich_polars, enrichment_join_keys, reference_columns
+from .logger import get_logger
+from .pipeline import ALL_COLUMNS, Step, optimize_steps, describe_plan
+from .sampling import sample_csv_pandas, sample_csv_duckdb, sample_csv_polars, read_csv_chunks_pandas
+from .partition import transform_partitioned_pandas
+from .pg_source import extract_postgres_pandas, extract_postgres_duckdb, extract_postgres_polars, read_postgres_chunks_pandas
 from .utils import (
     standardize_column_names_pandas,
     convert_expiration_date_pandas,
@@ -21,84 +36,298 @@ from .utils import (
     add_days_until_expiration_duckdb
 )
 
+from .utils import (
+    standardize_column_names_polars,
+    convert_expiration_date_polars,
+    trim_text_columns_polars,
+    drop_duplicates_polars,
+    select_required_columns_polars,
+    drop_missing_key_ids_polars,
+    add_days_until_expiration_polars
+)
+
 
 #EXTRACT FFUNCTIONS----------------------------------------------------------------------
+# A file name of None reads POSTGRES_SOURCE from the database instead (EXTRACT_SOURCE=postgres)
 
 def extract_pandas(file_name: str) -> pd.DataFrame: # simple extract function
+    if file_name is None:
+        return extract_postgres_pandas(get_connection())
+
+    if configuration.SAMPLE_PERCENT:
+        get_logger(log_level=configuration.LOG_LEVEL).info(f"Sampling {configuration.SAMPLE_PERCENT}% of key groups")
+        return sample_csv_pandas(f"data/{file_name}", configuration.SAMPLE_PERCENT)
+
     return pd.read_csv(f"data/{file_name}", low_memory=False)
 
 
-def extract_duckdb(file_path: str, table_name: str = "fhv_data"):
+def extract_duckdb(file_path: str, table_name: str = "fhv_data", con=None):
     """
-    Extract CSV into DuckDB in-memory table.
+    Extract CSV into DuckDB in-memory table, reusing `con` when one is given.
     Returns: DuckDB connection and table name.
     """
-    con = duckdb.connect(database=":memory:")
-    con.execute(f"CREATE TABLE {table_name} AS SELECT * FROM read_csv_auto('{file_path}')")
+    if con is None:
+        con = duckdb.connect(database=":memory:")
+
+    if file_path is None:
+        return con, extract_postgres_duckdb(get_connection(), con, table_name)
+
+    if configuration.SAMPLE_PERCENT:
+        get_logger(log_level=configuration.LOG_LEVEL).info(f"Sampling {configuration.SAMPLE_PERCENT}% of key groups")
+        sample_csv_duckdb(con, file_path, table_name, configuration.SAMPLE_PERCENT)
+        return con, table_name
+
+    con.execute(f"CREATE OR REPLACE TABLE {table_name} AS SELECT * FROM read_csv_auto('{file_path}')")
     return con, table_name
 
 
+def extract_polars(file_name: str) -> pl.LazyFrame:
+    """
+    Lazily scan the CSV with Polars; nothing is read until the plan is collected or sunk.
+    A Postgres source is read in batches through pandas, as Polars cannot scan a stream.
+    """
+    if file_name is None:
+        return extract_postgres_polars(get_connection())
+
+    if configuration.SAMPLE_PERCENT:
+        get_logger(log_level=configuration.LOG_LEVEL).info(f"Sampling {configuration.SAMPLE_PERCENT}% of key groups")
+        return sample_csv_polars(f"data/{file_name}", configuration.SAMPLE_PERCENT)
+
+    return pl.scan_csv(f"data/{file_name}", infer_schema_length=None)
+
+
 #LOAD FUNCTIONS-----------------------------------------------------------------------------
 
-def load_pandas(df: pd.DataFrame, engine) -> pd.DataFrame: # simple load function
-    df.to_sql("fhv_active_cleaned", engine, if_exists="replace", index=False)
+def output_table_name(table_name: str) -> str:
+    """Sampled runs load into suffixed scratch tables instead of the real ones."""
+
+    if configuration.SAMPLE_PERCENT:
+        return f"{table_name}{configuration.SAMPLE_TABLE_SUFFIX}"
+
+    return table_name
+
+
+# Indexes built on the loaded tables by the bulk-load profile
+LOAD_INDEXES = [["vehicle_license_number", "dmv_license_plate_number"]]
+
+
+def load_hooks(table_name: str, target: str, summary_delta: SummaryDelta = None):
+    """
+    before_swap / after_swap hooks maintaining what sits on top of `target` in the load's transaction:
+    the expiration view and the summary, updated with `summary_delta` when it applies.
+    """
+
+    incremental = {}
+
+    def before_swap(conn):
+        release_table_name(conn, table_name)
+        if configuration.SUMMARY_TABLES:
+            incremental["summary"] = retract_summary(conn, table_name, target, summary_delta)
+
+    def after_swap(conn):
+        publish_expiration_view(conn, table_name)
+        if configuration.SUMMARY_TABLES:
+            refresh_summary(conn, table_name, target, summary_delta, incremental.get("summary", False))
+
+    return before_swap, after_swap
+
 
+def load_pandas(df: pd.DataFrame, engine, summary_delta: SummaryDelta = None) -> pd.DataFrame: # simple load function
+    table_name = output_table_name("fhv_active_cleaned")
+    target, indexes = load_target(table_name, LOAD_INDEXES)
+    before_swap, after_swap = load_hooks(table_name, target, summary_delta)
 
-def load_duckdb(con, table_name: str, engine):
+    if configuration.LOAD_CHECKPOINTS:
+        checkpointed_load_pandas(df, engine, target, indexes, before_swap=before_swap, after_swap=after_swap)
+    elif configuration.LOAD_PROFILE == "bulk":
+        bulk_load_pandas(df, engine, target, indexes, before_swap=before_swap, after_swap=after_swap)
+    else:
+        with engine.begin() as conn:
+            before_swap(conn)
+            df.to_sql(target, conn, if_exists="replace", index=False)
+            if expiration_view_enabled():
+                create_indexes(conn, target, indexes)
+            after_swap(conn)
+
+
+def load_duckdb(con, table_name: str, engine, summary_delta: SummaryDelta = None):
     """
     Load DuckDB table directly into PostgreSQL.
     """
-    db_url = (
-        f"postgres://{configuration.DB_USERNAME}:"
-        f"{configuration.DB_PASSWORD}@"
-        f"{configuration.DB_HOST}:"
-        f"{configuration.DB_PORT}/"
-        f"{configuration.DB_NAME}"
+    new_table_name = output_table_name("fhv_active_cleaned_duckdb")
+    target, indexes = load_target(new_table_name, LOAD_INDEXES)
+    before_swap, after_swap = load_hooks(new_table_name, target, summary_delta)
+
+    if configuration.LOAD_CHECKPOINTS:
+        checkpointed_load_duckdb(con, table_name, engine, target, indexes, before_swap=before_swap, after_swap=after_swap)
+    elif configuration.LOAD_PROFILE == "bulk" or expiration_view_enabled():
+        # The view over the stored table is only replaced atomically by the staging swap
+        bulk_load_duckdb(con, table_name, engine, target, indexes, before_swap=before_swap, after_swap=after_swap)
+    else:
+        with engine.connect() as conn:
+            leftover_view = relation_kind(conn, new_table_name) == "v"
+
+        attach_postgres_duckdb(con)
+        con.execute("CALL pg_clear_cache()")
+
+        # Insert data from DuckDB table into Postgres table, with the summary in the same transaction
+        con.execute("BEGIN")
+        try:
+            if leftover_view:
+                con.execute(f"""CALL postgres_execute('postgres_db', 'DROP VIEW "{new_table_name}"')""")
+            incremental = configuration.SUMMARY_TABLES and retract_summary_duckdb(con, engine, new_table_name, target, summary_delta)
+            con.execute(f"""
+                CREATE OR REPLACE TABLE postgres_db.public.{target} AS (
+                    SELECT * FROM {table_name}
+                );
+            """)
+            if configuration.SUMMARY_TABLES:
+                refresh_summary_duckdb(con, new_table_name, target, summary_delta, incremental)
+            con.execute("COMMIT")
+        except Exception:
+            con.execute("ROLLBACK")
+            raise
+
+
+def load_polars(lf: pl.LazyFrame, engine, summary_delta: SummaryDelta = None):
+    """
+    Collect the Polars plan and load it into PostgreSQL.
+    """
+    table_name = output_table_name("fhv_active_cleaned_polars")
+    target, indexes = load_target(table_name, LOAD_INDEXES)
+    before_swap, after_swap = load_hooks(table_name, target, summary_delta)
+    df = lf.collect()
+
+    if configuration.LOAD_CHECKPOINTS:
+        checkpointed_load_pandas(df.to_pandas(), engine, target, indexes, before_swap=before_swap, after_swap=after_swap)
+    elif configuration.LOAD_PROFILE == "bulk":
+        bulk_load_pandas(df.to_pandas(), engine, target, indexes, before_swap=before_swap, after_swap=after_swap)
+    else:
+        with engine.begin() as conn:
+            before_swap(conn)
+            df.write_database(target, connection=conn, if_table_exists="replace")
+            if expiration_view_enabled():
+                create_indexes(conn, target, indexes)
+            after_swap(conn)
+
+
+#PIPELINE-------------------------------------------------------------------------------------
+
+KEY_COLUMNS = frozenset({"vehicle_license_number", "dmv_license_plate_number"})
+
+REQUIRED_COLUMNS = frozenset({
+    "vehicle_license_number",
+    "license_type",
+    "dmv_license_plate_number",
+    "vehicle_vin_number",
+    "expiration_date",
+    "wheelchair_accessible",
+    "active"
+})
+
+EXPIRATION_DATE = frozenset({"expiration_date"})
+
+STEP_FUNCTIONS = {
+    func.__name__: func for func in (
+        standardize_column_names_pandas,
+        convert_expiration_date_pandas,
+        trim_text_columns_pandas,
+        drop_duplicates_pandas,
+        select_required_columns_pandas,
+        drop_missing_key_ids_pandas,
+        add_days_until_expiration_pandas,
+        standardize_column_names_duckdb,
+        convert_expiration_date_duckdb,
+        trim_text_columns_duckdb,
+        drop_duplicates_duckdb,
+        select_required_columns_duckdb,
+        drop_missing_key_ids_duckdb,
+        add_days_until_expiration_duckdb,
+        standardize_column_names_polars,
+        convert_expiration_date_polars,
+        trim_text_columns_polars,
+        drop_duplicates_polars,
+        select_required_columns_polars,
+        drop_missing_key_ids_polars,
+        add_days_until_expiration_polars,
+        enrich_pandas,
+        enrich_duckdb,
+        enrich_polars
     )
+}
+
+
+def build_steps(engine: str) -> list:
+    """
+    Describe the FHV transform as a list of steps, in the order the README lists them.
+    `engine` selects the pandas, DuckDB or Polars implementation of each step.
+    """
+
+    def step(name, kind, reads=ALL_COLUMNS, writes=frozenset(), **kwargs):
+        func = STEP_FUNCTIONS[f"{name}_{engine}"]
+        return Step(name, partial(func, **kwargs) if kwargs else func, kind, reads, writes)
+
+    join_keys = enrichment_join_keys()
+
+    steps = [
+        step("standardize_column_names", "barrier"),
+        step("convert_expiration_date", "map", EXPIRATION_DATE, EXPIRATION_DATE),
+        step("trim_text_columns", "map", ALL_COLUMNS, ALL_COLUMNS),
+        step("drop_duplicates", "dedup", KEY_COLUMNS),
+        step("select_required_columns", "project", REQUIRED_COLUMNS | join_keys, extra_columns=sorted(join_keys)),
+        step("drop_missing_key_ids", "filter", KEY_COLUMNS),
+        step("add_days_until_expiration", "map", EXPIRATION_DATE, frozenset({"days_until_expiration"})),
+    ]
+
+    # Reference columns are joined on once the rows are deduplicated and filtered
+    if join_keys:
+        steps.insert(-1, step("enrich", "map", join_keys, reference_columns()))
+
+    # The loaded view computes days_until_expiration at read time instead
+    if expiration_view_enabled():
+        steps = [s for s in steps if s.name != "add_days_until_expiration"]
+
+    return steps
 
-    # Enable DuckDB's Postgres extension
-    con.execute("INSTALL postgres;")
-    con.execute("LOAD postgres;")
 
-    # Attach the Postgres database
-    con.execute(f"ATTACH '{db_url}' AS postgres_db (TYPE POSTGRES);")
+def plan_steps(engine: str) -> list:
+    """Build the step list for `engine`, optimize it if enabled and log the plan."""
 
-    # Insert data from DuckDB table into Postgres table
-    new_table_name = "fhv_active_cleaned_duckdb"
-    con.execute(f"""
-        CREATE OR REPLACE TABLE postgres_db.public.{new_table_name} AS (
-            SELECT * FROM {table_name}
-        );
-    """)
+    logger = get_logger(log_level=configuration.LOG_LEVEL)
+
+    steps = build_steps(engine)
+    if configuration.OPTIMIZE_STEPS:
+        steps = optimize_steps(steps)
+
+    logger.info(f"{engine} transform plan:\n{describe_plan(steps)}")
+
+    return steps
 
 
 #PANDAS--------------------------------------------------------------------------------------
 
 def transform_pandas(df: pd.DataFrame) -> pd.DataFrame:
     """Transform and clean the FHV dataset using helper functions."""
-    
-    # 1. Standardizes column names
-    df = standardize_column_names_pandas(df)
 
-    # 2.Converts expiration_date to a DATE
-    df = convert_expiration_date_pandas(df)
+    for step in plan_steps("pandas"):
+        df = step.func(df)
 
-    # 3. Trims whitespace from all columns
-    df = trim_text_columns_pandas(df)
+    return df
 
-    # 4. Drops duplicates
-    df = drop_duplicates_pandas(df)
 
-    # 5. Keeps only required colums
-    df = select_required_columns_pandas(df)
+def transform_parallel_pandas(file_name: str) -> pd.DataFrame:
+    """
+    Extract and transform data/<file_name> over PARALLEL_BUCKETS key-hash buckets in a process pool.
+    Gives the same result as transform_pandas(extract_pandas(file_name)).
+    """
 
-    # 6. Drops rows with missing key identifiers
-    df = drop_missing_key_ids_pandas(df)
+    if file_name is None:
+        return transform_partitioned_pandas(read_postgres_chunks_pandas(get_connection()), plan_steps("pandas"), spill=True)
 
-    # 6. Adds a days_until_expiration cplumn
-    df = add_days_until_expiration_pandas(df)
+    file_path = f"data/{file_name}"
+    spill = os.path.getsize(file_path) > configuration.PARALLEL_SPILL_MB * 2**20
 
-    return df
+    return transform_partitioned_pandas(read_csv_chunks_pandas(file_path), plan_steps("pandas"), spill, text_keys=True)
 
 
 #-----------------------------------------------------------------------------------------
@@ -110,28 +339,24 @@ def transform_duckdb(con, table_name: str):
     Steps mirror the Pandas pipeline but operate in-memory in DuckDB.
     """
 
-    # 1. Standardizes column names
-    table_name = standardize_column_names_duckdb(con, table_name)
+    for step in plan_steps("duckdb"):
+        table_name = step.func(con, table_name)
 
-    # 2. Converts expiration_date column to DATE
-    table_name = convert_expiration_date_duckdb(con, table_name)
-
-    # 3. Trims whitespace from all string columns
-    table_name = trim_text_columns_duckdb(con, table_name)
-
-    # 4. Drops duplicates
-    table_name = drop_duplicates_duckdb(con, table_name)
-
-    # 5. Keeps only required columns
-    table_name = select_required_columns_duckdb(con, table_name)
+    return con, table_name
 
-    # 6. Drops rows with missing key identifiers
-    table_name = drop_missing_key_ids_duckdb(con, table_name)
+#------------------------------------------------------------------------------------------
+#POLARS------------------------------------------------------------------------------------
 
-    # 7. Adds days_until_expiration column
-    table_name = add_days_until_expiration_duckdb(con, table_name)
+def transform_polars(lf: pl.LazyFrame) -> pl.LazyFrame:
+    """
+    Build the FHV transform as one lazy Polars plan.
+    Steps mirror the Pandas pipeline; Polars' own optimizer adds projection and
+    predicate pushdown into the CSV scan when the plan is collected.
+    """
 
-    return con, table_name
+    for step in plan_steps("polars"):
+        lf = step.func(lf)
 
-#------------------------------------------------------------------------------------------    
+    return lf
 
+#------------------------------------------------------------------------------------------
@@ -0,0 +1,63 @@
+from sqlalchemy import text
+
+from src.config import configuration
+
+# Read-time days_until_expiration (DAYS_UNTIL_EXPIRATION=view).
+# The loaders write the cleaned rows, without days_until_expiration, to <table>_stored
+# and publish <table> as a view computing the column from expiration_date and
+# CURRENT_DATE on every read, so an unchanged snapshot never needs reloading.
+# <table>_stored is indexed on expiration_date: filter on expiration_date
+# (e.g. `expiration_date < CURRENT_DATE + 30`) rather than on the computed
+# days_until_expiration to keep range queries on the index.
+
+
+def expiration_view_enabled() -> bool:
+    return configuration.DAYS_UNTIL_EXPIRATION == "view"
+
+
+def stored_table_name(table_name: str) -> str:
+    return f"{table_name}_stored"
+
+
+def load_target(table_name: str, indexes: list):
+    """Return the table the loaders should write and the indexes to build on it."""
+
+    if expiration_view_enabled():
+        return stored_table_name(table_name), indexes + [["expiration_date"]]
+
+    return table_name, indexes
+
+
+def relation_kind(conn, name: str):
+    """Return the pg_class relkind of `name` in the search path ('r' table, 'v' view...), or None."""
+
+    return conn.execute(
+        text("SELECT relkind FROM pg_class WHERE oid = to_regclass(:name)"), {"name": f'"{name}"'}
+    ).scalar()
+
+
+def release_table_name(conn, table_name: str):
+    """
+    Drop whatever occupies `table_name` in the other mode, so the current mode can write it:
+    the view in view mode (it is recreated after the load), a stored table in stored mode.
+    """
+
+    kind = relation_kind(conn, table_name)
+
+    if expiration_view_enabled() and kind in ("r", "p"):
+        conn.execute(text(f'DROP TABLE "{table_name}"'))
+    elif kind == "v":
+        conn.execute(text(f'DROP VIEW "{table_name}"'))
+
+
+def publish_expiration_view(conn, table_name: str):
+    """Create the `table_name` view over its stored table (view mode only)."""
+
+    if not expiration_view_enabled():
+        return
+
+    conn.execute(text(f"""
+        CREATE VIEW "{table_name}" AS
+        SELECT *, CAST(expiration_date AS DATE) - CURRENT_DATE AS days_until_expiration
+        FROM "{stored_table_name(table_name)}"
+    """))
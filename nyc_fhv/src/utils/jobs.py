@@ -0,0 +1,429 @@
+import glob
+import os
+import socket
+import time
+import uuid
+
+import pandas as pd
+import polars as pl
+from sqlalchemy import inspect, text
+
+from src.config import configuration
+from .bulk_load import publish_staging, staging_table_name
+from .db import attach_postgres_duckdb
+from .engine_select import resolve_engine
+from .etl import (
+    KEY_COLUMNS,
+    LOAD_INDEXES,
+    extract_duckdb,
+    extract_polars,
+    load_hooks,
+    output_table_name,
+    transform_duckdb,
+    transform_pandas,
+    transform_polars
+)
+from .expiration import load_target
+from .logger import get_logger
+from .sampling import raw_key_columns, sample_mask_pandas
+
+# Sharded runs over a Postgres job table (RUN_MODE=coordinator / worker).
+#
+# The coordinator splits the files matching JOB_INPUT_PATTERN into shards, either whole
+# files or byte ranges of JOB_SHARD_MB, and enqueues them as one run in etl_shards.
+# Workers on any host sharing data/ claim shards with FOR UPDATE SKIP LOCKED and keep
+# the row locked until they record the outcome, so a worker that dies simply releases
+# its shard to the next one. Each shard goes through the usual extract and transform
+# and is appended to the run's UNLOGGED staging table, tagged with its shard number;
+# a retried shard replaces its own rows.
+# The staging table has a fixed schema (STAGING_TYPES) rather than the dtypes inferred from
+# whichever shard gets there first: a shard whose wheelchair_accessible is all blank would
+# otherwise make it DOUBLE for every later shard. pandas shards are read with every column as
+# text, and every shard is cast to the staging types on append.
+# The coordinator works on shards too. Once every shard is done it keeps the first row
+# per key across shards (the lowest shard wins, as a single run over the inputs in
+# order would), gives the key columns the numeric type a single run infers when every key
+# is a number, and swaps the result in like the bulk-load profile.
+
+JOB_TABLE = "etl_shards"
+
+SHARD_DIR = "data/.shards"
+
+# Staging column types; every other output column (text or enrichment columns) is TEXT
+STAGING_TYPES = {"expiration_date": "TIMESTAMP", "days_until_expiration": "BIGINT"}
+
+# Key column types tried when the run is loaded, as a whole-file read infers them
+KEY_TYPES = ["bigint", "double precision"]
+
+
+def create_job_table(engine):
+    with engine.begin() as conn:
+        # IF NOT EXISTS alone still fails when workers start at the same time
+        conn.execute(text("SELECT pg_advisory_xact_lock(hashtext(:name))"), {"name": JOB_TABLE})
+        conn.execute(text(f"""
+            CREATE TABLE IF NOT EXISTS {JOB_TABLE} (
+                run_id TEXT NOT NULL,
+                shard INTEGER NOT NULL,
+                file_name TEXT NOT NULL,
+                byte_start BIGINT,
+                byte_end BIGINT,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                worker TEXT,
+                rows BIGINT,
+                error TEXT,
+                created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+                finished_at TIMESTAMPTZ,
+                PRIMARY KEY (run_id, shard)
+            )
+        """))
+        conn.execute(text(f"""
+            CREATE INDEX IF NOT EXISTS {JOB_TABLE}_open ON {JOB_TABLE} (created_at, run_id, shard)
+            WHERE status <> 'done'
+        """))
+
+
+def worker_name() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def run_staging_table(run_id: str) -> str:
+    return f"{output_table_name('fhv_active_cleaned')}_run_{run_id}"
+
+
+#PLAN ----------------------------------------------------------------------------------------
+
+def plan_shards(file_names: list, shard_bytes: int) -> list:
+    """
+    Return (file_name, byte_start, byte_end) per shard, in input order.
+    Uncompressed CSVs larger than `shard_bytes` are split into byte ranges; 0 keeps whole files.
+    """
+
+    shards = []
+    for file_name in file_names:
+        size = os.path.getsize(f"data/{file_name}")
+        if not shard_bytes or size <= shard_bytes or not file_name.endswith(".csv"):
+            shards.append((file_name, None, None))
+            continue
+        for start in range(0, size, shard_bytes):
+            shards.append((file_name, start, min(start + shard_bytes, size)))
+
+    return shards
+
+
+def enqueue_run(engine, file_names: list) -> str:
+    """Enqueue the shards of `file_names` as a new run and return its id."""
+
+    logger = get_logger(log_level=configuration.LOG_LEVEL)
+
+    run_id = uuid.uuid4().hex[:12]
+    shards = plan_shards(file_names, int(configuration.JOB_SHARD_MB * 1024 * 1024))
+
+    create_job_table(engine)
+    with engine.begin() as conn:
+        conn.execute(
+            text(f"""
+                INSERT INTO {JOB_TABLE} (run_id, shard, file_name, byte_start, byte_end)
+                VALUES (:run_id, :shard, :file_name, :byte_start, :byte_end)
+            """),
+            [
+                {"run_id": run_id, "shard": i, "file_name": name, "byte_start": start, "byte_end": end}
+                for i, (name, start, end) in enumerate(shards)
+            ]
+        )
+
+    logger.info(f"Run {run_id}: enqueued {len(shards)} shards of {len(file_names)} files")
+
+    return run_id
+
+
+#SHARDS --------------------------------------------------------------------------------------
+
+def materialize_shard(run_id: str, shard: int, file_name: str, byte_start: int, byte_end: int) -> str:
+    """
+    Write the header and the lines of a byte range of data/<file_name> to SHARD_DIR.
+    A line belongs to the shard its first byte falls in. Returns the path relative to data/.
+    Quoted fields spanning several lines are not supported.
+    """
+
+    os.makedirs(SHARD_DIR, exist_ok=True)
+    shard_name = f"{os.path.basename(SHARD_DIR)}/{run_id}_{shard:05d}.csv"
+
+    with open(f"data/{file_name}", "rb") as src, open(f"data/{shard_name}", "wb") as dst:
+        header = src.readline()
+        dst.write(header)
+
+        # Skip the line in progress at byte_start; it belongs to the previous shard
+        if byte_start > len(header):
+            src.seek(byte_start - 1)
+            src.readline()
+
+        remaining = byte_end - src.tell()
+        last = b"\n"
+        while remaining > 0:
+            chunk = src.read(min(remaining, 1024 * 1024))
+            if not chunk:
+                break
+            dst.write(chunk)
+            remaining -= len(chunk)
+            last = chunk[-1:]
+
+        # Finish the line in progress at byte_end
+        if last != b"\n":
+            dst.write(src.readline())
+
+    return shard_name
+
+
+def staging_type(column: str) -> str:
+    return STAGING_TYPES.get(column, "TEXT")
+
+
+def _ensure_staging(engine, staging: str, columns: list):
+    """Create the run's staging table once, however many workers get here at the same time."""
+
+    definitions = ", ".join(f'"{col}" {staging_type(col)}' for col in columns)
+
+    with engine.begin() as conn:
+        conn.execute(text("SELECT pg_advisory_xact_lock(hashtext(:name))"), {"name": staging})
+        conn.execute(text(f'CREATE UNLOGGED TABLE IF NOT EXISTS "{staging}" ({definitions}, _shard INTEGER NOT NULL)'))
+
+
+def extract_shard_pandas(file_name: str) -> pd.DataFrame:
+    """Read a shard with every column as text, so its dtypes do not depend on which rows it holds."""
+
+    df = pd.read_csv(f"data/{file_name}", dtype=str)
+    if configuration.SAMPLE_PERCENT:
+        df = df[sample_mask_pandas(df, raw_key_columns(df.columns), configuration.SAMPLE_PERCENT)]
+
+    return df
+
+
+def append_shard_pandas(df: pd.DataFrame, engine, staging: str, shard: int) -> int:
+    """Replace the rows of `shard` in the staging table with `df`."""
+
+    _ensure_staging(engine, staging, list(df.columns))
+    text_columns = [col for col in df.columns if staging_type(col) == "TEXT"]
+    df = df.astype(dict.fromkeys(text_columns, "string")).assign(_shard=shard)
+
+    with engine.begin() as conn:
+        conn.execute(text(f'DELETE FROM "{staging}" WHERE _shard = :shard'), {"shard": shard})
+        df.to_sql(staging, conn, if_exists="append", index=False)
+
+    return len(df)
+
+
+def append_shard_duckdb(con, table_name: str, engine, staging: str, shard: int) -> int:
+    """Replace the rows of `shard` in the staging table with DuckDB table `table_name`."""
+
+    columns = con.execute(f"SELECT column_name FROM (DESCRIBE {table_name})").fetchdf()["column_name"].tolist()
+    _ensure_staging(engine, staging, columns)
+
+    attach_postgres_duckdb(con)
+    con.execute("CALL pg_clear_cache()")
+
+    target = f"postgres_db.public.{staging}"
+    names = ", ".join(f'"{col}"' for col in columns)
+    casts = ", ".join(f'CAST("{col}" AS {staging_type(col)})' for col in columns)
+
+    con.execute("BEGIN")
+    try:
+        con.execute(f"DELETE FROM {target} WHERE _shard = {shard}")
+        con.execute(f"INSERT INTO {target} ({names}, _shard) SELECT {casts}, {shard} FROM {table_name}")
+        con.execute("COMMIT")
+    except Exception:
+        con.execute("ROLLBACK")
+        raise
+
+    return con.execute(f"SELECT COUNT(*) FROM {table_name}").fetchone()[0]
+
+
+def process_shard(engine, run_id: str, shard: int, file_name: str) -> int:
+    """Run the transform over one shard file and append the result to the run's staging table."""
+
+    staging = run_staging_table(run_id)
+    transform_engine = resolve_engine(file_name)
+
+    if transform_engine == "duckdb":
+        con, table_name = transform_duckdb(*extract_duckdb(f"data/{file_name}"))
+        try:
+            return append_shard_duckdb(con, table_name, engine, staging, shard)
+        finally:
+            con.close()
+
+    if transform_engine == "polars":
+        lf = transform_polars(extract_polars(file_name))
+        text_columns = [col for col in lf.collect_schema().names() if staging_type(col) == "TEXT"]
+        # Cast before converting: a nullable Polars integer would become a pandas float
+        df = lf.with_columns(pl.col(text_columns).cast(pl.String)).collect().to_pandas()
+    else:
+        df = transform_pandas(extract_shard_pandas(file_name))
+
+    return append_shard_pandas(df, engine, staging, shard)
+
+
+def process_next_shard(engine, worker: str, run_id: str = None) -> bool:
+    """
+    Claim one open shard (of `run_id`, or of any run), process it and record the outcome.
+    Returns False when no shard could be claimed.
+    """
+
+    logger = get_logger(log_level=configuration.LOG_LEVEL)
+    run_filter = "AND run_id = :run_id" if run_id else ""
+
+    with engine.begin() as conn:
+        claimed = conn.execute(
+            text(f"""
+                SELECT run_id, shard, file_name, byte_start, byte_end
+                FROM {JOB_TABLE}
+                WHERE status <> 'done' AND attempts < :max_attempts {run_filter}
+                ORDER BY created_at, run_id, shard
+                FOR UPDATE SKIP LOCKED
+                LIMIT 1
+            """),
+            {"max_attempts": configuration.JOB_MAX_ATTEMPTS, "run_id": run_id}
+        ).first()
+        if claimed is None:
+            return False
+
+        key = {"run_id": claimed.run_id, "shard": claimed.shard, "worker": worker}
+        started = time.perf_counter()
+        file_name = claimed.file_name
+        try:
+            if claimed.byte_start is not None:
+                file_name = materialize_shard(
+                    claimed.run_id, claimed.shard, claimed.file_name, claimed.byte_start, claimed.byte_end
+                )
+            rows = process_shard(engine, claimed.run_id, claimed.shard, file_name)
+        except Exception as e:
+            logger.error(f"Run {claimed.run_id} shard {claimed.shard} failed. Error: {str(e)}")
+            conn.execute(
+                text(f"""
+                    UPDATE {JOB_TABLE}
+                    SET status = 'failed', attempts = attempts + 1, worker = :worker, error = :error, finished_at = now()
+                    WHERE run_id = :run_id AND shard = :shard
+                """),
+                {**key, "error": str(e)}
+            )
+            return True
+        finally:
+            if file_name != claimed.file_name:
+                os.remove(f"data/{file_name}")
+
+        conn.execute(
+            text(f"""
+                UPDATE {JOB_TABLE}
+                SET status = 'done', attempts = attempts + 1, worker = :worker, rows = :rows, error = NULL,
+                    finished_at = now()
+                WHERE run_id = :run_id AND shard = :shard
+            """),
+            {**key, "rows": rows}
+        )
+
+    logger.info(f"Run {claimed.run_id} shard {claimed.shard}: {rows} rows in {time.perf_counter() - started:.3f}s")
+
+    return True
+
+
+#FINALIZE ------------------------------------------------------------------------------------
+
+def run_status(engine, run_id: str) -> dict:
+    with engine.connect() as conn:
+        return dict(conn.execute(
+            text(f"""
+                SELECT COUNT(*) AS shards,
+                       COUNT(*) FILTER (WHERE status = 'done') AS done,
+                       COUNT(*) FILTER (WHERE status <> 'done' AND attempts >= :max_attempts) AS exhausted
+                FROM {JOB_TABLE}
+                WHERE run_id = :run_id
+            """),
+            {"run_id": run_id, "max_attempts": configuration.JOB_MAX_ATTEMPTS}
+        ).mappings().one())
+
+
+def finalize_run(engine, run_id: str):
+    """Deduplicate the run's staging table across shards and swap it in as the loaded table."""
+
+    logger = get_logger(log_level=configuration.LOG_LEVEL)
+
+    table_name = output_table_name("fhv_active_cleaned")
+    target, indexes = load_target(table_name, LOAD_INDEXES)
+    staging = run_staging_table(run_id)
+    final = staging_table_name(target)
+    keys = ", ".join(f'"{col}"' for col in sorted(KEY_COLUMNS))
+
+    with engine.begin() as conn:
+        if not inspect(conn).has_table(staging):
+            logger.warning(f"Run {run_id}: no shard produced any rows, nothing to load")
+            return
+        conn.execute(text(f'DROP TABLE IF EXISTS "{final}"'))
+        conn.execute(text(f"""
+            CREATE UNLOGGED TABLE "{final}" AS
+            SELECT DISTINCT ON ({keys}) *
+            FROM "{staging}"
+            ORDER BY {keys}, _shard
+        """))
+        conn.execute(text(f'ALTER TABLE "{final}" DROP COLUMN _shard'))
+        for col in sorted(KEY_COLUMNS):
+            for key_type in KEY_TYPES:
+                if conn.execute(
+                    text(f'SELECT bool_and(pg_input_is_valid("{col}", :type)) FROM "{final}"'), {"type": key_type}
+                ).scalar():
+                    conn.execute(text(f'ALTER TABLE "{final}" ALTER COLUMN "{col}" TYPE {key_type} USING CAST("{col}" AS {key_type})'))
+                    break
+
+    before_swap, after_swap = load_hooks(table_name, target)
+    publish_staging(engine, final, target, indexes, before_swap=before_swap, after_swap=after_swap)
+
+    with engine.begin() as conn:
+        conn.execute(text(f'DROP TABLE "{staging}"'))
+
+    logger.info(f"Run {run_id}: loaded {target}")
+
+
+#MODES ---------------------------------------------------------------------------------------
+
+def run_worker(engine):
+    """Process shards of any run until none has been claimable for JOB_IDLE_SECONDS."""
+
+    logger = get_logger(log_level=configuration.LOG_LEVEL)
+    worker = worker_name()
+    create_job_table(engine)
+
+    idle_since = time.monotonic()
+    while time.monotonic() - idle_since < configuration.JOB_IDLE_SECONDS:
+        if process_next_shard(engine, worker):
+            idle_since = time.monotonic()
+        else:
+            time.sleep(configuration.JOB_POLL_SECONDS)
+
+    logger.info(f"Worker {worker}: idle for {configuration.JOB_IDLE_SECONDS}s, stopping")
+
+
+def run_coordinator(engine, pattern: str):
+    """Enqueue the files in data/ matching `pattern`, help process them and load the result."""
+
+    logger = get_logger(log_level=configuration.LOG_LEVEL)
+
+    file_names = sorted(os.path.relpath(path, "data") for path in glob.glob(f"data/{pattern}"))
+    if not file_names:
+        raise FileNotFoundError(f"No input files match data/{pattern}")
+
+    run_id = enqueue_run(engine, file_names)
+    worker = worker_name()
+
+    while True:
+        if process_next_shard(engine, worker, run_id):
+            continue
+
+        status = run_status(engine, run_id)
+        if status["exhausted"]:
+            raise RuntimeError(f"Run {run_id}: {status['exhausted']} shards failed {configuration.JOB_MAX_ATTEMPTS} times")
+        if status["done"] == status["shards"]:
+            break
+
+        # The remaining shards are being processed by other workers
+        time.sleep(configuration.JOB_POLL_SECONDS)
+
+    logger.info(f"Run {run_id}: all {status['shards']} shards done")
+    finalize_run(engine, run_id)
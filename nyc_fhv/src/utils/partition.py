@@ -0,0 +1,131 @@
+import os
+import shutil
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from src.config import configuration
+from .logger import get_logger
+from .sampling import (
+    SAMPLE_KEY_COLUMNS,
+    raw_key_columns,
+    normalize_key_pandas,
+    sample_mask_pandas,
+    key_dtypes_pandas,
+    restore_key_dtypes_pandas
+)
+
+# Key-partitioned parallel pandas transform (PARALLEL_BUCKETS).
+#
+# Rows sharing a dedup key must meet in the same drop_duplicates_pandas call, so the
+# input is split by a hash of the (trimmed) key instead of by row ranges: every
+# duplicate-key group lands in exactly one of PARALLEL_BUCKETS buckets. The input is read
+# in chunks, each chunk is split into its buckets, and the pieces are kept in memory,
+# or pickled to data/.buckets/ when the input is larger than PARALLEL_SPILL_MB.
+#
+# Each bucket runs the planned pandas steps in a process pool. Rows keep their position
+# in the input as index, so sorting the concatenated buckets by it restores the order a
+# single-process run produces (including which duplicate is kept).
+# CSV chunks are read with their key columns as text, so every bucket parses them the
+# same way, and the merged result gets the dtype a whole-file read gives the keys.
+
+BUCKET_DIR = "data/.buckets"
+
+
+def bucket_ids_pandas(df: pd.DataFrame, key_columns: list, buckets: int) -> pd.Series:
+    """Bucket of each row, from a hash of its normalized key."""
+
+    keys = pd.DataFrame({col: normalize_key_pandas(df[col]) for col in key_columns})
+
+    return pd.util.hash_pandas_object(keys, index=False) % buckets
+
+
+def partition_chunks_pandas(chunks, buckets: int, spill_dir: str = None):
+    """
+    Split the raw rows of `chunks` (DataFrames in input order) into `buckets` lists of row pieces by key hash.
+    Pieces are DataFrames, or paths of pickled DataFrames under `spill_dir` when one is given.
+    Also returns the dtypes a whole-file read would give the key columns (see key_dtypes_pandas)
+    and an empty DataFrame with the columns of the input.
+    """
+
+    pieces = [[] for _ in range(buckets)]
+    key_columns = None
+    dtypes = None
+    empty = None
+    offset = 0
+
+    for i, chunk in enumerate(chunks):
+        chunk.index = pd.RangeIndex(offset, offset + len(chunk))
+        offset += len(chunk)
+
+        if key_columns is None:
+            key_columns = raw_key_columns(chunk.columns)
+            empty = chunk.head(0)
+        dtypes = key_dtypes_pandas(chunk, key_columns, dtypes)
+        if configuration.SAMPLE_PERCENT:
+            chunk = chunk[sample_mask_pandas(chunk, key_columns, configuration.SAMPLE_PERCENT)]
+
+        for bucket, piece in chunk.groupby(bucket_ids_pandas(chunk, key_columns, buckets), sort=False):
+            if spill_dir:
+                path = f"{spill_dir}/{bucket:04d}-{i:06d}.pkl"
+                piece.to_pickle(path)
+                piece = path
+            pieces[bucket].append(piece)
+
+    return pieces, dtypes, empty
+
+
+def transform_bucket_pandas(pieces: list, steps: list) -> pd.DataFrame:
+    """Run `steps` over the rows of one bucket."""
+
+    df = pd.concat([pd.read_pickle(p) if isinstance(p, str) else p for p in pieces])
+
+    for step in steps:
+        df = step.func(df)
+
+    return df
+
+
+def transform_partitioned_pandas(chunks, steps: list, spill: bool = False, text_keys: bool = False) -> pd.DataFrame:
+    """
+    Transform the raw rows of `chunks` with `steps` over PARALLEL_BUCKETS key-hash buckets
+    in PARALLEL_WORKERS processes, spilling the buckets to disk when `spill` is set.
+    Set `text_keys` when the chunks hold the key columns as text only because they were
+    read in chunks (read_csv_chunks_pandas): numeric keys are then converted back.
+    Returns the same rows, in the same order, as a single-process run.
+    """
+
+    logger = get_logger(log_level=configuration.LOG_LEVEL)
+    buckets = configuration.PARALLEL_BUCKETS
+
+    spill_dir = None
+    if spill:
+        spill_dir = f"{BUCKET_DIR}/{uuid.uuid4().hex[:12]}"
+        os.makedirs(spill_dir)
+
+    try:
+        pieces, dtypes, empty = partition_chunks_pandas(chunks, buckets, spill_dir)
+        pieces = [p for p in pieces if p]
+        logger.info(
+            f"Partitioned the input into {len(pieces)} key buckets"
+            f"{f', spilled to {spill_dir}' if spill_dir else ''}"
+        )
+
+        if pieces:
+            workers = min(configuration.PARALLEL_WORKERS or os.cpu_count(), len(pieces))
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                results = list(pool.map(transform_bucket_pandas, pieces, [steps] * len(pieces)))
+        else:
+            # No rows (or none sampled): the steps still give the result its columns and dtypes
+            results = [transform_bucket_pandas([empty], steps)]
+    finally:
+        if spill_dir:
+            shutil.rmtree(spill_dir, ignore_errors=True)
+
+    df = pd.concat(results).sort_index()
+    if text_keys and dtypes:
+        # The steps standardize the raw key headers to SAMPLE_KEY_COLUMNS
+        df = restore_key_dtypes_pandas(df, dict(zip(SAMPLE_KEY_COLUMNS, dtypes.values())))
+
+    return df
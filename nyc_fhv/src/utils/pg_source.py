@@ -0,0 +1,296 @@
+import io
+import queue
+import threading
+from contextlib import contextmanager
+
+import pandas as pd
+import polars as pl
+import pyarrow as pa
+from pyarrow import csv as pa_csv
+from psycopg2.errors import QueryCanceled
+from sqlalchemy import text
+
+from src.config import configuration
+from .logger import get_logger
+from .sampling import raw_key_columns, sample_mask_pandas, sample_filter_sql, sample_filter_polars
+
+# Extract from a Postgres table or query instead of a CSV in data/ (EXTRACT_SOURCE=postgres).
+#
+# POSTGRES_SOURCE names a table (e.g. a raw landing table, or fhv_active_cleaned to
+# re-transform) or holds a SELECT. Its rows are streamed with COPY ... TO STDOUT as CSV
+# by a thread into a bounded queue, read back through a file-like CopyStream. Nothing is
+# written to disk and the client never holds the raw result set: the queue throttles the
+# COPY to the reader's pace.
+# pandas parses the stream POSTGRES_BATCH_ROWS rows at a time, like the sampled extract,
+# with dates written as in the export (MM/DD/YYYY) so the transforms run unchanged; it
+# reads the text columns as str, as each batch would otherwise infer its own dtypes, e.g.
+# float for a batch of numeric-looking license numbers, and the trim would blank them.
+# Polars is built from the same batches. DuckDB scans the stream as Arrow record batches
+# typed from the Postgres columns (dates in ISO format, read as DATE); text columns holding
+# only numbers, booleans, export-format dates or times are then typed as DuckDB types them
+# in a CSV file.
+# Timestamp columns are cut to their date, as the export only has dates.
+
+# Date format of the pandas stream, as in the Socrata CSV export, and of the Arrow stream
+EXPORT_DATE_STYLE = "SQL, MDY"
+EXPORT_DATE_FORMAT = "%m/%d/%Y"
+ARROW_DATE_STYLE = "ISO"
+
+# Chunks of COPY output buffered between the COPY thread and the reader
+COPY_QUEUE_CHUNKS = 256
+
+# Postgres type OIDs of date, timestamp and timestamptz
+DATE_OID = 1082
+TIMESTAMP_OIDS = (1114, 1184)
+
+# Postgres type OIDs of text, char and varchar
+TEXT_OIDS = (25, 1042, 1043)
+
+# Arrow types of the Postgres types read as other than text
+ARROW_TYPES = {
+    16: pa.bool_(),
+    20: pa.int64(), 21: pa.int64(), 23: pa.int64(),
+    700: pa.float64(), 701: pa.float64(), 1700: pa.float64(),
+    DATE_OID: pa.date32(), **{oid: pa.date32() for oid in TIMESTAMP_OIDS},
+}
+
+
+def source_query() -> str:
+    """The SELECT behind POSTGRES_SOURCE."""
+
+    source = (configuration.POSTGRES_SOURCE or "").strip()
+    if not source:
+        raise ValueError("EXTRACT_SOURCE=postgres needs POSTGRES_SOURCE (a table name or a SELECT)")
+
+    if source.split(None, 1)[0].lower() in ("select", "with", "table", "values"):
+        return source
+    return f"SELECT * FROM {source}"
+
+
+def source_columns(engine) -> list:
+    """(name, type OID) of every column of POSTGRES_SOURCE."""
+
+    with engine.connect() as conn:
+        result = conn.execute(text(f"SELECT * FROM ({source_query()}) AS source LIMIT 0"))
+        return [(col.name, col.type_code) for col in result.cursor.description]
+
+
+def export_query(columns: list) -> str:
+    """source_query(), with its timestamp `columns` cut to their date like in the export."""
+
+    if not any(oid in TIMESTAMP_OIDS for _, oid in columns):
+        return source_query()
+
+    def column(name: str, oid: int) -> str:
+        quoted = '"' + name.replace('"', '""') + '"'
+        return f"{quoted}::date AS {quoted}" if oid in TIMESTAMP_OIDS else quoted
+
+    select = ", ".join(column(name, oid) for name, oid in columns)
+    return f"SELECT {select} FROM ({source_query()}) AS source"
+
+
+class CopyStream(io.RawIOBase):
+    """
+    Readable end of a COPY ... TO STDOUT running in another thread.
+    The COPY writes its output into a bounded queue through `writer`, and reads take it back out.
+    """
+
+    class _Writer:
+        def __init__(self, stream):
+            self.write = stream.put
+
+    def __init__(self):
+        super().__init__()
+        self._queue = queue.Queue(COPY_QUEUE_CHUNKS)
+        self._chunk = memoryview(b"")
+        self._eof = False
+        self._abandoned = threading.Event()
+        self.writer = self._Writer(self)
+
+    def put(self, data):
+        """Queue `data` (None marks the end), waiting for room; fails once the reader has given up."""
+
+        while not self._abandoned.is_set():
+            try:
+                self._queue.put(data, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+        raise BrokenPipeError("the reader closed the COPY stream")
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer) -> int:
+        if not self._chunk:
+            if self._eof:
+                return 0
+            data = self._queue.get()
+            if data is None:
+                self._eof = True
+                return 0
+            self._chunk = memoryview(data)
+
+        size = min(len(buffer), len(self._chunk))
+        buffer[:size] = self._chunk[:size]
+        self._chunk = self._chunk[size:]
+
+        return size
+
+    def close(self):
+        self._abandoned.set()
+        super().close()
+
+
+@contextmanager
+def copy_stream(engine, query: str, date_style: str = EXPORT_DATE_STYLE):
+    """
+    Yield a binary file object that `query`'s rows are streamed into as CSV with a header.
+    Raises the COPY's error once the reader is done, so a failed COPY is never taken for a short result.
+    A reader that stops early cancels the COPY.
+    """
+
+    conn = engine.raw_connection()
+    stream = CopyStream()
+    errors = []
+
+    def copy():
+        try:
+            cursor = conn.cursor()
+            cursor.execute(f"SET DateStyle = '{date_style}'")
+            cursor.copy_expert(f"COPY ({query}) TO STDOUT WITH (FORMAT csv, HEADER)", stream.writer)
+        except BaseException as e:
+            errors.append(e)
+        finally:
+            try:
+                stream.put(None)
+            except BrokenPipeError:
+                pass
+
+    thread = threading.Thread(target=copy, name="postgres-copy", daemon=True)
+    thread.start()
+
+    try:
+        yield io.BufferedReader(stream)
+    except BaseException as e:
+        stream.close()
+        conn.driver_connection.cancel()
+        thread.join()
+        # The session may still be in the middle of the COPY
+        conn.invalidate()
+        # A COPY that failed on its own reaches the reader as an empty or cut-off stream
+        if errors and not isinstance(errors[0], (QueryCanceled, BrokenPipeError)):
+            raise errors[0] from e
+        raise
+
+    stream.close()
+    thread.join()
+    conn.close()
+    if errors and not isinstance(errors[0], BrokenPipeError):
+        raise errors[0]
+
+
+#PANDAS --------------------------------------------------------------------------------------
+
+def read_postgres_chunks_pandas(engine):
+    """Yield the rows of POSTGRES_SOURCE as DataFrames of POSTGRES_BATCH_ROWS rows."""
+
+    get_logger(log_level=configuration.LOG_LEVEL).info(f"Streaming {source_query()} from Postgres")
+
+    columns = source_columns(engine)
+    dtypes = {name: str for name, oid in columns if oid in TEXT_OIDS}
+
+    with copy_stream(engine, export_query(columns)) as stream:
+        yield from pd.read_csv(stream, low_memory=False, chunksize=configuration.POSTGRES_BATCH_ROWS, dtype=dtypes)
+
+
+def extract_postgres_pandas(engine) -> pd.DataFrame:
+    """Read POSTGRES_SOURCE into a DataFrame batch by batch, sampling each batch when SAMPLE_PERCENT is set."""
+
+    chunks = []
+    for chunk in read_postgres_chunks_pandas(engine):
+        if configuration.SAMPLE_PERCENT:
+            chunk = chunk[sample_mask_pandas(chunk, raw_key_columns(chunk.columns), configuration.SAMPLE_PERCENT)]
+        chunks.append(chunk)
+
+    return pd.concat(chunks, ignore_index=True)
+
+
+#POLARS --------------------------------------------------------------------------------------
+
+def extract_postgres_polars(engine) -> pl.LazyFrame:
+    """
+    Build a LazyFrame from the batches of POSTGRES_SOURCE, sampled like a scanned CSV when SAMPLE_PERCENT is set.
+    Each batch is converted as it arrives, so the rows are only held once, by Polars.
+    """
+
+    frames = []
+    for chunk in read_postgres_chunks_pandas(engine):
+        frame = pl.from_pandas(chunk)
+        if configuration.SAMPLE_PERCENT:
+            frame = frame.filter(sample_filter_polars(frame.columns, configuration.SAMPLE_PERCENT))
+        frames.append(frame)
+
+    # Batches infer their own dtypes (e.g. int, or float with a missing value)
+    return pl.concat(frames, how="vertical_relaxed").lazy()
+
+
+#DUCKDB --------------------------------------------------------------------------------------
+
+def type_text_columns_duckdb(con, table_name: str, columns: list):
+    """
+    Convert the VARCHAR `columns` of `table_name` whose every value is a number, a boolean, a date
+    in the export format or a time to that type, as DuckDB types the columns of a CSV file it reads.
+    """
+
+    checks = [
+        (col, sql_type, f'bool_and("{col}" IS NULL OR {expr} IS NOT NULL) AND COUNT("{col}") > 0', expr)
+        for col in columns
+        for sql_type, expr in (
+            ("BIGINT", f'TRY_CAST("{col}" AS BIGINT)'),
+            ("DOUBLE", f'TRY_CAST("{col}" AS DOUBLE)'),
+            ("BOOLEAN", f'TRY_CAST("{col}" AS BOOLEAN)'),
+            ("DATE", f"CAST(TRY_STRPTIME(\"{col}\", '{EXPORT_DATE_FORMAT}') AS DATE)"),
+            ("TIME", f'TRY_CAST("{col}" AS TIME)'),
+        )
+    ]
+    if not checks:
+        return
+
+    results = con.execute(f"SELECT {', '.join(check for _, _, check, _ in checks)} FROM {table_name}").fetchone()
+
+    typed = set()
+    for (col, sql_type, _, expr), matches in zip(checks, results):
+        if matches and col not in typed:
+            con.execute(f'ALTER TABLE {table_name} ALTER COLUMN "{col}" TYPE {sql_type} USING {expr}')
+            typed.add(col)
+
+
+def extract_postgres_duckdb(engine, con, table_name: str):
+    """Create `table_name` from POSTGRES_SOURCE, sampled when SAMPLE_PERCENT is set."""
+
+    get_logger(log_level=configuration.LOG_LEVEL).info(f"Streaming {source_query()} from Postgres")
+
+    # The stream can only be read once, so the column names and types come from Postgres
+    columns = source_columns(engine)
+    convert_options = pa_csv.ConvertOptions(
+        column_types={name: ARROW_TYPES.get(oid, pa.string()) for name, oid in columns},
+        strings_can_be_null=True,
+        quoted_strings_can_be_null=False,
+        # COPY writes booleans as t / f
+        true_values=["t"],
+        false_values=["f"]
+    )
+    where = f"WHERE {sample_filter_sql([name for name, _ in columns], configuration.SAMPLE_PERCENT)}" if configuration.SAMPLE_PERCENT else ""
+
+    with copy_stream(engine, export_query(columns), ARROW_DATE_STYLE) as stream:
+        batches = pa_csv.open_csv(stream, convert_options=convert_options)
+        con.register("postgres_source_batches", batches)
+        try:
+            con.execute(f"CREATE OR REPLACE TABLE {table_name} AS SELECT * FROM postgres_source_batches {where}")
+        finally:
+            con.unregister("postgres_source_batches")
+
+    type_text_columns_duckdb(con, table_name, [name for name, oid in columns if oid in TEXT_OIDS])
+
+    return table_name
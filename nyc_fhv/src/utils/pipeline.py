@@ -0,0 +1,114 @@
+from dataclasses import dataclass
+from typing import Callable, FrozenSet, Optional
+
+# Declarative transform pipeline with a small rule-based step-order optimizer.
+#
+# Every step declares which columns it reads and writes and what kind of step it is:
+#   - "map":     row-wise transform, never adds or removes rows
+#   - "filter":  drops rows based on a predicate over `reads`
+#   - "dedup":   keeps the first row per distinct value of `reads`
+#   - "project": keeps only the `reads` columns
+#   - "barrier": anything the optimizer must not reorder around (e.g. renames)
+#
+# ALL_COLUMNS marks a step that applies the same rule to each column independently
+# (e.g. trimming every text column), so dropping columns before it is safe.
+
+ALL_COLUMNS = None
+
+REDUCING_KINDS = ("project", "filter", "dedup")
+
+# Cheaper reductions are moved ahead of more expensive ones
+_REDUCTION_RANK = {"project": 0, "filter": 1, "dedup": 2}
+
+
+@dataclass(frozen=True)
+class Step:
+    name: str
+    func: Callable
+    kind: str
+    reads: Optional[FrozenSet[str]] = ALL_COLUMNS
+    writes: Optional[FrozenSet[str]] = frozenset()
+
+
+def _subset(columns, of) -> bool:
+    """Check `columns` is a subset of `of`; ALL_COLUMNS is only a subset of itself."""
+
+    if columns is ALL_COLUMNS:
+        return of is ALL_COLUMNS
+    if of is ALL_COLUMNS:
+        return True
+    return columns <= of
+
+
+def _disjoint(a, b) -> bool:
+    """Check two column sets share no column; ALL_COLUMNS overlaps everything."""
+
+    if a is ALL_COLUMNS or b is ALL_COLUMNS:
+        return False
+    return not (a & b)
+
+
+def can_move_before(step: Step, previous: Step) -> bool:
+    """
+    Return True if `step` can run before `previous` without changing the result.
+    """
+
+    if step.kind not in REDUCING_KINDS or previous.kind == "barrier":
+        return False
+
+    if previous.kind in REDUCING_KINDS:
+        # Never undo a more profitable order
+        if _REDUCTION_RANK[step.kind] >= _REDUCTION_RANK[previous.kind]:
+            return False
+
+    if step.kind == "project":
+        if previous.kind == "map":
+            # A column-local map only touches kept columns once the others are gone,
+            # but a map that adds a column would then leave it in the output
+            if previous.reads is ALL_COLUMNS and previous.writes is ALL_COLUMNS:
+                return True
+            return _subset(previous.reads, step.reads) and _subset(previous.writes, step.reads)
+        # Row reductions keep working if everything they look at survives the projection
+        return _subset(previous.reads, step.reads)
+
+    if step.kind == "filter":
+        if previous.kind == "map":
+            return _disjoint(step.reads, previous.writes)
+        if previous.kind == "dedup":
+            # The predicate is constant within each duplicate group
+            return _subset(step.reads, previous.reads)
+        return True
+
+    if step.kind == "dedup":
+        if previous.kind == "map":
+            return _disjoint(step.reads, previous.writes)
+        return False
+
+    return False
+
+
+def optimize_steps(steps: list) -> list:
+    """
+    Move projections, filters and dedups ahead of earlier steps wherever
+    `can_move_before` proves the result is unchanged.
+    """
+
+    plan = list(steps)
+
+    moved = True
+    while moved:
+        moved = False
+        for i in range(1, len(plan)):
+            if can_move_before(plan[i], plan[i - 1]):
+                plan[i - 1], plan[i] = plan[i], plan[i - 1]
+                moved = True
+
+    return plan
+
+
+def describe_plan(steps: list) -> str:
+    """Render a plan as a numbered, one-line-per-step string for logging."""
+
+    return "\n".join(
+        f"  {i}. {step.name} [{step.kind}]" for i, step in enumerate(steps, start=1)
+    )
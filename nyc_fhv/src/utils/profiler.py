@@ -0,0 +1,202 @@
+import json
+import os
+
+import pandas as pd
+
+# Data-quality profiler.
+# All configured checks are computed together over the final result: one set of
+# vectorized column operations in pandas, one aggregate SELECT in DuckDB.
+# Thresholds are (metric path, "max" | "min", limit) tuples evaluated on the report.
+
+QUANTILES = {"p01": 0.01, "p50": 0.5, "p99": 0.99}
+
+CONTROL_CHARS = r"[\x00-\x1F\x7F]"
+EDGE_WHITESPACE = r"^\s|\s$"
+
+PROFILE_CHECKS = {
+    "text": ["license_type", "dmv_license_plate_number", "vehicle_vin_number", "wheelchair_accessible", "active"],
+    "numeric": ["expiration_date"],
+    "key": ["vehicle_license_number", "dmv_license_plate_number"],
+    "custom": {
+        "missing_key_ids": (
+            lambda df: int((df["vehicle_license_number"].isna() | df["dmv_license_plate_number"].isna()).sum()),
+            "COUNT(*) FILTER (WHERE vehicle_license_number IS NULL OR dmv_license_plate_number IS NULL)",
+        ),
+        "expired": (
+            lambda df: int((df["expiration_date"] < pd.Timestamp.now().normalize()).sum()),
+            "COUNT(*) FILTER (WHERE expiration_date < CURRENT_DATE)",
+        ),
+    },
+}
+
+# Share of rows allowed to have an unparsable expiration_date
+MAX_MISSING_EXPIRATION_FRACTION = 0.01
+
+PROFILE_THRESHOLDS = [
+    ("keys.duplicates", "max", 0),
+    ("checks.missing_key_ids", "max", 0),
+    ("columns.expiration_date.null_fraction", "max", MAX_MISSING_EXPIRATION_FRACTION),
+    *[(f"columns.{col}.{metric}", "max", 0)
+      for col in PROFILE_CHECKS["text"] for metric in ("edge_whitespace", "control_chars")],
+]
+
+
+class DataQualityError(Exception):
+    """Raised when a profiled metric breaches its threshold."""
+
+
+#PANDAS --------------------------------------------------------------------------------------
+
+def profile_pandas(df: pd.DataFrame, checks: dict = PROFILE_CHECKS) -> dict:
+    """Compute every configured check over `df` and return the report."""
+
+    rows = len(df)
+    columns = {}
+
+    for col in checks["text"]:
+        values = df[col].astype("string")
+        nulls = int(values.isna().sum())
+        columns[col] = {
+            "nulls": nulls,
+            "null_fraction": nulls / rows if rows else 0.0,
+            "edge_whitespace": int(values.str.contains(EDGE_WHITESPACE, regex=True, na=False).sum()),
+            "control_chars": int(values.str.contains(CONTROL_CHARS, regex=True, na=False).sum()),
+        }
+
+    for col in checks["numeric"]:
+        values = df[col]
+        nulls = int(values.isna().sum())
+        quantiles = values.quantile(list(QUANTILES.values()), interpolation="lower") if rows else {}
+        columns[col] = {
+            "nulls": nulls,
+            "null_fraction": nulls / rows if rows else 0.0,
+            "min": values.min(),
+            "max": values.max(),
+            **{name: quantiles[q] if rows else None for name, q in QUANTILES.items()},
+        }
+
+    distinct = len(df[checks["key"]].drop_duplicates())
+
+    report = {
+        "rows": rows,
+        "columns": columns,
+        "keys": {"columns": checks["key"], "distinct": distinct, "duplicates": rows - distinct},
+        "checks": {name: pandas_check(df) for name, (pandas_check, _) in checks["custom"].items()},
+    }
+
+    return _clean_report(report)
+
+
+#DUCKDB --------------------------------------------------------------------------------------
+
+def profile_duckdb(con, table_name: str, checks: dict = PROFILE_CHECKS) -> dict:
+    """Compute every configured check over `table_name` in a single aggregate query."""
+
+    exprs = {"rows": "COUNT(*)"}
+
+    for col in checks["text"]:
+        text = f'CAST("{col}" AS VARCHAR)'
+        exprs[f"{col}.nulls"] = f'COUNT(*) - COUNT("{col}")'
+        exprs[f"{col}.edge_whitespace"] = f"COUNT(*) FILTER (WHERE REGEXP_MATCHES({text}, '{EDGE_WHITESPACE}'))"
+        exprs[f"{col}.control_chars"] = f"COUNT(*) FILTER (WHERE REGEXP_MATCHES({text}, '{CONTROL_CHARS}'))"
+
+    for col in checks["numeric"]:
+        exprs[f"{col}.nulls"] = f'COUNT(*) - COUNT("{col}")'
+        exprs[f"{col}.min"] = f'MIN("{col}")'
+        exprs[f"{col}.max"] = f'MAX("{col}")'
+        for name, q in QUANTILES.items():
+            exprs[f"{col}.{name}"] = f'QUANTILE_DISC("{col}", {q})'
+
+    key_cols = ", ".join(f'"{col}"' for col in checks["key"])
+    exprs["distinct"] = f"COUNT(DISTINCT ({key_cols}))"
+
+    for name, (_, sql) in checks["custom"].items():
+        exprs[f"check.{name}"] = sql
+
+    select = ",\n".join(f'{sql} AS "{alias}"' for alias, sql in exprs.items())
+    cursor = con.execute(f"SELECT {select} FROM {table_name}")
+    result = dict(zip([d[0] for d in cursor.description], cursor.fetchone()))
+
+    rows = int(result["rows"])
+    columns = {}
+    for col in checks["text"] + checks["numeric"]:
+        metrics = {alias.split(".", 1)[1]: value for alias, value in result.items() if alias.startswith(f"{col}.")}
+        columns[col] = {
+            "nulls": metrics["nulls"],
+            "null_fraction": metrics.pop("nulls") / rows if rows else 0.0,
+            **metrics,
+        }
+
+    report = {
+        "rows": rows,
+        "columns": columns,
+        "keys": {"columns": checks["key"], "distinct": result["distinct"], "duplicates": rows - result["distinct"]},
+        "checks": {name: result[f"check.{name}"] for name in checks["custom"]},
+    }
+
+    return _clean_report(report)
+
+
+#REPORT --------------------------------------------------------------------------------------
+
+def _clean_report(value):
+    """Convert NaN/NaT to None and numpy/pandas scalars to plain Python values."""
+
+    if isinstance(value, dict):
+        return {k: _clean_report(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_clean_report(v) for v in value]
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return None
+    if isinstance(value, pd.Timestamp):
+        return value.isoformat()
+    if hasattr(value, "item"):
+        return value.item()
+    return value
+
+
+def _metric(report: dict, path: str):
+    """Look up a dotted metric path such as `columns.expiration_date.nulls`."""
+
+    value = report
+    for part in path.split("."):
+        value = value[part]
+    return value
+
+
+def evaluate_thresholds(report: dict, thresholds: list = PROFILE_THRESHOLDS) -> list:
+    """Return a readable description of every breached threshold."""
+
+    breaches = []
+
+    for path, bound, limit in thresholds:
+        value = _metric(report, path)
+        if value is None:
+            continue
+        if (bound == "max" and value > limit) or (bound == "min" and value < limit):
+            breaches.append(f"{path}={value} ({bound} {limit})")
+
+    return breaches
+
+
+def write_profile_report(report: dict, file_name: str):
+    """
+    Save the report as JSON in 'data/reports', creating folder if needed.
+    """
+    os.makedirs("data/reports", exist_ok=True)
+    with open(f"data/reports/{file_name}", "w") as f:
+        json.dump(report, f, indent=2, default=str)
+
+
+def check_profile(report: dict, file_name: str, thresholds: list = PROFILE_THRESHOLDS) -> dict:
+    """
+    Attach threshold breaches to the report, write it, and raise DataQualityError on any breach.
+    """
+
+    report["breaches"] = evaluate_thresholds(report, thresholds)
+    write_profile_report(report, file_name)
+
+    if report["breaches"]:
+        raise DataQualityError("Data quality thresholds breached: " + "; ".join(report["breaches"]))
+
+    return report
@@ -0,0 +1,159 @@
+import pandas as pd
+import polars as pl
+
+# Sampled development runs.
+# Rows are kept or dropped by a hash of their (trimmed) dedup key, so every
+# duplicate-key group is either fully in the sample or fully out of it and
+# drop_duplicates_* still sees real duplicates.
+
+SAMPLE_KEY_COLUMNS = ["vehicle_license_number", "dmv_license_plate_number"]
+
+SAMPLE_CHUNK_SIZE = 100_000
+
+# Sampling resolution: percentages are applied in steps of 0.01%
+HASH_BUCKETS = 10_000
+
+
+def raw_key_columns(columns) -> list:
+    """Return the source headers that standardize to the sample key columns."""
+
+    lookup = {col.lower().replace(" ", "_"): col for col in columns}
+
+    return [lookup[key] for key in SAMPLE_KEY_COLUMNS]
+
+
+def normalize_key_pandas(series: pd.Series) -> pd.Series:
+    """
+    Render a key column as trimmed text.
+    Integer-valued columns parsed as float in some chunks (because of NaN) drop the `.0`
+    so the same key hashes identically in every chunk.
+    """
+
+    return series.astype(str).str.strip().str.replace(r"\.0$", "", regex=True)
+
+
+def read_csv_chunks_pandas(file_path: str, chunksize: int = SAMPLE_CHUNK_SIZE):
+    """
+    Read a CSV in chunks of `chunksize` rows with its key columns as text.
+    Chunks infer their dtypes independently, so a key column could otherwise come back as
+    float in one chunk and str in another, and trim_text_columns_pandas would blank the floats.
+    """
+
+    key_columns = raw_key_columns(pd.read_csv(file_path, nrows=0).columns)
+
+    return pd.read_csv(file_path, low_memory=False, chunksize=chunksize, dtype=dict.fromkeys(key_columns, str))
+
+
+# Key column dtypes from most to least specific, as a whole-file read picks them
+KEY_DTYPES = ["int64", "float64", "object"]
+
+
+def key_dtypes_pandas(chunk: pd.DataFrame, key_columns: list, dtypes: dict = None) -> dict:
+    """
+    Fold the dtype a whole-file read would give each text key column of `chunk` into `dtypes`:
+    int64 or float64 when every value is numeric, object otherwise.
+    """
+
+    dtypes = dict(dtypes or {})
+    if chunk.empty:
+        # A whole-file read only infers a dtype from rows
+        return dtypes
+
+    for col in key_columns:
+        values = chunk[col]
+        try:
+            parsed = pd.to_numeric(values.dropna())
+            dtype = "float64" if values.isna().any() or parsed.dtype.kind == "f" else "int64"
+        except (ValueError, TypeError):
+            dtype = "object"
+        dtypes[col] = max(dtypes.get(col, dtype), dtype, key=KEY_DTYPES.index)
+
+    return dtypes
+
+
+def restore_key_dtypes_pandas(df: pd.DataFrame, dtypes: dict) -> pd.DataFrame:
+    """Convert the text key columns of `df` that a whole-file read parses as numbers to those `dtypes`."""
+
+    for col, dtype in dtypes.items():
+        if dtype != "object" and col in df.columns:
+            df[col] = pd.to_numeric(df[col]).astype(dtype)
+
+    return df
+
+
+def sample_mask_pandas(df: pd.DataFrame, key_columns: list, percent: float) -> pd.Series:
+    """Boolean mask selecting the rows whose key hashes into the sampled buckets."""
+
+    keys = pd.DataFrame({col: normalize_key_pandas(df[col]) for col in key_columns})
+    buckets = pd.util.hash_pandas_object(keys, index=False) % HASH_BUCKETS
+
+    return buckets < percent * HASH_BUCKETS / 100
+
+
+def sample_csv_pandas(file_path: str, percent: float) -> pd.DataFrame:
+    """
+    Read a CSV in chunks and keep roughly `percent` % of its duplicate-key groups,
+    never holding more than one chunk of unsampled rows in memory.
+    """
+
+    chunks = []
+    key_columns = None
+    dtypes = None
+
+    for chunk in read_csv_chunks_pandas(file_path):
+        if key_columns is None:
+            key_columns = raw_key_columns(chunk.columns)
+        dtypes = key_dtypes_pandas(chunk, key_columns, dtypes)
+        chunks.append(chunk[sample_mask_pandas(chunk, key_columns, percent)])
+
+    return restore_key_dtypes_pandas(pd.concat(chunks, ignore_index=True), dtypes)
+
+
+def sample_filter_sql(columns, percent: float) -> str:
+    """DuckDB condition keeping the rows (with source headers `columns`) whose key hashes into the sampled buckets."""
+
+    key_expr = ", ".join(
+        f"""REGEXP_REPLACE(TRIM(CAST("{col}" AS VARCHAR)), '\\.0$', '')""" for col in raw_key_columns(columns)
+    )
+
+    return f"HASH({key_expr}) % {HASH_BUCKETS} < {percent * HASH_BUCKETS / 100}"
+
+
+def sample_csv_duckdb(con, file_path: str, table_name: str, percent: float):
+    """
+    Create `table_name` from roughly `percent` % of the duplicate-key groups in a CSV.
+    The filter is applied while DuckDB streams the file, so the full file is never materialized.
+    """
+
+    columns = con.execute(f"DESCRIBE SELECT * FROM read_csv_auto('{file_path}')").fetchdf()['column_name']
+
+    con.execute(f"""
+        CREATE OR REPLACE TABLE {table_name} AS
+        SELECT *
+        FROM read_csv_auto('{file_path}')
+        WHERE {sample_filter_sql(columns, percent)}
+    """)
+
+    return table_name
+
+
+def sample_csv_polars(file_path: str, percent: float) -> pl.LazyFrame:
+    """
+    Lazily scan a CSV keeping roughly `percent` % of its duplicate-key groups.
+    The filter is pushed into the scan, so unsampled rows are never materialized.
+    """
+
+    lf = pl.scan_csv(file_path, infer_schema_length=None)
+
+    return lf.filter(sample_filter_polars(lf.collect_schema().names(), percent))
+
+
+def sample_filter_polars(columns, percent: float) -> pl.Expr:
+    """Polars condition keeping the rows (with source headers `columns`) whose key hashes into the sampled buckets."""
+
+    keys = [
+        pl.col(col).cast(pl.String).str.strip_chars().str.replace(r"\.0$", "").fill_null("")
+        for col in raw_key_columns(columns)
+    ]
+
+    return pl.concat_str(keys, separator="\x1f").hash() % HASH_BUCKETS < percent * HASH_BUCKETS / 100
@@ -0,0 +1,295 @@
+import asyncio
+import csv
+import hashlib
+import json
+import os
+import sys
+import time
+import urllib.error
+import urllib.request
+from collections import deque
+from datetime import date, datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlencode, urlsplit
+
+from src.config import configuration
+from .enrichment import enrichment_join_keys
+from .etl import REQUIRED_COLUMNS
+from .logger import get_logger
+from .summaries import SUMMARY_KEY_COLUMNS
+
+# Extract from the NYC Open Data (Socrata SODA) API instead of a hand-downloaded CSV.
+#
+# The API is queried for the row count and the latest :updated_at first; the rows
+# bounded by that :updated_at are then fetched in :id order. The :id range is cut into
+# slices of about SOCRATA_PAGE_SIZE rows, and each slice is read with keyset pagination
+# (:id > the last :id read) rather than offsets: a row that is updated past the bound
+# during the fetch drops out without shifting any other row out of its page. Slices are
+# fetched SOCRATA_CONCURRENCY at a time and written in order to data/<file_name>
+# in the CSV export format, so extract_* and the transforms run on it unchanged.
+# Only the columns select_required_columns_* keeps are requested, plus :id.
+#
+# The :updated_at of each successful run is kept in data/<file_name>.watermark. The
+# next run only requests rows updated since then and merges them into the previous
+# snapshot by :id, with the changed rows first so drop_duplicates_* keeps them.
+# Rows removed from the dataset are only dropped by a full refresh
+# (SOCRATA_INCREMENTAL=false, or deleting the watermark file).
+
+SOCRATA_FILE_NAME = "fhv_socrata.csv"
+
+ID_FIELD = ":id"
+UPDATED_FIELD = ":updated_at"
+
+# The snapshot column holding :id (a leading colon is not a valid column name everywhere)
+ID_COLUMN = "socrata_id"
+
+# Floating timestamps the CSV export writes as MM/DD/YYYY
+DATE_COLUMNS = {"expiration_date"}
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+def required_columns() -> list:
+    return sorted(REQUIRED_COLUMNS | enrichment_join_keys())
+
+
+def snapshot_columns() -> list:
+    return [ID_COLUMN] + required_columns()
+
+
+def watermark_path(file_name: str) -> str:
+    return f"data/{file_name}.watermark"
+
+
+def read_watermark(file_name: str):
+    """Return the :updated_at the snapshot in data/<file_name> is complete up to, or None."""
+
+    if not os.path.exists(f"data/{file_name}") or not os.path.exists(watermark_path(file_name)):
+        return None
+
+    # A snapshot written with other columns cannot be merged into
+    with open(f"data/{file_name}", newline="") as f:
+        if next(csv.reader(f), None) != snapshot_columns():
+            return None
+
+    with open(watermark_path(file_name)) as f:
+        return json.load(f)["watermark"]
+
+
+def save_watermark(file_name: str, watermark: str):
+    """Record that data/<file_name> has been loaded up to `watermark`."""
+
+    with open(watermark_path(file_name), "w") as f:
+        json.dump({"watermark": watermark, "saved_at": datetime.now(timezone.utc).isoformat()}, f)
+
+
+#HTTP ----------------------------------------------------------------------------------------
+
+def recorded_page_path(directory: str, query: str) -> str:
+    return f"{directory}/{hashlib.sha1(query.encode()).hexdigest()}.json"
+
+
+def _get_json(params: dict):
+    """GET the dataset endpoint with SoQL `params`, retrying throttled and failed requests."""
+
+    query = urlencode(params)
+    headers = {"Accept": "application/json"}
+    if configuration.SOCRATA_APP_TOKEN:
+        headers["X-App-Token"] = configuration.SOCRATA_APP_TOKEN
+    request = urllib.request.Request(f"{configuration.SOCRATA_URL}?{query}", headers=headers)
+
+    for attempt in range(configuration.SOCRATA_RETRIES + 1):
+        try:
+            with urllib.request.urlopen(request, timeout=configuration.SOCRATA_TIMEOUT_SECONDS) as response:
+                body = response.read()
+            break
+        except urllib.error.HTTPError as e:
+            if e.code not in RETRY_STATUSES or attempt == configuration.SOCRATA_RETRIES:
+                raise
+        except (urllib.error.URLError, TimeoutError):
+            if attempt == configuration.SOCRATA_RETRIES:
+                raise
+        time.sleep(2 ** attempt)
+
+    if configuration.SOCRATA_RECORD_DIR:
+        os.makedirs(configuration.SOCRATA_RECORD_DIR, exist_ok=True)
+        with open(recorded_page_path(configuration.SOCRATA_RECORD_DIR, query), "wb") as f:
+            f.write(body)
+
+    return json.loads(body)
+
+
+async def _in_order(func, calls: list):
+    """
+    Run the blocking `func(*args)` for each args of `calls` in threads and yield the results in order.
+    Up to SOCRATA_CONCURRENCY calls are in flight; a finished call waits only for the ones before it.
+    """
+
+    window = deque()
+    for args in calls:
+        window.append(asyncio.create_task(asyncio.to_thread(func, *args)))
+        if len(window) >= configuration.SOCRATA_CONCURRENCY:
+            yield await window.popleft()
+
+    while window:
+        yield await window.popleft()
+
+
+def _fetch_slice(where: str, lower, upper) -> list:
+    """Fetch the rows matching `where` with lower < :id <= upper (either bound may be None), in :id order."""
+
+    select = ", ".join([ID_FIELD] + required_columns())
+    page_size = configuration.SOCRATA_PAGE_SIZE
+
+    rows = []
+    while True:
+        last = rows[-1][ID_FIELD] if rows else lower
+        conditions = [f"({where})"]
+        if last is not None:
+            conditions.append(f"{ID_FIELD} > '{last}'")
+        if upper is not None:
+            conditions.append(f"{ID_FIELD} <= '{upper}'")
+
+        page = _get_json({"$select": select, "$where": " AND ".join(conditions), "$order": ID_FIELD, "$limit": page_size})
+        rows.extend(page)
+        if len(page) < page_size:
+            return rows
+
+
+async def _fetch_pages(where: str, rows: int, write_page):
+    """
+    Fetch the rows matching `where` slice by slice and hand each slice to `write_page` in :id order.
+    The slice bounds are the :id at every SOCRATA_PAGE_SIZE-th row. Rows changing meanwhile only
+    make a slice larger or smaller: every :id falls in exactly one slice whatever the bounds are.
+    """
+
+    page_size = configuration.SOCRATA_PAGE_SIZE
+    bound_calls = [
+        ({"$select": ID_FIELD, "$where": where, "$order": ID_FIELD, "$limit": 1, "$offset": offset},)
+        for offset in range(page_size, rows, page_size)
+    ]
+    bounds = sorted({page[0][ID_FIELD] async for page in _in_order(_get_json, bound_calls) if page})
+
+    slices = list(zip([None] + bounds, bounds + [None]))
+    async for page in _in_order(_fetch_slice, [(where, lower, upper) for lower, upper in slices]):
+        write_page(page)
+
+
+#EXTRACT -------------------------------------------------------------------------------------
+
+def _export_value(column: str, value):
+    if value is None:
+        return ""
+    if column in DATE_COLUMNS:
+        return date.fromisoformat(value[:10]).strftime("%m/%d/%Y")
+    return value
+
+
+def _add_key(keys: set, values: list):
+    """Add a row's key as the transforms leave it (trimmed); rows missing part of it are never loaded."""
+
+    values = [str(value).strip() if value is not None else "" for value in values]
+    if all(values):
+        keys.add(tuple(values))
+
+
+def fetch_socrata(file_name: str):
+    """
+    Refresh data/<file_name> from the Socrata API, incrementally when a watermark is available.
+    Returns the new watermark, or None when nothing changed since the last run, and for an
+    incremental refresh the trimmed (SUMMARY_KEY_COLUMNS) keys of the rows it added or replaced.
+    """
+
+    logger = get_logger(log_level=configuration.LOG_LEVEL)
+    file_path = f"data/{file_name}"
+
+    previous = read_watermark(file_name) if configuration.SOCRATA_INCREMENTAL else None
+    since = f" AND {UPDATED_FIELD} > '{previous}'" if previous else ""
+
+    stats = _get_json({
+        "$select": f"count(*) AS row_count, max({UPDATED_FIELD}) AS watermark",
+        "$where": f"{UPDATED_FIELD} IS NOT NULL{since}",
+    })[0]
+    rows = int(stats.get("row_count", 0))
+    if not rows:
+        logger.info(f"Socrata: no rows updated since {previous}")
+        return None, None
+
+    watermark = stats["watermark"]
+    where = f"{UPDATED_FIELD} <= '{watermark}'{since}"
+    logger.info(f"Socrata: fetching {rows} rows updated {f'after {previous}' if previous else 'up to now'}")
+
+    columns = required_columns()
+    fetched_ids = set()
+    changed_keys = set()
+    tmp_path = f"data/.{file_name}.part"
+
+    try:
+        with open(tmp_path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(snapshot_columns())
+
+            def write_page(page: list):
+                for record in page:
+                    fetched_ids.add(record[ID_FIELD])
+                    _add_key(changed_keys, [record.get(col) for col in SUMMARY_KEY_COLUMNS])
+                    writer.writerow([record[ID_FIELD]] + [_export_value(col, record.get(col)) for col in columns])
+
+            asyncio.run(_fetch_pages(where, rows, write_page))
+
+            # Carry over the rows of the previous snapshot that were not updated
+            if previous:
+                positions = [snapshot_columns().index(col) for col in SUMMARY_KEY_COLUMNS]
+                with open(file_path, newline="") as snapshot:
+                    reader = csv.reader(snapshot)
+                    next(reader)
+                    for row in reader:
+                        if row[0] in fetched_ids:
+                            _add_key(changed_keys, [row[i] for i in positions])
+                        else:
+                            writer.writerow(row)
+
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+    logger.info(f"Socrata: wrote {file_path} up to {watermark}")
+
+    return watermark, frozenset(changed_keys) if previous else None
+
+
+#REPLAY --------------------------------------------------------------------------------------
+
+def serve_recorded_pages(directory: str, port: int = 8000):
+    """
+    Serve the responses recorded with SOCRATA_RECORD_DIR as a stand-in for the Socrata API.
+    Point SOCRATA_URL at http://localhost:<port>/resource/8wbx-tsch.json to replay a run offline.
+    """
+
+    logger = get_logger(log_level=configuration.LOG_LEVEL)
+
+    class RecordedPages(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            logger.debug(format % args)
+
+        def do_GET(self):
+            path = recorded_page_path(directory, urlsplit(self.path).query)
+            if not os.path.exists(path):
+                self.send_error(404, "No recorded response for this query")
+                return
+
+            with open(path, "rb") as f:
+                body = f.read()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    ThreadingHTTPServer(("localhost", port), RecordedPages).serve_forever()
+
+
+if __name__ == "__main__":
+    # python -m src.utils.socrata <record_dir> [port]
+    serve_recorded_pages(sys.argv[1], int(sys.argv[2]) if len(sys.argv) > 2 else 8000)
@@ -0,0 +1,258 @@
+from dataclasses import dataclass
+
+from sqlalchemy import inspect, text
+
+from src.config import configuration
+from .expiration import relation_kind
+from .logger import get_logger
+
+# Incrementally maintained summary of a loaded FHV table (SUMMARY_TABLES=true).
+#
+# <table>_summary holds one vehicle count per (license_type, wheelchair_accessible,
+# expiration_date). Expiration buckets are relative to today, so they are not
+# stored: the <table>_summary_by_bucket view derives them from the few summary rows
+# at query time and never goes stale.
+#
+# The summary is maintained inside the transaction that loads the table or swaps it in,
+# so it commits or rolls back with the table. A delta load (an incremental Socrata run)
+# knows the keys whose rows it changed: the rows of those keys are subtracted from the
+# summary while the previous table is still in place and added back from the new one,
+# through the key index where the load builds one, so the refresh costs about as much as
+# the change. The summary is
+# tagged (table comment) with the source version it reflects, and a delta is only applied
+# on top of the version it was taken from. Any other load rebuilds the summary with one
+# GROUP BY over the loaded table.
+
+SUMMARY_KEY_COLUMNS = ["vehicle_license_number", "dmv_license_plate_number"]
+
+# Upper bounds (days until expiration) of the buckets shown by the view
+EXPIRATION_BUCKETS = [7, 30, 90]
+
+# Keys changed by a delta load, for the duration of the load transaction
+KEYS_TABLE = "_summary_delta_keys"
+
+
+@dataclass(frozen=True)
+class SummaryDelta:
+    """
+    Where the loaded rows come from: the source version `until` (e.g. a Socrata watermark) and, for a
+    delta load, the version `since` it was applied to and the (trimmed text) keys whose rows it changed.
+    """
+
+    until: str
+    since: str = None
+    keys: frozenset = None
+
+
+def summary_table_name(table_name: str) -> str:
+    return f"{table_name}_summary"
+
+
+def _bucket_sql() -> str:
+    cases = "\n".join(
+        f"            WHEN expiration_date <= CURRENT_DATE + {days} THEN 'within_{days}_days'"
+        for days in EXPIRATION_BUCKETS
+    )
+    return f"""
+        CASE
+            WHEN expiration_date IS NULL THEN 'unknown'
+            WHEN expiration_date < CURRENT_DATE THEN 'expired'
+{cases}
+            ELSE 'later'
+        END
+    """
+
+
+def _literal(value) -> str:
+    return "NULL" if value is None else "'" + str(value).replace("'", "''") + "'"
+
+
+def _create_summary_sql(summary: str) -> str:
+    return f"""
+        CREATE TABLE IF NOT EXISTS "{summary}" (
+            license_type TEXT,
+            wheelchair_accessible TEXT,
+            expiration_date DATE,
+            vehicles BIGINT NOT NULL,
+            UNIQUE NULLS NOT DISTINCT (license_type, wheelchair_accessible, expiration_date)
+        )
+    """
+
+
+def _keys_table_sql() -> str:
+    columns = ", ".join(f"{col} TEXT" for col in SUMMARY_KEY_COLUMNS)
+    return f"CREATE TEMP TABLE {KEYS_TABLE} ({columns}) ON COMMIT DROP"
+
+
+def _add_key_counts_sql(summary: str, source: str, sign: int) -> str:
+    """
+    Add `sign` times the counts of the rows of `source` whose key is in KEYS_TABLE to the summary.
+    The text keys are cast to the key column types of `source` (keys that are no valid value of
+    that type cannot match), so the join probes the key index instead of scanning `source`.
+    """
+
+    declare = "\n".join(
+        f"""            type_{i} TEXT := (
+                SELECT format_type(atttypid, atttypmod) FROM pg_attribute
+                WHERE attrelid = to_regclass('"{source}"') AND attname = '{col}'
+            );"""
+        for i, col in enumerate(SUMMARY_KEY_COLUMNS)
+    )
+    join = " AND ".join(
+        f"""t.{col} = CASE WHEN pg_input_is_valid(k.{col}, $q$ || quote_literal(type_{i}) || $q$)
+                        THEN CAST(k.{col} AS $q$ || type_{i} || $q$) END"""
+        for i, col in enumerate(SUMMARY_KEY_COLUMNS)
+    )
+
+    return f"""
+        DO $$
+        DECLARE
+{declare}
+        BEGIN
+            EXECUTE $q$
+                INSERT INTO "{summary}" AS s (license_type, wheelchair_accessible, expiration_date, vehicles)
+                SELECT CAST(t.license_type AS TEXT),
+                       CAST(t.wheelchair_accessible AS TEXT),
+                       CAST(t.expiration_date AS DATE),
+                       {sign} * COUNT(*)
+                FROM {KEYS_TABLE} k
+                JOIN "{source}" t
+                  ON {join}
+                GROUP BY 1, 2, 3
+                ON CONFLICT (license_type, wheelchair_accessible, expiration_date)
+                DO UPDATE SET vehicles = s.vehicles + EXCLUDED.vehicles
+            $q$;
+        END $$
+    """
+
+
+def _finish_sql(table_name: str, source: str, delta: SummaryDelta, incremental: bool) -> list:
+    """Statements completing the summary once `source` holds the new rows: the delta's additions or a full rebuild."""
+
+    summary = summary_table_name(table_name)
+
+    if incremental:
+        statements = [
+            _add_key_counts_sql(summary, source, 1),
+            f'DELETE FROM "{summary}" WHERE vehicles = 0',
+        ]
+    else:
+        statements = [
+            _create_summary_sql(summary),
+            f'TRUNCATE "{summary}"',
+            f"""
+                INSERT INTO "{summary}" (license_type, wheelchair_accessible, expiration_date, vehicles)
+                SELECT CAST(license_type AS TEXT),
+                       CAST(wheelchair_accessible AS TEXT),
+                       CAST(expiration_date AS DATE),
+                       COUNT(*)
+                FROM "{source}"
+                GROUP BY 1, 2, 3
+            """,
+        ]
+
+    return statements + [
+        f'COMMENT ON TABLE "{summary}" IS {_literal(delta.until if delta else None)}',
+        f"""
+            CREATE OR REPLACE VIEW "{summary}_by_bucket" AS
+            SELECT license_type,
+                   wheelchair_accessible,
+                   {_bucket_sql()} AS expiration_bucket,
+                   SUM(vehicles) AS vehicles
+            FROM "{summary}"
+            GROUP BY 1, 2, 3
+        """,
+    ]
+
+
+def delta_applies(conn, table_name: str, target: str, delta: SummaryDelta) -> bool:
+    """Whether the summary of `table_name` reflects exactly the version `delta` was taken from, with `target` loaded."""
+
+    if delta is None or delta.keys is None or delta.since is None:
+        return False
+
+    summary = summary_table_name(table_name)
+    if relation_kind(conn, target) not in ("r", "p") or not inspect(conn).has_table(summary):
+        return False
+
+    tag = conn.execute(text("SELECT obj_description(to_regclass(:name), 'pg_class')"), {"name": f'"{summary}"'}).scalar()
+    return tag == delta.since
+
+
+def _log(table_name: str, delta: SummaryDelta, incremental: bool):
+    summary = summary_table_name(table_name)
+    if incremental:
+        message = f"applied the changes of {len(delta.keys)} keys ({delta.since} -> {delta.until})"
+    else:
+        message = "rebuilt from the loaded table"
+    get_logger(log_level=configuration.LOG_LEVEL).info(f"Summary {summary}: {message}")
+
+
+#LOAD ----------------------------------------------------------------------------------------
+# Both halves run in the load's transaction: retract_summary while `target` still holds the
+# previous rows, refresh_summary once it holds the new ones.
+
+def retract_summary(conn, table_name: str, target: str, delta: SummaryDelta = None) -> bool:
+    """
+    Subtract the rows of `target` that `delta` changes from the summary, when the delta applies.
+    Returns whether it did, i.e. whether refresh_summary can finish incrementally.
+    """
+
+    if not delta_applies(conn, table_name, target, delta):
+        return False
+
+    conn.execute(text(_keys_table_sql()))
+    if delta.keys:
+        columns = ", ".join(SUMMARY_KEY_COLUMNS)
+        values = ", ".join(f":{col}" for col in SUMMARY_KEY_COLUMNS)
+        conn.execute(
+            text(f"INSERT INTO {KEYS_TABLE} ({columns}) VALUES ({values})"),
+            [dict(zip(SUMMARY_KEY_COLUMNS, key)) for key in delta.keys]
+        )
+    conn.execute(text(_add_key_counts_sql(summary_table_name(table_name), target, -1)))
+
+    return True
+
+
+def refresh_summary(conn, table_name: str, target: str, delta: SummaryDelta = None, incremental: bool = False):
+    """Bring the summary of `table_name` up to the rows now in `target`."""
+
+    for statement in _finish_sql(table_name, target, delta, incremental):
+        conn.execute(text(statement))
+
+    _log(table_name, delta, incremental)
+
+
+#DUCKDB --------------------------------------------------------------------------------------
+# The same statements, sent through postgres_execute inside the DuckDB transaction that
+# writes `target` over the attached database.
+
+def _execute_duckdb(con, statement: str, alias: str):
+    con.execute(f"CALL postgres_execute('{alias}', {_literal(statement)})")
+
+
+def retract_summary_duckdb(con, engine, table_name: str, target: str, delta: SummaryDelta = None,
+                           alias: str = "postgres_db") -> bool:
+    """retract_summary in the current DuckDB transaction on the attached database."""
+
+    with engine.connect() as conn:
+        if not delta_applies(conn, table_name, target, delta):
+            return False
+
+    _execute_duckdb(con, _keys_table_sql(), alias)
+    if delta.keys:
+        values = ", ".join("(" + ", ".join(_literal(value) for value in key) + ")" for key in delta.keys)
+        _execute_duckdb(con, f"INSERT INTO {KEYS_TABLE} VALUES {values}", alias)
+    _execute_duckdb(con, _add_key_counts_sql(summary_table_name(table_name), target, -1), alias)
+
+    return True
+
+
+def refresh_summary_duckdb(con, table_name: str, target: str, delta: SummaryDelta = None, incremental: bool = False,
+                           alias: str = "postgres_db"):
+    """refresh_summary in the current DuckDB transaction on the attached database."""
+
+    for statement in _finish_sql(table_name, target, delta, incremental):
+        _execute_duckdb(con, statement, alias)
+
+    _log(table_name, delta, incremental)
@@ -1,4 +1,5 @@
 import pandas as pd
+import polars as pl
 import duckdb
 
 def standardize_column_names_pandas(df: pd.DataFrame) -> pd.DataFrame:
@@ -36,8 +37,8 @@ def drop_duplicates_pandas(df: pd.DataFrame) -> pd.DataFrame:
     return df.drop_duplicates(subset=["vehicle_license_number", "dmv_license_plate_number"])
 
 
-def select_required_columns_pandas(df: pd.DataFrame) -> pd.DataFrame:
-    """Keep only required columns."""
+def select_required_columns_pandas(df: pd.DataFrame, extra_columns: list = ()) -> pd.DataFrame:
+    """Keep only required columns, plus `extra_columns` (e.g. enrichment join keys)."""
 
     columns_to_keep = [
         "vehicle_license_number",
@@ -49,7 +50,7 @@ def select_required_columns_pandas(df: pd.DataFrame) -> pd.DataFrame:
         "active"
     ]
 
-    return df[columns_to_keep]
+    return df[columns_to_keep + [col for col in extra_columns if col not in columns_to_keep]].copy()
 
 
 def drop_missing_key_ids_pandas(df: pd.DataFrame) -> pd.DataFrame:
@@ -116,19 +117,21 @@ def trim_text_columns_duckdb(con, table_name: str):
 
 
 def drop_duplicates_duckdb(con, table_name: str):
-    """Remove duplicate rows."""
+    """Keep the first row per `vehicle_license_number` and `dmv_license_plate_number`."""
 
     con.execute(f"""
         CREATE OR REPLACE TABLE {table_name} AS
-        SELECT DISTINCT *
-        FROM {table_name}
+        SELECT * EXCLUDE (_row)
+        FROM (SELECT *, rowid AS _row FROM {table_name})
+        QUALIFY ROW_NUMBER() OVER (PARTITION BY vehicle_license_number, dmv_license_plate_number ORDER BY _row) = 1
+        ORDER BY _row
     """)
 
     return table_name
 
 
-def select_required_columns_duckdb(con, table_name: str):
-    """Keep only the required columns."""
+def select_required_columns_duckdb(con, table_name: str, extra_columns: list = ()):
+    """Keep only the required columns, plus `extra_columns` (e.g. enrichment join keys)."""
 
     cols = [
         "vehicle_license_number",
@@ -139,6 +142,7 @@ def select_required_columns_duckdb(con, table_name: str):
         "wheelchair_accessible",
         "active"
     ]
+    cols += [col for col in extra_columns if col not in cols]
 
     con.execute(f"""
         CREATE OR REPLACE TABLE {table_name} AS
@@ -177,3 +181,64 @@ def add_days_until_expiration_duckdb(con, table_name: str):
     """)
 
     return table_name
+
+
+#-------------------------------------------------------------------------------------------
+#---------- POLARS --------------------------------------------------------------------------
+
+def standardize_column_names_polars(lf: pl.LazyFrame) -> pl.LazyFrame:
+    """Standardize column names -> all lowercase, spaces replaced with underscores."""
+
+    return lf.rename({col: col.lower().replace(" ", "_") for col in lf.collect_schema().names()})
+
+
+def convert_expiration_date_polars(lf: pl.LazyFrame) -> pl.LazyFrame:
+    """Convert `expiration_date` column to a proper datetime type."""
+
+    return lf.with_columns(
+        pl.col("expiration_date").cast(pl.String).str.strptime(pl.Datetime("ns"), "%m/%d/%Y", strict=False)
+    )
+
+
+def trim_text_columns_polars(lf: pl.LazyFrame) -> pl.LazyFrame:
+    """Trim whitespace from all text columns."""
+
+    return lf.with_columns(pl.col(pl.String).str.strip_chars())
+
+
+def drop_duplicates_polars(lf: pl.LazyFrame) -> pl.LazyFrame:
+    """Drop duplicates based on `vehicle_license_number` and `dmv_license_plate_number`."""
+
+    return lf.unique(subset=["vehicle_license_number", "dmv_license_plate_number"], keep="first", maintain_order=True)
+
+
+def select_required_columns_polars(lf: pl.LazyFrame, extra_columns: list = ()) -> pl.LazyFrame:
+    """Keep only required columns, plus `extra_columns` (e.g. enrichment join keys)."""
+
+    columns_to_keep = [
+        "vehicle_license_number",
+        "license_type",
+        "dmv_license_plate_number",
+        "vehicle_vin_number",
+        "expiration_date",
+        "wheelchair_accessible",
+        "active"
+    ]
+
+    return lf.select(columns_to_keep + [col for col in extra_columns if col not in columns_to_keep])
+
+
+def drop_missing_key_ids_polars(lf: pl.LazyFrame) -> pl.LazyFrame:
+    """Drop rows with missing `vehicle_license_number` or `dmv_license_plate_number`."""
+
+    return lf.drop_nulls(subset=["vehicle_license_number", "dmv_license_plate_number"])
+
+
+def add_days_until_expiration_polars(lf: pl.LazyFrame) -> pl.LazyFrame:
+    """Add a `days_until_expiration` column (whole days, floored like pandas `.dt.days`)."""
+
+    until = pl.col("expiration_date") - pl.lit(pd.Timestamp.now().to_pydatetime())
+
+    return lf.with_columns(
+        (until.dt.total_microseconds() // 86_400_000_000).alias("days_until_expiration")
+    )
@@ -0,0 +1,64 @@
+import fnmatch
+import os
+import time
+
+from src.config import configuration
+from .logger import get_logger
+
+
+def snapshot_directory(directory: str, pattern: str) -> dict:
+    """Return {file_name: (size, mtime)} for the files in `directory` matching `pattern`."""
+
+    files = {}
+    for entry in os.scandir(directory):
+        if entry.is_file() and fnmatch.fnmatch(entry.name, pattern):
+            stat = entry.stat()
+            files[entry.name] = (stat.st_size, stat.st_mtime)
+
+    return files
+
+
+def watch_directory(directory: str, pattern: str, handler, poll_seconds: float,
+                    process_existing: bool = False):
+    """
+    Poll `directory` forever and call `handler(file_name)` for every new or changed file.
+    A file is handed over once its size and mtime are unchanged between two polls,
+    so files that are still being written are not picked up half-way.
+    A failing handler is logged and the file is not retried until it changes again.
+    A file that is removed is forgotten, so one created again under its name counts as new.
+    """
+
+    logger = get_logger(log_level=configuration.LOG_LEVEL)
+
+    seen = {} if process_existing else snapshot_directory(directory, pattern)
+    pending = {}
+
+    logger.info(f"Watching {directory}/{pattern} every {poll_seconds}s")
+
+    while True:
+        current = snapshot_directory(directory, pattern)
+
+        # Forget files that were removed or renamed, e.g. temp files renamed into place
+        for tracked in (seen, pending):
+            for name in tracked.keys() - current.keys():
+                del tracked[name]
+
+        for name, stat in current.items():
+            if seen.get(name) == stat:
+                continue
+
+            if pending.get(name) != stat:
+                pending[name] = stat
+                continue
+
+            del pending[name]
+            seen[name] = stat
+
+            started = time.perf_counter()
+            try:
+                handler(name)
+                logger.info(f"Processed {name} in {time.perf_counter() - started:.3f}s")
+            except Exception as e:
+                logger.error(f"Processing {name} failed. Error: {str(e)}")
+
+        time.sleep(poll_seconds)
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# Use the environment as is instead of local.env, and make `src` importable
+os.environ.setdefault("STAGE", "test")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,100 @@
+import os
+import subprocess
+import sys
+import time
+
+import pandas as pd
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from src.config import configuration
+from src.utils.db import get_connection
+from src.utils.etl import transform_pandas
+from src.utils.jobs import JOB_TABLE, run_coordinator
+from test_partition import write_fhv_csv
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Local multi-worker run against the database in DB_* (e.g. the docker compose one):
+#   python -m pytest tests/test_jobs.py
+
+
+@pytest.fixture
+def engine():
+    if not configuration.DB_HOST:
+        pytest.skip("no database to run the job table on")
+
+    engine = get_connection()
+    try:
+        with engine.connect():
+            pass
+    except OperationalError:
+        pytest.skip("no database to run the job table on")
+
+    return engine
+
+
+def start_worker(data_dir, transform_engine: str) -> subprocess.Popen:
+    """Start a RUN_MODE=worker process in `data_dir` and wait until it is up."""
+
+    env = {
+        **os.environ,
+        "STAGE": "test",
+        "PYTHONPATH": PROJECT_DIR,
+        "RUN_MODE": "worker",
+        "TRANSFORM_ENGINE": transform_engine,
+        "JOB_POLL_SECONDS": "0.2",
+        "JOB_IDLE_SECONDS": "5",
+    }
+
+    log_path = data_dir / f"worker_{transform_engine}.log"
+    with open(log_path, "w") as log:
+        worker = subprocess.Popen([sys.executable, "-m", "src.app"], cwd=data_dir, env=env, stderr=log)
+
+    deadline = time.monotonic() + 60
+    while "Starting" not in log_path.read_text():
+        assert worker.poll() is None and time.monotonic() < deadline, log_path.read_text()
+        time.sleep(0.1)
+
+    return worker
+
+
+def test_workers_with_different_engines_load_every_shard_once(tmp_path, monkeypatch, engine):
+    # Shards whose inferred dtypes differ: an all-blank wheelchair_accessible in the first file,
+    # text values and a text key in the last one, and keys repeated across files
+    (tmp_path / "data").mkdir()
+    first = tmp_path / "data" / "fhv_1.csv"
+    write_fhv_csv(first, [str(5_000_000 + i) for i in range(3000)])
+    last = tmp_path / "data" / "fhv_2.csv"
+    write_fhv_csv(last, [str(5_000_000 + i) for i in range(1500)] + [str(5_010_000 + i) for i in range(1499)] + ["ABC123"])
+    with_wav = pd.read_csv(last, dtype=str)
+    with_wav["Wheelchair Accessible"] = "WAV"
+    with_wav.to_csv(last, index=False)
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(configuration, "TRANSFORM_ENGINE", "duckdb")
+    monkeypatch.setattr(configuration, "JOB_SHARD_MB", 0.05)
+    monkeypatch.setattr(configuration, "JOB_POLL_SECONDS", 0.2)
+
+    workers = [start_worker(tmp_path, "pandas"), start_worker(tmp_path, "polars")]
+    try:
+        run_coordinator(engine, "fhv_*.csv")
+    finally:
+        for worker in workers:
+            worker.wait(timeout=60)
+
+    columns = ["vehicle_license_number", "dmv_license_plate_number", "wheelchair_accessible"]
+    expected = transform_pandas(pd.concat([pd.read_csv(first, dtype=str), pd.read_csv(last, dtype=str)]))
+    expected = expected[columns].fillna("").astype(str).sort_values(columns).reset_index(drop=True)
+
+    with engine.connect() as conn:
+        loaded = pd.read_sql(text(f"SELECT {', '.join(columns)} FROM fhv_active_cleaned"), conn)
+        run_workers = conn.execute(text(f"""
+            SELECT COUNT(DISTINCT worker) FROM {JOB_TABLE}
+            WHERE run_id = (SELECT run_id FROM {JOB_TABLE} ORDER BY created_at DESC LIMIT 1)
+        """)).scalar()
+    loaded = loaded.fillna("").astype(str).sort_values(columns).reset_index(drop=True)
+
+    pd.testing.assert_frame_equal(loaded, expected)
+    assert run_workers > 1
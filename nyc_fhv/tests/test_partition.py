@@ -0,0 +1,55 @@
+import pandas as pd
+import pytest
+
+from src.config import configuration
+from src.utils.etl import plan_steps, transform_pandas
+from src.utils.partition import transform_partitioned_pandas
+from src.utils.sampling import read_csv_chunks_pandas
+
+
+def write_fhv_csv(path, license_numbers: list):
+    rows = len(license_numbers)
+    pd.DataFrame({
+        "Active": "YES",
+        "Vehicle License Number": license_numbers,
+        "License Type": "FOR HIRE VEHICLE",
+        "Expiration Date": "02/16/2030",
+        "DMV License Plate Number": [f" T{i % 900:06d}C " for i in range(rows)],
+        "Vehicle VIN Number": [f"VIN{i}" for i in range(rows)],
+        "Wheelchair Accessible": None,
+    }).to_csv(path, index=False)
+
+
+@pytest.mark.parametrize("late_key", [None, "ABC123"])
+def test_partitioned_matches_single_read_when_key_dtype_differs_between_chunks(tmp_path, monkeypatch, late_key):
+    # Numeric license numbers (with a missing one) in the first chunks, optionally a text one in the last
+    numbers = [str(5_000_000 + i % 900) for i in range(2500)]
+    numbers[10] = ""
+    if late_key:
+        numbers[2400] = late_key
+    path = tmp_path / "fhv.csv"
+    write_fhv_csv(path, numbers)
+    monkeypatch.setattr(configuration, "PARALLEL_BUCKETS", 4)
+
+    expected = transform_pandas(pd.read_csv(path, low_memory=False))
+    result = transform_partitioned_pandas(read_csv_chunks_pandas(path, 1000), plan_steps("pandas"), text_keys=True)
+
+    pd.testing.assert_frame_equal(result.reset_index(drop=True), expected.reset_index(drop=True))
+
+
+@pytest.mark.parametrize("sample_percent", [0, 0.0001])
+def test_partitioned_returns_empty_result_without_rows(tmp_path, monkeypatch, sample_percent):
+    # A header-only file, or a sample that keeps no key group of a small file
+    path = tmp_path / "fhv.csv"
+    write_fhv_csv(path, [] if not sample_percent else ["5000001", "5000002"])
+    monkeypatch.setattr(configuration, "PARALLEL_BUCKETS", 4)
+    monkeypatch.setattr(configuration, "SAMPLE_PERCENT", sample_percent)
+
+    result = transform_partitioned_pandas(read_csv_chunks_pandas(path, 1000), plan_steps("pandas"), text_keys=True)
+
+    expected = transform_pandas(pd.read_csv(path, low_memory=False)).head(0)
+    assert result.empty
+    if sample_percent:
+        assert result.columns.tolist() == expected.columns.tolist()
+    else:
+        pd.testing.assert_frame_equal(result.reset_index(drop=True), expected.reset_index(drop=True))
@@ -0,0 +1,67 @@
+import csv
+import os
+import socket
+import threading
+
+import pytest
+
+from src.config import configuration
+from src.utils.socrata import fetch_socrata, save_watermark, serve_recorded_pages, snapshot_columns
+
+# Responses recorded (SOCRATA_RECORD_DIR) from a 12-row dataset with SOCRATA_PAGE_SIZE=5 and
+# SOCRATA_CONCURRENCY=2: a full fetch at 2025-10-01, then an incremental one at 2025-10-02
+# after row-0002 was touched, row-0007 got a new plate and row-0012 was added.
+PAGES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "socrata_pages")
+
+FILE_NAME = "fhv_socrata.csv"
+
+
+@pytest.fixture
+def recorded_api(tmp_path, monkeypatch):
+    with socket.socket() as s:
+        s.bind(("localhost", 0))
+        port = s.getsockname()[1]
+    threading.Thread(target=serve_recorded_pages, args=(PAGES_DIR, port), daemon=True).start()
+
+    (tmp_path / "data").mkdir()
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(configuration, "SOCRATA_URL", f"http://localhost:{port}/resource/8wbx-tsch.json")
+    monkeypatch.setattr(configuration, "SOCRATA_APP_TOKEN", None)
+    monkeypatch.setattr(configuration, "SOCRATA_RECORD_DIR", None)
+    monkeypatch.setattr(configuration, "SOCRATA_PAGE_SIZE", 5)
+    monkeypatch.setattr(configuration, "SOCRATA_CONCURRENCY", 2)
+    monkeypatch.setattr(configuration, "SOCRATA_INCREMENTAL", True)
+    monkeypatch.setattr(configuration, "SOCRATA_RETRIES", 0)
+
+
+def read_snapshot() -> list:
+    with open(f"data/{FILE_NAME}", newline="") as f:
+        return list(csv.DictReader(f))
+
+
+def test_full_then_incremental_fetch(recorded_api):
+    watermark, changed_keys = fetch_socrata(FILE_NAME)
+
+    assert watermark == "2025-10-01T00:00:00.000Z"
+    assert changed_keys is None
+    rows = read_snapshot()
+    assert list(rows[0]) == snapshot_columns()
+    assert [row["socrata_id"] for row in rows] == [f"row-{i:04d}" for i in range(12)]
+    assert rows[0]["expiration_date"] == "02/16/2027"
+
+    save_watermark(FILE_NAME, watermark)
+    watermark, changed_keys = fetch_socrata(FILE_NAME)
+
+    assert watermark == "2025-10-02T00:00:00.000Z"
+    # Both the replaced and the new key of row-0007
+    assert changed_keys == {
+        ("5000102", "T000102C"),
+        ("5000107", "T000107C"),
+        ("5000107", "T999999C"),
+        ("5000200", "T000200C"),
+    }
+    rows = read_snapshot()
+    ids = [row["socrata_id"] for row in rows]
+    assert ids[:3] == ["row-0002", "row-0007", "row-0012"]
+    assert sorted(ids) == [f"row-{i:04d}" for i in range(13)]
+    assert rows[1]["dmv_license_plate_number"] == "T999999C"
@@ -1,7 +1,9 @@
+import duckdb
+
 from datetime import date, datetime, timezone
 
 from src.config import configuration
-from src.utils.db import get_connection
+from src.utils.db import get_connection, attach_postgres_duckdb
 
 from src.utils.logger import get_logger
 
@@ -9,25 +11,49 @@ from src.utils.etl import (
     # etl functions that you will create
     extract_pandas,
     extract_duckdb,
+    extract_polars,
     load_pandas,
     load_csv_pandas,
     load_parquet_pandas,
+    load_warehouse_pandas,
+    load_fanout_pandas,
     load_duckdb,
     load_csv_duckdb,
     load_parquet_duckdb,
+    load_warehouse_duckdb,
+    load_fanout_duckdb,
+    load_polars,
+    load_csv_polars,
+    load_parquet_polars,
+    load_warehouse_polars,
+    load_fanout_polars,
     transform_pandas,
-    transform_duckdb
+    transform_duckdb,
+    transform_polars
+)
+from src.utils.profiler import (
+    profile_pandas,
+    profile_duckdb,
+    check_profile
 )
+from src.utils.star_schema import (
+    load_star_schema_pandas,
+    load_star_schema_duckdb
+)
+from src.utils.query_profile import profile_queries
+from src.utils.engine_select import resolve_engine
+from src.utils.watcher import watch_directory
 
-def main():
+def run_pipeline(file_name: str, engine, con=None):
+    """Run the ETL for one input file; `con` reuses an open DuckDB connection."""
     logger = get_logger(log_level=configuration.LOG_LEVEL)
-    engine = get_connection()
-    logger.info("Starting")
+    transform_engine = resolve_engine(file_name)
+    print("TRANSFORM_ENGINE is", transform_engine)
 
     ### ETL Functions here
-    if configuration.TRANSFORM_ENGINE == "pandas":
+    if transform_engine == "pandas":
 
-        df = extract_pandas(configuration.FILE_NAME)
+        df = extract_pandas(file_name)
         logger.debug(df.shape)
         logger.debug(df.columns)
 
@@ -37,26 +63,113 @@ def main():
         print("Preview of transformed data:")
         print(df.head(5))
 
-        load_csv_pandas(df, "producthierarchy_clean.csv")
-        load_parquet_pandas(df, "producthierarchy_clean.parquet")
-        load_pandas(df, engine)
+        if configuration.PROFILE_DATA:
+            check_profile(profile_pandas(df), "producthierarchy_profile.json")
+
+        if configuration.OUTPUT_MODE == "star":
+            tables = load_star_schema_pandas(df, engine)
+            for name, table in tables.items():
+                load_csv_pandas(table, f"{name}.csv")
+                load_parquet_pandas(table, f"{name}.parquet")
+        elif configuration.LOAD_FANOUT:
+            load_fanout_pandas(df, engine)
+        else:
+            load_csv_pandas(df, "producthierarchy_clean.csv")
+            if configuration.PARQUET_LAYOUT == "warehouse":
+                load_warehouse_pandas(df, "producthierarchy_clean")
+            else:
+                load_parquet_pandas(df, "producthierarchy_clean.parquet", key="product_id")
+            load_pandas(df, engine)
     
-    elif configuration.TRANSFORM_ENGINE == "duckdb":
+    elif transform_engine == "duckdb":
+
+        # PROFILE_QUERIES records every statement of the run, from the extract to the load
+        with profile_queries(con or duckdb.connect(database=":memory:"), "producthierarchy_duckdb_query_profile.json") as con:
+            con, table_name = extract_duckdb(f"data/{file_name}", table_name="product_hierarchy", con=con)
+
+            con, table_name = transform_duckdb(con, table_name)
+
+            df_preview = con.execute(f"SELECT * FROM {table_name} LIMIT 5").fetchdf()
+            print("Columns after transform:", df_preview.columns.tolist())
+            print("Preview of transformed data:")
+            print(df_preview)
+
+            if configuration.PROFILE_DATA:
+                check_profile(profile_duckdb(con, table_name), "producthierarchy_profile.json")
+
+            if configuration.OUTPUT_MODE == "star":
+                for name in load_star_schema_duckdb(con, table_name):
+                    load_csv_duckdb(con, name, f"{name}.csv")
+                    load_parquet_duckdb(con, name, f"{name}.parquet")
+            elif configuration.LOAD_FANOUT:
+                load_fanout_duckdb(con, table_name, engine)
+            else:
+                load_csv_duckdb(con, table_name, "producthierarchy_clean.csv")
+                if configuration.PARQUET_LAYOUT == "warehouse":
+                    load_warehouse_duckdb(con, table_name, "producthierarchy_clean")
+                else:
+                    load_parquet_duckdb(con, table_name, "producthierarchy_clean.parquet", key="product_id")
+                load_duckdb(con, table_name, engine)
+
+    elif transform_engine == "polars":
+
+        # Run the plan once; the preview, the profile and every output reuse the collected frame
+        df = transform_polars(extract_polars(file_name)).collect()
+        lf = df.lazy()
+
+        print("Columns after transform:", df.columns)
+        print("Preview of transformed data:")
+        print(df.head(5))
 
-        con, table_name = extract_duckdb(f"data/{configuration.FILE_NAME}", table_name="product_hierarchy")
+        if configuration.PROFILE_DATA:
+            check_profile(profile_pandas(df.to_pandas()), "producthierarchy_profile.json")
+
+        if configuration.OUTPUT_MODE == "star":
+            tables = load_star_schema_pandas(df.to_pandas(), engine)
+            for name, table in tables.items():
+                load_csv_pandas(table, f"{name}.csv")
+                load_parquet_pandas(table, f"{name}.parquet")
+        elif configuration.LOAD_FANOUT:
+            load_fanout_polars(lf, engine)
+        else:
+            load_csv_polars(lf, "producthierarchy_clean.csv")
+            if configuration.PARQUET_LAYOUT == "warehouse":
+                load_warehouse_polars(lf, "producthierarchy_clean")
+            else:
+                load_parquet_polars(lf, "producthierarchy_clean.parquet", key="product_id")
+            load_polars(lf, engine)
+
+
+def run_daemon(engine):
+    """
+    Keep the interpreter, the connection pool and an attached DuckDB connection warm,
+    and run the ETL for every file that lands in data/.
+    """
+    con = None
+    if configuration.TRANSFORM_ENGINE in ("duckdb", "auto"):
+        con = duckdb.connect(database=":memory:")
+        attach_postgres_duckdb(con)
+
+    watch_directory(
+        "data",
+        configuration.DAEMON_FILE_PATTERN,
+        lambda file_name: run_pipeline(file_name, engine, con),
+        configuration.DAEMON_POLL_SECONDS,
+        process_existing=configuration.DAEMON_PROCESS_EXISTING
+    )
 
-        con, table_name = transform_duckdb(con, table_name)
 
-        df_preview = con.execute(f"SELECT * FROM {table_name} LIMIT 5").fetchdf()
-        print("Columns after transform:", df_preview.columns.tolist())
-        print("Preview of transformed data:")
-        print(df_preview)
+def main():
+    logger = get_logger(log_level=configuration.LOG_LEVEL)
+    engine = get_connection()
+    logger.info("Starting")
 
-        load_csv_duckdb(con, table_name, "producthierarchy_clean.csv")
-        load_parquet_duckdb(con, table_name, "producthierarchy_clean.parquet")
-        load_duckdb(con, table_name, table_name)
-    
-    print("TRANSFORM_ENGINE is", configuration.TRANSFORM_ENGINE)
+    print("OUTPUT_MODE is", configuration.OUTPUT_MODE)
+
+    if configuration.RUN_MODE == "daemon":
+        run_daemon(engine)
+    else:
+        run_pipeline(configuration.FILE_NAME, engine)
 
 
 
@@ -31,9 +31,61 @@ class Config(object):
     LOG_LEVEL = int(os.environ.get("LOG_LEVEL", 20))
     FILE_NAME = os.getenv("FILE_NAME")
 
+    # "batch" processes FILE_NAME once, "daemon" keeps running and processes new files in data/
+    RUN_MODE = os.getenv("RUN_MODE")
+    if RUN_MODE not in ("batch", "daemon"):
+        RUN_MODE = "batch"
+    DAEMON_FILE_PATTERN = os.getenv("DAEMON_FILE_PATTERN", "*.csv")
+    DAEMON_POLL_SECONDS = float(os.getenv("DAEMON_POLL_SECONDS", 0.5))
+    DAEMON_PROCESS_EXISTING = os.getenv("DAEMON_PROCESS_EXISTING", "false").lower() == "true"
+
+    # "direct" replaces the live table in place, "bulk" loads an UNLOGGED staging table
+    # (synchronous_commit off, indexes built afterwards) and swaps it in with one rename
+    LOAD_PROFILE = os.getenv("LOAD_PROFILE")
+    if LOAD_PROFILE not in ("direct", "bulk"):
+        LOAD_PROFILE = "direct"
+    BULK_MAINTENANCE_WORK_MEM = os.getenv("BULK_MAINTENANCE_WORK_MEM", "1GB")
+
+    # "auto" picks pandas, polars or duckdb per input file from its size and the free memory/cores
     TRANSFORM_ENGINE = os.getenv("TRANSFORM_ENGINE")
-    if TRANSFORM_ENGINE not in ("pandas", "duckdb"):
-        TRANSFORM_ENGINE = "pandas"
+    if TRANSFORM_ENGINE not in ("pandas", "duckdb", "polars", "auto"):
+        TRANSFORM_ENGINE = "auto"
+    AUTO_ENGINE_MEMORY_FRACTION = float(os.getenv("AUTO_ENGINE_MEMORY_FRACTION", 0.6))
+    AUTO_ENGINE_PANDAS_MAX_MB = float(os.getenv("AUTO_ENGINE_PANDAS_MAX_MB", 256))
+
+    # "wide" writes one denormalized table, "star" writes dimension + fact tables
+    OUTPUT_MODE = os.getenv("OUTPUT_MODE")
+    if OUTPUT_MODE not in ("wide", "star"):
+        OUTPUT_MODE = "wide"
+
+    # Rows per Parquet row group; smaller groups make single-key lookups decode less data
+    PARQUET_ROW_GROUP_SIZE = int(os.getenv("PARQUET_ROW_GROUP_SIZE", 10_000))
+
+    # "file" overwrites one Parquet file per run, "warehouse" appends only the changed rows
+    # under data/warehouse/<dataset>/ and publishes them with a versioned manifest
+    PARQUET_LAYOUT = os.getenv("PARQUET_LAYOUT")
+    if PARQUET_LAYOUT not in ("file", "warehouse"):
+        PARQUET_LAYOUT = "file"
+    WAREHOUSE_COMPACT_FILES = int(os.getenv("WAREHOUSE_COMPACT_FILES", 8))
+    WAREHOUSE_KEEP_VERSIONS = int(os.getenv("WAREHOUSE_KEEP_VERSIONS", 5))
+    # Unreferenced parts younger than this may belong to a write or compaction not published yet
+    WAREHOUSE_PART_GRACE_SECONDS = float(os.getenv("WAREHOUSE_PART_GRACE_SECONDS", 3600))
+
+    # Write the CSV, Parquet and Postgres outputs of a wide run from one pass over the result,
+    # each in its own thread; at most FANOUT_QUEUE_BATCHES batches are buffered per output
+    LOAD_FANOUT = os.getenv("LOAD_FANOUT", "false").lower() == "true"
+    FANOUT_BATCH_ROWS = int(os.getenv("FANOUT_BATCH_ROWS", 65_536))
+    FANOUT_QUEUE_BATCHES = int(os.getenv("FANOUT_QUEUE_BATCHES", 4))
+
+    # Snap near-duplicate brand/category spellings to data/reference/*.csv
+    CANONICALIZE = os.getenv("CANONICALIZE", "false").lower() == "true"
+    CANONICAL_MATCH_THRESHOLD = float(os.getenv("CANONICAL_MATCH_THRESHOLD", 0.8))
+
+    # Profile the final result and fail the run when a data-quality threshold is breached
+    PROFILE_DATA = os.getenv("PROFILE_DATA", "false").lower() == "true"
+
+    # Record DuckDB's JSON profile of every statement the DuckDB transform steps run
+    PROFILE_QUERIES = os.getenv("PROFILE_QUERIES", "false").lower() == "true"
 
 
 @lru_cache
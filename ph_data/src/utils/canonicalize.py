@@ -0,0 +1,188 @@
+import os
+import re
+from collections import Counter
+
+import pandas as pd
+import polars as pl
+
+# Fuzzy canonicalization of brand/category spellings against curated reference lists.
+# Reference values are indexed by character trigram (inverted index), so each lookup only
+# scores the references sharing at least one trigram with the value instead of all of them.
+# Results are cached per distinct value and threshold, so every spelling is matched once per process.
+# An index is rebuilt, with an empty cache, when its reference file's size or mtime changes,
+# so a daemon picks up edits to data/reference/ on its next run.
+
+REFERENCE_FILES = {
+    "brand": "data/reference/brands.csv",
+    "category": "data/reference/categories.csv",
+    "subcategory": "data/reference/subcategories.csv",
+}
+
+# reference file -> (fingerprint, trigram index)
+_INDEX_CACHE = {}
+
+
+def file_fingerprint(path: str) -> str:
+    """Size and modification time of `path`, which change whenever the file is rewritten."""
+
+    stat = os.stat(path)
+    return f"{stat.st_size}-{stat.st_mtime_ns}"
+
+
+def normalize_for_match(value: str) -> str:
+    """
+    Lowercase, drop punctuation without leaving a gap ("Brit-annia" and "Britannia" normalize alike)
+    and collapse whitespace to single spaces.
+    """
+
+    return re.sub(r"\s+", " ", re.sub(r"[^0-9a-z\s]+", "", value.lower())).strip()
+
+
+def trigrams(value: str) -> set:
+    """Character trigrams of a normalized value, padded so short values still match."""
+
+    padded = f"  {value} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def build_trigram_index(reference: list) -> dict:
+    """
+    Index the reference values by trigram.
+    Returns the values, their trigram sets, the inverted index and an empty match cache.
+    """
+
+    values = list(dict.fromkeys(v for v in reference if isinstance(v, str) and v))
+    normalized = [normalize_for_match(v) for v in values]
+    grams = [trigrams(n) for n in normalized]
+
+    inverted = {}
+    for ref_id, ref_grams in enumerate(grams):
+        for gram in ref_grams:
+            inverted.setdefault(gram, []).append(ref_id)
+
+    return {
+        "values": values,
+        "exact": {n: v for n, v in zip(normalized, values)},
+        "grams": grams,
+        "inverted": inverted,
+        "cache": {},
+    }
+
+
+def load_reference_index(column: str) -> dict:
+    """Return the trigram index for a column's reference file, built again whenever the file changes."""
+
+    file_path = REFERENCE_FILES[column]
+    fingerprint = file_fingerprint(file_path)
+
+    cached = _INDEX_CACHE.get(file_path)
+    if cached is None or cached[0] != fingerprint:
+        reference = pd.read_csv(file_path)[column].tolist()
+        _INDEX_CACHE[file_path] = (fingerprint, build_trigram_index(reference))
+
+    return _INDEX_CACHE[file_path][1]
+
+
+def canonicalize_value(value, index: dict, threshold: float):
+    """
+    Return the reference value most similar to `value` (Dice coefficient over trigrams),
+    or `value` unchanged when nothing reaches `threshold`.
+    """
+
+    if not isinstance(value, str) or not value:
+        return value
+
+    cache = index["cache"]
+    if (value, threshold) in cache:
+        return cache[value, threshold]
+
+    normalized = normalize_for_match(value)
+    match = index["exact"].get(normalized)
+
+    if match is None:
+        query = trigrams(normalized)
+        shared = Counter(
+            ref_id for gram in query for ref_id in index["inverted"].get(gram, ())
+        )
+
+        best_score = threshold
+        for ref_id, count in shared.items():
+            score = 2 * count / (len(query) + len(index["grams"][ref_id]))
+            if score >= best_score:
+                best_score, match = score, index["values"][ref_id]
+
+    cache[value, threshold] = match if match is not None else value
+
+    return cache[value, threshold]
+
+
+def canonical_mapping(values, index: dict, threshold: float) -> dict:
+    """Map each distinct value to its canonical spelling, keeping only values that change."""
+
+    mapping = {}
+    for value in pd.unique(pd.Series(values).dropna()):
+        canonical = canonicalize_value(value, index, threshold)
+        if canonical != value:
+            mapping[value] = canonical
+
+    return mapping
+
+
+#PANDAS --------------------------------------------------------------------------------------
+
+def canonicalize_columns_pandas(df: pd.DataFrame, columns, threshold: float) -> pd.DataFrame:
+    """
+    Replace near-duplicate spellings in `columns` with their curated reference value.
+    Matching runs once per distinct value, then the result is mapped onto every row.
+    """
+
+    for col in columns:
+        mapping = canonical_mapping(df[col], load_reference_index(col), threshold)
+        if mapping:
+            df[col] = df[col].replace(mapping)
+
+    return df
+
+
+#DUCKDB --------------------------------------------------------------------------------------
+
+def canonicalize_columns_duckdb(con, table_name, columns, threshold: float):
+    """
+    Replace near-duplicate spellings in `columns` with their curated reference value.
+    Distinct values are matched in Python and applied with a single UPDATE per column.
+    """
+
+    for col in columns:
+        distinct = [row[0] for row in con.execute(f'SELECT DISTINCT "{col}" FROM {table_name}').fetchall()]
+        mapping = canonical_mapping(distinct, load_reference_index(col), threshold)
+        if not mapping:
+            continue
+
+        mapping_df = pd.DataFrame({"value": list(mapping), "canonical": list(mapping.values())})
+        con.register("canonical_mapping", mapping_df)
+        con.execute(f"""
+            UPDATE {table_name}
+            SET "{col}" = m.canonical
+            FROM canonical_mapping m
+            WHERE {table_name}."{col}" = m.value
+        """)
+        con.unregister("canonical_mapping")
+
+    return table_name
+
+
+#POLARS --------------------------------------------------------------------------------------
+
+def canonicalize_columns_polars(lf: pl.LazyFrame, columns, threshold: float) -> pl.LazyFrame:
+    """
+    Replace near-duplicate spellings in `columns` with their curated reference value.
+    Matching runs inside the plan on the distinct values of each batch, so the plan is not collected here.
+    """
+
+    def canonicalize_batch(index: dict):
+        return lambda values: values.replace(canonical_mapping(values.unique().to_list(), index, threshold))
+
+    return lf.with_columns([
+        pl.col(col).map_batches(canonicalize_batch(load_reference_index(col)), return_dtype=pl.String, is_elementwise=True)
+        for col in columns
+    ])
@@ -1,4 +1,5 @@
 import functools
+from urllib.parse import quote
 from sqlalchemy.engine import Engine
 
 from src.config import configuration
@@ -31,3 +32,36 @@ def get_connection() -> Engine:
     # engine.execute("SET SESSION group_concat_max_len = 100000000000;")
 
     return engine
+
+
+def attach_postgres_duckdb(con, alias: str = "postgres_db", settings: dict = None):
+    """
+    Attach the configured PostgreSQL database to a DuckDB connection.
+    `settings` are applied to every Postgres session opened through the alias.
+    Does nothing if the database is already attached.
+    """
+    attached = con.execute(
+        f"SELECT 1 FROM duckdb_databases() WHERE database_name = '{alias}'"
+    ).fetchall()
+    if attached:
+        return alias
+
+    db_url = (
+        f"postgres://{configuration.DB_USERNAME}:"
+        f"{configuration.DB_PASSWORD}@"
+        f"{configuration.DB_HOST}:"
+        f"{configuration.DB_PORT}/"
+        f"{configuration.DB_NAME}"
+    )
+    if settings:
+        options = " ".join(f"-c {name}={value}" for name, value in settings.items())
+        db_url += f"?options={quote(options)}"
+
+    # Enable DuckDB's Postgres extension
+    con.execute("INSTALL postgres;")
+    con.execute("LOAD postgres;")
+
+    # Attach the Postgres database
+    con.execute(f"ATTACH '{db_url}' AS {alias} (TYPE POSTGRES);")
+
+    return alias
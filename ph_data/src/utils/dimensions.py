@@ -0,0 +1,107 @@
+import numpy as np
+import pandas as pd
+import polars as pl
+
+# Shared dimension parser used by both the pandas and the DuckDB engines.
+# The pattern is written so it is valid for both Python `re` and DuckDB's RE2.
+
+DIMENSIONS_SOURCE_COLUMN = "length x depth x width (in cm)"
+
+DIMENSION_COLUMNS = ["length_cm", "depth_cm", "width_cm"]
+
+# Conversion factors to centimetres for an optional trailing unit suffix.
+UNIT_TO_CM = {
+    "mm": 0.1,
+    "cm": 1.0,
+    "m": 100.0,
+    "in": 2.54,
+}
+
+_NUMBER = r"([0-9]+(?:\.[0-9]+)?)"
+
+DIMENSIONS_PATTERN = (
+    r"(?i)^\s*" + _NUMBER
+    + r"\s*x\s*" + _NUMBER
+    + r"\s*x\s*" + _NUMBER
+    + r"\s*(mm|cm|m|in)?\s*$"
+)
+
+# Decimal commas (e.g. `13,5`) are rewritten to dots before matching.
+DECIMAL_COMMA_PATTERN = r"([0-9]),([0-9])"
+
+
+def parse_dimensions_array(values: pd.Series) -> np.ndarray:
+    """
+    Tokenize a dimensions column in one vectorized pass.
+    Returns a float array of shape (n, 3) in cm; unparsable rows are NaN.
+    """
+
+    normalized = values.astype("string").str.replace(DECIMAL_COMMA_PATTERN, r"\1.\2", regex=True)
+    tokens = normalized.str.extract(DIMENSIONS_PATTERN)
+
+    dims = tokens[[0, 1, 2]].astype("float64").to_numpy()
+    factor = tokens[3].str.lower().map(UNIT_TO_CM).astype("float64").fillna(1.0).to_numpy()
+
+    return dims * factor[:, None]
+
+
+def parse_dimensions_sql(table_name: str, column: str = DIMENSIONS_SOURCE_COLUMN) -> str:
+    """
+    Build a DuckDB statement that rebuilds `table_name` with length_cm, depth_cm,
+    width_cm and volume_cm3 parsed from `column` in a single regex pass.
+    """
+
+    unit_cases = " ".join(
+        f"WHEN '{unit}' THEN {factor}" for unit, factor in UNIT_TO_CM.items()
+    )
+
+    return f"""
+    CREATE OR REPLACE TABLE {table_name} AS
+    SELECT
+        * EXCLUDE (_dims, _factor),
+        length_cm * depth_cm * width_cm AS volume_cm3
+    FROM (
+        SELECT
+            *,
+            CAST(NULLIF(_dims.length, '') AS DOUBLE) * _factor AS length_cm,
+            CAST(NULLIF(_dims.depth, '') AS DOUBLE) * _factor AS depth_cm,
+            CAST(NULLIF(_dims.width, '') AS DOUBLE) * _factor AS width_cm
+        FROM (
+            SELECT
+                *,
+                CASE LOWER(_dims.unit) {unit_cases} ELSE 1.0 END AS _factor
+            FROM (
+                SELECT
+                    *,
+                    REGEXP_EXTRACT(
+                        REGEXP_REPLACE(CAST("{column}" AS VARCHAR), '{DECIMAL_COMMA_PATTERN}', '\\1.\\2', 'g'),
+                        '{DIMENSIONS_PATTERN}',
+                        ['length', 'depth', 'width', 'unit']
+                    ) AS _dims
+                FROM {table_name}
+            )
+        )
+    )
+    """
+
+
+def parse_dimensions_exprs(column: str = DIMENSIONS_SOURCE_COLUMN) -> list:
+    """
+    Build the Polars expressions for length_cm, depth_cm, width_cm and volume_cm3,
+    tokenizing `column` with a single regex pass.
+    """
+
+    tokens = (
+        pl.col(column).cast(pl.String)
+        .str.replace_all(DECIMAL_COMMA_PATTERN, "${1}.${2}")
+        .str.extract_groups(DIMENSIONS_PATTERN)
+    )
+    factor = tokens.struct.field("4").str.to_lowercase().replace_strict(UNIT_TO_CM, default=1.0, return_dtype=pl.Float64)
+
+    dims = [
+        (tokens.struct.field(str(i)).cast(pl.Float64) * factor).alias(name)
+        for i, name in enumerate(DIMENSION_COLUMNS, start=1)
+    ]
+    volume = (dims[0] * dims[1] * dims[2]).alias("volume_cm3")
+
+    return dims + [volume]
@@ -1,14 +1,21 @@
 import pandas as pd
+import polars as pl
 import duckdb
+import pyarrow as pa
 import os
 from src.config import configuration
+from .db import attach_postgres_duckdb
+from .bulk_load import bulk_load_pandas, bulk_load_duckdb
+from .warehouse import write_delta
+from .lookup import write_key_index
+from .fanout import fan_out, csv_sink, parquet_sink, postgres_sink
+from .canonicalize import canonicalize_columns_pandas, canonicalize_columns_duckdb, canonicalize_columns_polars
 from .utils import (
     clean_text_columns_pandas,
     split_product_brand_pandas,
     split_category_subcategory_pandas,
     clean_type_pandas,
     parse_dimensions_pandas,
-    calculate_volume_pandas,
     select_final_columns_pandas
 )
 from .utils import (
@@ -17,9 +24,16 @@ from .utils import (
     split_category_subcategory_duckdb,
     clean_type_duckdb,
     parse_dimensions_duckdb,
-    calculate_volume_duckdb,
     select_final_columns_duckdb
 )
+from .utils import (
+    clean_text_columns_polars,
+    split_product_brand_polars,
+    split_category_subcategory_polars,
+    clean_type_polars,
+    parse_dimensions_polars,
+    select_final_columns_polars
+)
 
 
 #EXTRACT FUNTIONS---------------------------------------------------------------------------
@@ -28,20 +42,50 @@ def extract_pandas(file_name: str) -> pd.DataFrame: # simple extract function
     return pd.read_csv(f"data/{file_name}", low_memory=False)
 
 
-def extract_duckdb(file_path: str, table_name: str = "fhv_data"):
+def extract_duckdb(file_path: str, table_name: str = "fhv_data", con=None):
     """
-    Extract CSV into DuckDB in-memory table.
+    Extract CSV into DuckDB in-memory table, reusing `con` when one is given.
     Returns: DuckDB connection and table name.
     """
-    con = duckdb.connect(database=":memory:")
-    con.execute(f"CREATE TABLE {table_name} AS SELECT * FROM read_csv_auto('{file_path}')")
+    if con is None:
+        con = duckdb.connect(database=":memory:")
+    con.execute(f"CREATE OR REPLACE TABLE {table_name} AS SELECT * FROM read_csv_auto('{file_path}')")
     return con, table_name
 
+
+def extract_polars(file_name: str) -> pl.LazyFrame:
+    """
+    Lazily scan the CSV with Polars; nothing is read until the plan is collected or sunk.
+    """
+    return pl.scan_csv(f"data/{file_name}", infer_schema_length=None)
+
 #---------------------------------------------------------------------------------------------
 #LOAD FUNCTIONS------------------------------------------------------------------------------
 
+# Indexes built on the loaded tables by the bulk-load profile
+LOAD_INDEXES = [["product_id"]]
+
+
+def fanout_sinks(engine, target: str) -> dict:
+    """
+    The CSV, Parquet (file layout) and Postgres outputs of a wide run, as fan-out sinks.
+    The source must be sorted by product_id for the Parquet key index.
+    """
+    sinks = {
+        "csv": csv_sink("data/curated/producthierarchy_clean.csv"),
+        "postgres": postgres_sink(engine, target, LOAD_INDEXES),
+    }
+    if configuration.PARQUET_LAYOUT == "file":
+        sinks["parquet"] = parquet_sink("data/warehouse/producthierarchy_clean.parquet", key="product_id")
+    return sinks
+
+
 #LOAD PANDAS----------------------------------------------------------------------------------
 def load_pandas(df: pd.DataFrame, engine) -> pd.DataFrame: # simple load function
+    if configuration.LOAD_PROFILE == "bulk":
+        bulk_load_pandas(df, engine, "product_hirearchy_active_cleaned", LOAD_INDEXES)
+        return
+
     df.to_sql("product_hirearchy_active_cleaned", engine, if_exists="replace", index=False)
 
 
@@ -54,12 +98,38 @@ def load_csv_pandas(df: pd.DataFrame, file_name: str):
 
 
 
-def load_parquet_pandas(df: pd.DataFrame, file_name: str):
+def load_parquet_pandas(df: pd.DataFrame, file_name: str, key: str = None):
     """
     Save DataFrame as Parquet in 'data/warehouse', creating folder if needed.
+    With a `key`, rows are sorted by it and a sidecar key index is written for point lookups.
     """
     os.makedirs("data/warehouse", exist_ok=True)
-    df.to_parquet(f"data/warehouse/{file_name}", index=False)
+    file_path = f"data/warehouse/{file_name}"
+    if key:
+        df = df.sort_values(key, kind="stable")
+    df.to_parquet(file_path, index=False, row_group_size=configuration.PARQUET_ROW_GROUP_SIZE)
+    if key:
+        write_key_index(file_path, key)
+
+
+def load_warehouse_pandas(df: pd.DataFrame, dataset: str, key: str = "product_id"):
+    """
+    Append the new or changed rows of the DataFrame to the Parquet warehouse dataset.
+    """
+    con = duckdb.connect(database=":memory:")
+    con.register("warehouse_source", df)
+    write_delta(con, "warehouse_source", dataset, key)
+
+
+def load_fanout_pandas(df: pd.DataFrame, engine):
+    """
+    Write the CSV, Parquet and Postgres outputs from one pass over the DataFrame, concurrently.
+    """
+    df = df.sort_values("product_id", kind="stable")
+    reader = pa.Table.from_pandas(df, preserve_index=False).to_reader(configuration.FANOUT_BATCH_ROWS)
+    fan_out(reader, fanout_sinks(engine, "product_hirearchy_active_cleaned"))
+    if configuration.PARQUET_LAYOUT == "warehouse":
+        load_warehouse_pandas(df, "producthierarchy_clean")
 
 
 
@@ -70,23 +140,14 @@ def load_duckdb(con, table_name: str, engine):
     """
     Load DuckDB table directly into PostgreSQL.
     """
-    db_url = (
-        f"postgres://{configuration.DB_USERNAME}:"
-        f"{configuration.DB_PASSWORD}@"
-        f"{configuration.DB_HOST}:"
-        f"{configuration.DB_PORT}/"
-        f"{configuration.DB_NAME}"
-    )
-
-    # Enable DuckDB's Postgres extension
-    con.execute("INSTALL postgres;")
-    con.execute("LOAD postgres;")
+    new_table_name = "product_hierarchy_active_cleaned_duckdb"
+    if configuration.LOAD_PROFILE == "bulk":
+        bulk_load_duckdb(con, table_name, engine, new_table_name, LOAD_INDEXES)
+        return
 
-    # Attach the Postgres database
-    con.execute(f"ATTACH '{db_url}' AS postgres_db (TYPE POSTGRES);")
+    attach_postgres_duckdb(con)
 
     # Insert data from DuckDB table into Postgres table
-    new_table_name = "product_hierarchy_active_cleaned_duckdb"
     con.execute(f"""
         CREATE OR REPLACE TABLE postgres_db.public.{new_table_name} AS (
             SELECT * FROM {table_name}
@@ -103,16 +164,105 @@ def load_csv_duckdb(con, table_name: str, file_name: str):
 
 
 
-def load_parquet_duckdb(con, table_name: str, file_name: str):
+def load_parquet_duckdb(con, table_name: str, file_name: str, key: str = None):
     """
     Export DuckDB table to Parquet in 'data/warehouse', creating folder if needed.
+    With a `key`, rows are sorted by it and a sidecar key index is written for point lookups.
+    """
+    os.makedirs("data/warehouse", exist_ok=True)
+    file_path = f"data/warehouse/{file_name}"
+    order_by = f'ORDER BY "{key}"' if key else ""
+    con.execute(f"""
+        COPY (SELECT * FROM {table_name} {order_by})
+        TO '{file_path}' (FORMAT 'parquet', ROW_GROUP_SIZE {configuration.PARQUET_ROW_GROUP_SIZE});
+    """)
+    if key:
+        write_key_index(file_path, key)
+
+
+def load_warehouse_duckdb(con, table_name: str, dataset: str, key: str = "product_id"):
+    """
+    Append the new or changed rows of the DuckDB table to the Parquet warehouse dataset.
+    """
+    write_delta(con, table_name, dataset, key)
+
+
+def load_fanout_duckdb(con, table_name: str, engine):
+    """
+    Stream the DuckDB table once and write the CSV, Parquet and Postgres outputs from it concurrently.
+    """
+    reader = con.execute(f'SELECT * FROM {table_name} ORDER BY "product_id"').fetch_record_batch(
+        configuration.FANOUT_BATCH_ROWS
+    )
+    fan_out(reader, fanout_sinks(engine, "product_hierarchy_active_cleaned_duckdb"))
+    if configuration.PARQUET_LAYOUT == "warehouse":
+        load_warehouse_duckdb(con, table_name, "producthierarchy_clean")
+
+
+#LOAD POLARS-------------------------------------------------------------------------------
+
+def load_polars(lf: pl.LazyFrame, engine):
+    """
+    Collect the Polars plan and load it into PostgreSQL.
+    """
+    if configuration.LOAD_PROFILE == "bulk":
+        bulk_load_pandas(lf.collect().to_pandas(), engine, "product_hierarchy_active_cleaned_polars", LOAD_INDEXES)
+        return
+
+    lf.collect().write_database(
+        "product_hierarchy_active_cleaned_polars",
+        connection=engine,
+        if_table_exists="replace"
+    )
+
+
+def load_csv_polars(lf: pl.LazyFrame, file_name: str):
+    """
+    Stream the Polars plan to CSV in 'data/curated', creating folder if needed.
+    """
+    os.makedirs("data/curated", exist_ok=True)
+    lf.sink_csv(f"data/curated/{file_name}")
+
+
+def load_parquet_polars(lf: pl.LazyFrame, file_name: str, key: str = None):
+    """
+    Stream the Polars plan to Parquet in 'data/warehouse', creating folder if needed.
+    With a `key`, rows are sorted by it and a sidecar key index is written for point lookups.
     """
     os.makedirs("data/warehouse", exist_ok=True)
-    con.execute(f"COPY {table_name} TO 'data/warehouse/{file_name}' (FORMAT 'parquet');")
+    file_path = f"data/warehouse/{file_name}"
+    if key:
+        lf = lf.sort(key)
+    lf.sink_parquet(file_path, row_group_size=configuration.PARQUET_ROW_GROUP_SIZE)
+    if key:
+        write_key_index(file_path, key)
+
+
+def load_warehouse_polars(lf: pl.LazyFrame, dataset: str, key: str = "product_id"):
+    """
+    Collect the Polars plan and append its new or changed rows to the Parquet warehouse dataset.
+    """
+    con = duckdb.connect(database=":memory:")
+    con.register("warehouse_source", lf.collect().to_arrow())
+    write_delta(con, "warehouse_source", dataset, key)
+
+
+def load_fanout_polars(lf: pl.LazyFrame, engine):
+    """
+    Collect the Polars plan once and write the CSV, Parquet and Postgres outputs from it concurrently.
+    """
+    table = lf.sort("product_id").collect().to_arrow()
+    fan_out(table.to_reader(configuration.FANOUT_BATCH_ROWS), fanout_sinks(engine, "product_hierarchy_active_cleaned_polars"))
+    if configuration.PARQUET_LAYOUT == "warehouse":
+        con = duckdb.connect(database=":memory:")
+        con.register("warehouse_source", table)
+        write_delta(con, "warehouse_source", "producthierarchy_clean", "product_id")
 
 
 #TRANSFORM FUNCTIONS---------------------------------------------------------------------------
 
+CANONICAL_COLUMNS = ["brand", "category", "subcategory"]
+
 
 #PANDAS --------------------------------------------------------------------------------------
 
@@ -128,15 +278,16 @@ def transform_pandas(df: pd.DataFrame) -> pd.DataFrame:
     # Split category and subcatgory
     df = split_category_subcategory_pandas(df)
 
+    # Canonicalize near-duplicate brand and category spellings
+    if configuration.CANONICALIZE:
+        df = canonicalize_columns_pandas(df, CANONICAL_COLUMNS, configuration.CANONICAL_MATCH_THRESHOLD)
+
     # Clean 'type' column
     df = clean_type_pandas(df)
 
-    # Parse dimensions
+    # Parse dimensions and calculate volume
     df = parse_dimensions_pandas(df)
 
-    # Calulate volume
-    df = calculate_volume_pandas(df)
-
     # Select final columns
     df = select_final_columns_pandas(df)
 
@@ -166,17 +317,51 @@ def transform_duckdb(con, table_name: str):
     # Split category & subcategory
     table_name = split_category_subcategory_duckdb(con, table_name)
 
+    # Canonicalize near-duplicate brand and category spellings
+    if configuration.CANONICALIZE:
+        table_name = canonicalize_columns_duckdb(con, table_name, CANONICAL_COLUMNS, configuration.CANONICAL_MATCH_THRESHOLD)
+
     # Clean type column
     table_name = clean_type_duckdb(con, table_name)
 
-    # Parse dimensions
+    # Parse dimensions and calculate volume
     table_name = parse_dimensions_duckdb(con, table_name)
 
-    # calculate volume
-    table_name = calculate_volume_duckdb(con, table_name)
-
     # Select final colmns in order
     table_name = select_final_columns_duckdb(con, table_name)
 
     # Return the connection and final table
     return con, table_name
+
+
+#POLARS --------------------------------------------------------------------------------------
+
+def transform_polars(lf: pl.LazyFrame) -> pl.LazyFrame:
+    """
+    Build the Product Hierarchy ETL as one lazy Polars plan.
+    Steps mirror the Pandas pipeline; Polars optimizes the whole plan when it is collected or sunk.
+    """
+
+    # Clean text columns
+    lf = clean_text_columns_polars(lf, ['product (brand)', 'type', 'category || sub_category'])
+
+    # Split product and brand
+    lf = split_product_brand_polars(lf)
+
+    # Split category and subcatgory
+    lf = split_category_subcategory_polars(lf)
+
+    # Canonicalize near-duplicate brand and category spellings
+    if configuration.CANONICALIZE:
+        lf = canonicalize_columns_polars(lf, CANONICAL_COLUMNS, configuration.CANONICAL_MATCH_THRESHOLD)
+
+    # Clean 'type' column
+    lf = clean_type_polars(lf)
+
+    # Parse dimensions and calculate volume
+    lf = parse_dimensions_polars(lf)
+
+    # Select final columns
+    lf = select_final_columns_polars(lf)
+
+    return lf
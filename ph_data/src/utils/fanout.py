@@ -0,0 +1,227 @@
+import io
+import os
+import queue
+import threading
+import time
+
+import pyarrow as pa
+import pyarrow.csv as pacsv
+import pyarrow.parquet as pq
+from sqlalchemy import text
+
+from src.config import configuration
+from .bulk_load import bulk_session_settings, publish_staging, staging_table_name
+from .logger import get_logger
+from .lookup import write_key_index
+
+# Single-pass fan-out of the final result to several sinks (LOAD_FANOUT).
+#
+# The result is read once as a stream of Arrow record batches. Every batch is handed to
+# each sink through the sink's own bounded queue, and each sink drains its queue in a
+# separate thread, so the CSV writer, the Parquet writer and the Postgres COPY run at
+# the same time (pyarrow and psycopg2 release the GIL while they encode and send).
+# A full queue blocks the reader: the slowest sink sets the pace, and no more than
+# FANOUT_QUEUE_BATCHES batches per sink are held in memory.
+#
+# When a sink fails the others are aborted. Files are written under a temporary name and
+# only renamed into place once complete, and the COPY runs in a single transaction, so a
+# failed fan-out leaves the previous outputs untouched.
+
+_END = object()
+_ABORT = object()
+
+
+class FanOutAborted(Exception):
+    """Raised into a sink when another sink or the source failed."""
+
+
+def _batches(q: queue.Queue):
+    while True:
+        item = q.get()
+        if item is _END:
+            return
+        if item is _ABORT:
+            raise FanOutAborted
+        yield item
+
+
+def _put(q: queue.Queue, item, thread: threading.Thread):
+    """Block until the sink takes `item` or its thread is gone."""
+
+    while thread.is_alive():
+        try:
+            q.put(item, timeout=0.1)
+            return
+        except queue.Full:
+            pass
+
+
+def fan_out(reader: pa.RecordBatchReader, sinks: dict) -> dict:
+    """
+    Stream the batches of `reader` into every sink of `sinks` (name -> function(schema, batches)) at once.
+    Returns the seconds each sink took, and raises the first error of the source or a sink.
+    """
+
+    logger = get_logger(log_level=configuration.LOG_LEVEL)
+    queues = {name: queue.Queue(maxsize=configuration.FANOUT_QUEUE_BATCHES) for name in sinks}
+    failed = threading.Event()
+    errors = {}
+    seconds = {}
+
+    def run(name: str, sink):
+        start = time.perf_counter()
+        try:
+            sink(reader.schema, _batches(queues[name]))
+        except FanOutAborted:
+            pass
+        except BaseException as e:
+            errors[name] = e
+            failed.set()
+        seconds[name] = round(time.perf_counter() - start, 3)
+
+    threads = {
+        name: threading.Thread(target=run, args=(name, sink), name=f"fanout-{name}", daemon=True)
+        for name, sink in sinks.items()
+    }
+    for thread in threads.values():
+        thread.start()
+
+    start = time.perf_counter()
+    rows = 0
+    try:
+        for batch in reader:
+            if failed.is_set():
+                break
+            rows += batch.num_rows
+            for name, q in queues.items():
+                _put(q, batch, threads[name])
+    except BaseException as e:
+        errors["source"] = e
+        failed.set()
+
+    end = _ABORT if failed.is_set() else _END
+    for name, q in queues.items():
+        _put(q, end, threads[name])
+    for thread in threads.values():
+        thread.join()
+
+    if errors:
+        name, error = next(iter(errors.items()))
+        raise RuntimeError(f"Fan-out {name} failed: {error}") from error
+
+    timings = ", ".join(f"{name} {s:.2f}s" for name, s in seconds.items())
+    logger.info(f"Fanned out {rows} rows in {time.perf_counter() - start:.2f}s ({timings})")
+
+    return seconds
+
+
+#SINKS ---------------------------------------------------------------------------------------
+
+def _replace_when_done(file_path: str, write):
+    tmp_path = f"{file_path}.part"
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def csv_sink(file_path: str):
+    """Sink writing the batches to a CSV file with a header."""
+
+    def sink(schema: pa.Schema, batches):
+        def write(tmp_path: str):
+            with pacsv.CSVWriter(tmp_path, schema) as writer:
+                for batch in batches:
+                    writer.write_batch(batch)
+
+        _replace_when_done(file_path, write)
+
+    return sink
+
+
+def parquet_sink(file_path: str, key: str = None):
+    """
+    Sink writing the batches to a Parquet file in row groups of PARQUET_ROW_GROUP_SIZE rows.
+    With a `key` (the batches must arrive sorted by it) a sidecar key index is written for point lookups.
+    """
+
+    row_group_size = configuration.PARQUET_ROW_GROUP_SIZE
+
+    def sink(schema: pa.Schema, batches):
+        def write(tmp_path: str):
+            pending, pending_rows = [], 0
+            with pq.ParquetWriter(tmp_path, schema) as writer:
+                for batch in batches:
+                    pending.append(batch)
+                    pending_rows += batch.num_rows
+                    if pending_rows < row_group_size:
+                        continue
+
+                    # Write whole row groups, keep the remainder for the next ones
+                    table = pa.Table.from_batches(pending, schema)
+                    full = pending_rows - pending_rows % row_group_size
+                    writer.write_table(table.slice(0, full), row_group_size=row_group_size)
+                    pending = table.slice(full).to_batches()
+                    pending_rows -= full
+
+                if pending_rows:
+                    writer.write_table(pa.Table.from_batches(pending, schema), row_group_size=row_group_size)
+
+        _replace_when_done(file_path, write)
+        if key:
+            write_key_index(file_path, key)
+
+    return sink
+
+
+def postgres_type(data_type: pa.DataType) -> str:
+    if pa.types.is_boolean(data_type):
+        return "BOOLEAN"
+    if pa.types.is_integer(data_type):
+        return "BIGINT"
+    if pa.types.is_floating(data_type):
+        return "DOUBLE PRECISION"
+    if pa.types.is_decimal(data_type):
+        return "NUMERIC"
+    if pa.types.is_date(data_type):
+        return "DATE"
+    if pa.types.is_timestamp(data_type):
+        return "TIMESTAMPTZ" if data_type.tz else "TIMESTAMP"
+    return "TEXT"
+
+
+def postgres_sink(engine, target: str, indexes: list = ()):
+    """
+    Sink replacing the Postgres table `target` with the batches, sent with COPY in one transaction.
+    With LOAD_PROFILE=bulk the rows go to an UNLOGGED staging table that is then swapped in.
+    """
+
+    bulk = configuration.LOAD_PROFILE == "bulk"
+    table = staging_table_name(target) if bulk else target
+    copy_options = pacsv.WriteOptions(include_header=False)
+
+    def sink(schema: pa.Schema, batches):
+        columns = ", ".join(f'"{field.name}" {postgres_type(field.type)}' for field in schema)
+
+        with engine.begin() as conn:
+            if bulk:
+                for name, value in bulk_session_settings().items():
+                    conn.execute(text(f"SET LOCAL {name} = '{value}'"))
+            conn.execute(text(f'DROP TABLE IF EXISTS "{table}"'))
+            conn.execute(text(f'CREATE {"UNLOGGED " if bulk else ""}TABLE "{table}" ({columns})'))
+
+            cursor = conn.connection.cursor()
+            for batch in batches:
+                buffer = io.BytesIO()
+                pacsv.write_csv(batch, buffer, copy_options)
+                buffer.seek(0)
+                cursor.copy_expert(f'COPY "{table}" FROM STDIN WITH (FORMAT csv)', buffer)
+
+        if bulk:
+            publish_staging(engine, table, target, indexes)
+
+    return sink
@@ -0,0 +1,110 @@
+import bisect
+import json
+import os
+
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+# Point lookups over key-sorted Parquet files.
+#
+# Writers sort each file by its key and keep row groups small, so every key lives
+# in exactly one row group. A sidecar `<file>.keys.json` lists the min/max key of
+# each row group; a lookup binary-searches it, then memory-maps the file and decodes
+# only that row group. Opened files and sidecars are cached per process, keyed by
+# path and mtime, so repeated lookups skip the footer and the sidecar entirely.
+
+KEY_INDEX_SUFFIX = ".keys.json"
+
+_FILE_CACHE = {}
+
+
+def key_index_path(file_path: str) -> str:
+    return f"{file_path}{KEY_INDEX_SUFFIX}"
+
+
+def build_key_index(file_path: str, key: str) -> dict:
+    """
+    Build the key index of a Parquet file from its row-group statistics.
+    Row groups without readable statistics (pyarrow cannot read DuckDB's string
+    statistics) are scanned instead, reading only the key column.
+    Raises ValueError if the file is not sorted by `key`.
+    """
+
+    parquet_file = pq.ParquetFile(file_path)
+    metadata = parquet_file.metadata
+    column = metadata.schema.names.index(key)
+
+    row_groups = []
+    for i in range(metadata.num_row_groups):
+        row_group = metadata.row_group(i)
+        if row_group.num_rows == 0:
+            continue
+        stats = row_group.column(column).statistics
+        if stats is not None and stats.has_min_max and stats.min is not None:
+            low, high = stats.min, stats.max
+        else:
+            min_max = pc.min_max(parquet_file.read_row_group(i, columns=[key])[key])
+            low, high = min_max["min"].as_py(), min_max["max"].as_py()
+        row_groups.append({"row_group": i, "min": low, "max": high, "rows": row_group.num_rows})
+
+    for previous, current in zip(row_groups, row_groups[1:]):
+        if current["min"] < previous["max"]:
+            raise ValueError(f"{file_path} is not sorted by {key}")
+
+    return {"key": key, "row_groups": row_groups}
+
+
+def write_key_index(file_path: str, key: str) -> dict:
+    """Write the sidecar key index next to a Parquet file sorted by `key`."""
+
+    index = build_key_index(file_path, key)
+    with open(key_index_path(file_path), "w") as f:
+        json.dump(index, f, default=str)
+
+    return index
+
+
+def _open(file_path: str, key: str):
+    """
+    Return the cached (memory-mapped ParquetFile, key index) for a file, reopening it if it changed.
+    Files written without a sidecar get their index built from the footer instead.
+    """
+
+    mtime = os.path.getmtime(file_path)
+    cached = _FILE_CACHE.get(file_path)
+    if cached and cached[0] == mtime:
+        return cached[1], cached[2]
+
+    if os.path.exists(key_index_path(file_path)):
+        with open(key_index_path(file_path)) as f:
+            index = json.load(f)
+    else:
+        index = build_key_index(file_path, key)
+    index["maxes"] = [rg["max"] for rg in index["row_groups"]]
+
+    parquet_file = pq.ParquetFile(file_path, memory_map=True)
+    _FILE_CACHE[file_path] = (mtime, parquet_file, index)
+
+    return parquet_file, index
+
+
+def lookup_parquet(file_path: str, key: str, value, columns: list = None):
+    """
+    Return the row of a Parquet file sorted by `key` whose key equals `value` as a dict, or None.
+    Only the row group that can hold `value` is read.
+    """
+
+    parquet_file, index = _open(file_path, key)
+
+    i = bisect.bisect_left(index["maxes"], value)
+    if i == len(index["row_groups"]) or value < index["row_groups"][i]["min"]:
+        return None
+
+    read_columns = None if columns is None else list(dict.fromkeys([key, *columns]))
+    table = parquet_file.read_row_group(index["row_groups"][i]["row_group"], columns=read_columns)
+    match = table.filter(pc.equal(table[key], value))
+    if match.num_rows == 0:
+        return None
+
+    row = match.slice(0, 1).to_pylist()[0]
+    return row if columns is None else {col: row[col] for col in columns}
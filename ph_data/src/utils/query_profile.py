@@ -0,0 +1,159 @@
+import json
+import os
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+
+from src.config import configuration
+from .logger import get_logger
+from .profiler import write_profile_report
+
+# Per-step query profiling of a DuckDB run (PROFILE_QUERIES).
+#
+# The connection of the whole run is wrapped so every statement the extract, the
+# transform steps and the loads execute runs with DuckDB's JSON profiling on. Each
+# statement is recorded under the *_duckdb function that issued it, with its latency, result rows and the operator
+# tree (timing, cardinality, rows scanned and the operator details DuckDB prints in
+# EXPLAIN ANALYZE). DuckDB writes a statement's profile once its result has been
+# consumed, so a profile is collected when the next statement starts or the block ends.
+#
+# The report lists the statements step by step and the slowest operators of the run,
+# each with a stable "path" into its plan, so two reports can be diffed operator by operator.
+
+HOTSPOT_COUNT = 10
+
+
+def _calling_step() -> str:
+    """Name of the nearest *_duckdb function on the call stack, else of the function running the statement."""
+
+    frame = caller = sys._getframe(2)
+    while frame is not None:
+        name = frame.f_code.co_name
+        if name.endswith("_duckdb"):
+            return name
+        frame = frame.f_back
+    return caller.f_code.co_name
+
+
+def flatten_operators(node: dict, path: str = "0", depth: int = 0) -> list:
+    """Flatten a DuckDB JSON profile tree into one row per operator, parents first."""
+
+    operators = []
+    for i, child in enumerate(node.get("children", [])):
+        child_path = f"{path}.{i}" if depth else str(i)
+        operators.append({
+            "path": child_path,
+            "depth": depth,
+            "operator": child.get("operator_name") or child.get("operator_type"),
+            "seconds": child.get("operator_timing", 0.0),
+            "rows": child.get("operator_cardinality"),
+            "rows_scanned": child.get("operator_rows_scanned"),
+            "details": child.get("extra_info") or {},
+        })
+        operators.extend(flatten_operators(child, child_path, depth + 1))
+    return operators
+
+
+class ProfiledConnection:
+    """DuckDB connection wrapper recording the profile of every executed statement."""
+
+    def __init__(self, con):
+        self._con = con
+        fd, self._output = tempfile.mkstemp(prefix="duckdb_profile_", suffix=".json")
+        os.close(fd)
+        os.remove(self._output)
+        self._pending = None
+        self.statements = []
+
+        con.execute("SET enable_profiling = 'json'")
+        con.execute(f"SET profiling_output = '{self._output}'")
+
+    def __getattr__(self, name):
+        return getattr(self._con, name)
+
+    def _collect(self):
+        """Attach the profile DuckDB wrote for the previous statement, if any."""
+
+        if self._pending is None:
+            return
+        statement, self._pending = self._pending, None
+
+        if os.path.exists(self._output):
+            with open(self._output) as f:
+                profile = json.load(f)
+            os.remove(self._output)
+            statement["latency"] = profile.get("latency")
+            statement["rows"] = profile.get("rows_returned")
+            statement["operators"] = flatten_operators(profile)
+
+        self.statements.append(statement)
+
+    def execute(self, query, parameters=None):
+        self._collect()
+        self._pending = {"step": _calling_step(), "sql": " ".join(str(query).split())}
+
+        start = time.perf_counter()
+        result = self._con.execute(query, parameters) if parameters is not None else self._con.execute(query)
+        self._pending["seconds"] = round(time.perf_counter() - start, 6)
+
+        return result
+
+    def close_profile(self):
+        """Collect the last statement and turn profiling off on the wrapped connection."""
+
+        self._collect()
+        self._con.execute("PRAGMA disable_profiling")
+        self._con.execute("RESET profiling_output")
+        if os.path.exists(self._output):
+            os.remove(self._output)
+
+    def report(self) -> dict:
+        steps = {}
+        for i, statement in enumerate(self.statements):
+            step = steps.setdefault(statement["step"], {"step": statement["step"], "seconds": 0.0, "statements": []})
+            step["seconds"] = round(step["seconds"] + (statement.get("latency") or statement["seconds"]), 6)
+            step["statements"].append({"statement": i, **statement})
+
+        operators = [
+            {"step": s["step"], "statement": i, **op}
+            for i, s in enumerate(self.statements) for op in s.get("operators", [])
+        ]
+        hotspots = sorted(operators, key=lambda op: op["seconds"], reverse=True)[:HOTSPOT_COUNT]
+
+        return {
+            "total_seconds": round(sum(step["seconds"] for step in steps.values()), 6),
+            "steps": list(steps.values()),
+            "hotspots": hotspots,
+        }
+
+
+@contextmanager
+def profile_queries(con, report_name: str):
+    """
+    Yield a connection that profiles the statements run through it when PROFILE_QUERIES is set,
+    and write the report to data/reports/<report_name> on exit. Yields `con` itself otherwise.
+    """
+
+    if not configuration.PROFILE_QUERIES:
+        yield con
+        return
+
+    logger = get_logger(log_level=configuration.LOG_LEVEL)
+    profiled = ProfiledConnection(con)
+    try:
+        yield profiled
+    finally:
+        profiled.close_profile()
+
+    report = profiled.report()
+    write_profile_report(report, report_name)
+
+    for step in report["steps"]:
+        slowest = max(
+            (op for s in step["statements"] for op in s.get("operators", [])),
+            key=lambda op: op["seconds"], default=None
+        )
+        hotspot = f", slowest operator {slowest['operator']} ({slowest['seconds']:.3f}s, {slowest['rows']} rows)" if slowest else ""
+        logger.info(f"{step['step']}: {step['seconds']:.3f}s in {len(step['statements'])} statements{hotspot}")
+    logger.info(f"Query profile written to data/reports/{report_name}")
@@ -0,0 +1,168 @@
+import pandas as pd
+import sqlalchemy
+
+from .db import attach_postgres_duckdb
+
+# Star-schema output: one table per dimension with an integer surrogate key,
+# plus a narrow fact table that references them.
+# Dimension tables are only ever appended to, so keys are stable between runs.
+
+STAR_DIMENSIONS = {
+    "dim_brand": ("brand_key", ["brand"]),
+    "dim_type": ("type_key", ["type"]),
+    "dim_category": ("category_key", ["category", "subcategory"]),
+}
+
+FACT_TABLE = "product_fact"
+
+FACT_COLUMNS = [
+    'product_id', 'product', 'brand_key', 'type_key',
+    'category_key', 'length_cm', 'depth_cm', 'width_cm', 'volume_cm3'
+]
+
+
+#PANDAS --------------------------------------------------------------------------------------
+
+def read_dimension_pandas(engine, dim_name: str) -> pd.DataFrame:
+    """
+    Read an existing dimension table from PostgreSQL, or an empty frame on the first run.
+    """
+
+    key, attrs = STAR_DIMENSIONS[dim_name]
+
+    if sqlalchemy.inspect(engine).has_table(dim_name):
+        return pd.read_sql_table(dim_name, engine)
+
+    return pd.DataFrame({key: pd.Series(dtype="int64"), **{a: pd.Series(dtype="object") for a in attrs}})
+
+
+def new_dimension_rows_pandas(df: pd.DataFrame, existing: pd.DataFrame, dim_name: str) -> pd.DataFrame:
+    """
+    Return the distinct attribute values of `df` not yet in `existing`,
+    numbered with surrogate keys continuing after the current maximum.
+    """
+
+    key, attrs = STAR_DIMENSIONS[dim_name]
+
+    values = df[attrs].dropna(subset=[attrs[0]]).drop_duplicates()
+    merged = values.merge(existing[attrs], on=attrs, how="left", indicator=True)
+
+    new_rows = merged.loc[merged["_merge"] == "left_only", attrs]
+    new_rows = new_rows.sort_values(attrs).reset_index(drop=True)
+
+    start = int(existing[key].max()) if len(existing) else 0
+    new_rows.insert(0, key, range(start + 1, start + 1 + len(new_rows)))
+
+    return new_rows
+
+
+def build_fact_pandas(df: pd.DataFrame, dims: dict) -> pd.DataFrame:
+    """
+    Replace the descriptive columns of `df` with surrogate keys from `dims`.
+    """
+
+    fact = df
+    for dim_name, dim in dims.items():
+        key, attrs = STAR_DIMENSIONS[dim_name]
+        fact = fact.merge(dim[[key] + attrs], on=attrs, how="left")
+        fact[key] = fact[key].astype("Int64")
+
+    return fact[FACT_COLUMNS]
+
+
+def load_star_schema_pandas(df: pd.DataFrame, engine) -> dict:
+    """
+    Incrementally maintain the dimension tables and replace the fact table in PostgreSQL.
+    Returns every star-schema table (full dimensions and fact) keyed by table name.
+    """
+
+    tables = {}
+
+    for dim_name in STAR_DIMENSIONS:
+        existing = read_dimension_pandas(engine, dim_name)
+        new_rows = new_dimension_rows_pandas(df, existing, dim_name)
+
+        # Only the new dimension members are sent to the database
+        new_rows.to_sql(dim_name, engine, if_exists="append", index=False)
+
+        tables[dim_name] = pd.concat([existing, new_rows], ignore_index=True)
+
+    fact = build_fact_pandas(df, tables)
+    fact.to_sql(FACT_TABLE, engine, if_exists="replace", index=False)
+    tables[FACT_TABLE] = fact
+
+    return tables
+
+
+#DUCKDB --------------------------------------------------------------------------------------
+
+def update_dimension_duckdb(con, table_name: str, dim_name: str, db_alias: str = "postgres_db"):
+    """
+    Append the new members of one dimension to PostgreSQL and mirror the
+    full dimension into a local DuckDB table of the same name.
+    """
+
+    key, attrs = STAR_DIMENSIONS[dim_name]
+    attr_defs = ", ".join(f"{a} VARCHAR" for a in attrs)
+    attr_list = ", ".join(attrs)
+    match = " AND ".join(f"d.{a} IS NOT DISTINCT FROM v.{a}" for a in attrs)
+
+    con.execute(f"""
+        CREATE TABLE IF NOT EXISTS {db_alias}.public.{dim_name} (
+            {key} BIGINT,
+            {attr_defs}
+        )
+    """)
+
+    con.execute(f"CREATE OR REPLACE TABLE {dim_name} AS SELECT * FROM {db_alias}.public.{dim_name}")
+
+    con.execute(f"""
+        CREATE OR REPLACE TEMP TABLE {dim_name}_new AS
+        SELECT
+            (SELECT COALESCE(MAX({key}), 0) FROM {dim_name})
+                + ROW_NUMBER() OVER (ORDER BY {attr_list}) AS {key},
+            {attr_list}
+        FROM (
+            SELECT DISTINCT {attr_list}
+            FROM {table_name}
+            WHERE {attrs[0]} IS NOT NULL
+        ) v
+        WHERE NOT EXISTS (SELECT 1 FROM {dim_name} d WHERE {match})
+    """)
+
+    # Only the new dimension members are sent to the database
+    con.execute(f"INSERT INTO {db_alias}.public.{dim_name} SELECT * FROM {dim_name}_new")
+    con.execute(f"INSERT INTO {dim_name} SELECT * FROM {dim_name}_new")
+
+    return dim_name
+
+
+def load_star_schema_duckdb(con, table_name: str) -> list:
+    """
+    Incrementally maintain the dimension tables and replace the fact table in PostgreSQL.
+    Returns the names of the local DuckDB tables holding the star schema.
+    """
+
+    db_alias = attach_postgres_duckdb(con)
+
+    joins = []
+    for dim_name in STAR_DIMENSIONS:
+        update_dimension_duckdb(con, table_name, dim_name, db_alias)
+
+        key, attrs = STAR_DIMENSIONS[dim_name]
+        match = " AND ".join(f"t.{a} IS NOT DISTINCT FROM {dim_name}.{a}" for a in attrs)
+        joins.append(f"LEFT JOIN {dim_name} ON t.{attrs[0]} IS NOT NULL AND {match}")
+
+    con.execute(f"""
+        CREATE OR REPLACE TABLE {FACT_TABLE} AS
+        SELECT
+            t.product_id, t.product,
+            dim_brand.brand_key, dim_type.type_key, dim_category.category_key,
+            t.length_cm, t.depth_cm, t.width_cm, t.volume_cm3
+        FROM {table_name} t
+        {' '.join(joins)}
+    """)
+
+    con.execute(f"CREATE OR REPLACE TABLE {db_alias}.public.{FACT_TABLE} AS SELECT * FROM {FACT_TABLE}")
+
+    return list(STAR_DIMENSIONS) + [FACT_TABLE]
@@ -1,6 +1,14 @@
 import pandas as pd
+import polars as pl
 import duckdb
 import re
+from .dimensions import (
+    DIMENSIONS_SOURCE_COLUMN,
+    DIMENSION_COLUMNS,
+    parse_dimensions_array,
+    parse_dimensions_sql,
+    parse_dimensions_exprs
+)
 
 #-----------------------------------------------
 #PANDAS
@@ -83,37 +91,14 @@ def clean_type_pandas(df: pd.DataFrame) -> pd.DataFrame:
 
 def parse_dimensions_pandas(df: pd.DataFrame) -> pd.DataFrame:
     """
-    Parse 'length x depth x width (in cm)' into numeric columns: length_cm, depth_cm, width_cm.
+    Parse 'length x depth x width (in cm)' into numeric columns: length_cm, depth_cm, width_cm,
+    normalizing decimal commas and mm/m/in units, and derive volume_cm3 in the same pass.
     """
 
-    def parse_dim(value: str):
-        if pd.isna(value):
-            return None, None, None
-        
-        pattern = r'^\s*([0-9]+(?:\.[0-9]+)?)\s*x\s*([0-9]+(?:\.[0-9]+)?)\s*x\s*([0-9]+(?:\.[0-9]+)?)(?:\s*cm)?\s*$'
-        match = re.match(pattern, value)
+    dims = parse_dimensions_array(df[DIMENSIONS_SOURCE_COLUMN])
 
-        if match:
-            return float(match.group(1)), float(match.group(2)), float(match.group(3))
-        
-        return None, None, None
-
-    df[['length_cm', 'depth_cm', 'width_cm']] = df['length x depth x width (in cm)'].apply(lambda x: pd.Series(parse_dim(x)))
-    
-    return df
-
-
-def calculate_volume_pandas(df: pd.DataFrame) -> pd.DataFrame:
-    """
-    Calculate the optional derived metric volume_cm3 = length_cm * depth_cm * width_cm.
-    If any dimension is missing (NaN), volume_cm3 will be NaN.
-    """
-
-    for col in ['length_cm', 'depth_cm', 'width_cm']:
-        if col not in df.columns:
-            df[col] = None 
-
-    df['volume_cm3'] = df['length_cm'] * df['depth_cm'] * df['width_cm']
+    df[DIMENSION_COLUMNS] = dims
+    df['volume_cm3'] = dims.prod(axis=1)
 
     return df
 
@@ -263,38 +248,11 @@ def clean_type_duckdb(con, table_name):
 
 def parse_dimensions_duckdb(con, table_name):
     """
-    Parse 'length x depth x width (in cm)' into numeric columns: length_cm, depth_cm, width_cm.
-    """
-
-    con.execute(f"ALTER TABLE {table_name} ADD COLUMN IF NOT EXISTS length_cm DOUBLE")
-    con.execute(f"ALTER TABLE {table_name} ADD COLUMN IF NOT EXISTS depth_cm DOUBLE")
-    con.execute(f"ALTER TABLE {table_name} ADD COLUMN IF NOT EXISTS width_cm DOUBLE")
-
-    sql = f"""
-    UPDATE {table_name}
-    SET
-        length_cm = CAST(NULLIF(REGEXP_EXTRACT("length x depth x width (in cm)", '^\\s*([0-9]+(?:\\.[0-9]+)?)', 1), '') AS DOUBLE),
-        depth_cm  = CAST(NULLIF(REGEXP_EXTRACT("length x depth x width (in cm)", 'x\\s*([0-9]+(?:\\.[0-9]+)?)', 1), '') AS DOUBLE),
-        width_cm  = CAST(NULLIF(REGEXP_EXTRACT("length x depth x width (in cm)", 'x\\s*[0-9]+(?:\\.[0-9]+)?\\s*x\\s*([0-9]+(?:\\.[0-9]+)?)', 1), '') AS DOUBLE)
+    Parse 'length x depth x width (in cm)' into numeric columns: length_cm, depth_cm, width_cm,
+    normalizing decimal commas and mm/m/in units, and derive volume_cm3 in the same pass.
     """
 
-    con.execute(sql)
-
-    return table_name
-
-
-def calculate_volume_duckdb(con, table_name):
-    """
-    Calculate the optional derived metric volume_cm3 = length_cm * depth_cm * width_cm.
-    Adds a new column if it doesn't exist.
-    """
-
-    con.execute(f"ALTER TABLE {table_name} ADD COLUMN IF NOT EXISTS volume_cm3 DOUBLE")
-
-    con.execute(f"""
-    UPDATE {table_name}
-    SET volume_cm3 = length_cm * depth_cm * width_cm
-    """)
+    con.execute(parse_dimensions_sql(table_name))
 
     return table_name
 
@@ -331,3 +289,92 @@ def select_final_columns_duckdb(con, table_name):
     return view_name
 
 
+#--------------------------------------------------------------------------------------------
+#POLARS -------------------------------------------------------------------------------------
+
+def normalize_text_polars(column: str) -> pl.Expr:
+    """
+    Remove control characters, collapse whitespace and trim one column; empty strings become null.
+    """
+
+    cleaned = (
+        pl.col(column).cast(pl.String)
+        .str.replace_all(r'[\x00-\x1F\x7F]+', '')
+        .str.replace_all(r'\s+', ' ')
+        .str.strip_chars()
+    )
+
+    return pl.when(cleaned == '').then(None).otherwise(cleaned).alias(column)
+
+
+def clean_text_columns_polars(lf: pl.LazyFrame, columns) -> pl.LazyFrame:
+    """
+    Clean specified text columns by removing control characters, collapsing whitespace,
+    and trimming leading/trailing spaces.
+    """
+
+    existing = lf.collect_schema().names()
+
+    return lf.with_columns([normalize_text_polars(col) for col in columns if col in existing])
+
+
+def split_product_brand_polars(lf: pl.LazyFrame) -> pl.LazyFrame:
+    """
+    Split 'product (brand)' into 'product' and 'brand' columns.
+    Last parentheses group is assumed to be the brand.
+    """
+
+    value = pl.col('product (brand)')
+
+    return lf.with_columns(
+        value.str.replace(r'\([^()]*\)\s*$', '').str.to_titlecase().str.strip_chars().alias('product'),
+        value.str.extract(r'\(([^()]*)\)\s*$', 1).str.to_titlecase().str.strip_chars().alias('brand'),
+    )
+
+
+def split_category_subcategory_polars(lf: pl.LazyFrame) -> pl.LazyFrame:
+    """
+    Split 'category || sub_category' into separate 'category' and 'subcategory' columns.
+    """
+
+    # Control characters are already removed, so \x00 is a safe split marker
+    parts = pl.col('category || sub_category').str.replace_all(r'\s*\|\|\s*', '\x00').str.split('\x00')
+
+    return lf.with_columns(
+        parts.list.get(0, null_on_oob=True).str.strip_chars().str.to_titlecase().alias('category'),
+        parts.list.get(1, null_on_oob=True).str.strip_chars().str.to_titlecase().alias('subcategory'),
+    )
+
+
+def clean_type_polars(lf: pl.LazyFrame) -> pl.LazyFrame:
+    """
+    Clean the 'type' column: remove extra whitespace/control chars and Title Case.
+    """
+
+    if 'type' not in lf.collect_schema().names():
+        return lf
+
+    return lf.with_columns(normalize_text_polars('type').str.to_titlecase())
+
+
+def parse_dimensions_polars(lf: pl.LazyFrame) -> pl.LazyFrame:
+    """
+    Parse 'length x depth x width (in cm)' into numeric columns: length_cm, depth_cm, width_cm,
+    normalizing decimal commas and mm/m/in units, and derive volume_cm3 in the same pass.
+    """
+
+    return lf.with_columns(parse_dimensions_exprs())
+
+
+def select_final_columns_polars(lf: pl.LazyFrame) -> pl.LazyFrame:
+    """
+    Keep only the target columns in order for analytics-ready dataset.
+    """
+
+    final_cols = [
+        'product_id', 'product', 'brand', 'type',
+        'category', 'subcategory', 'length_cm',
+        'depth_cm', 'width_cm', 'volume_cm3'
+    ]
+
+    return lf.select(final_cols)
@@ -0,0 +1,344 @@
+import json
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+import duckdb
+
+from src.config import configuration
+from .logger import get_logger
+from .lookup import KEY_INDEX_SUFFIX, key_index_path, lookup_parquet, write_key_index
+
+# Append-only Parquet warehouse.
+#
+# data/warehouse/<dataset>/
+#   parts/<version>-<uuid>.parquet   immutable files, never rewritten in place
+#   manifests/<version>.json         immutable list of the parts making up each version
+#
+# A run writes one part holding only the new or changed rows (plus tombstones for
+# keys that disappeared) and publishes it with a new manifest. Manifests are written
+# to a temp file and hard-linked into place, so a version is either complete or
+# absent, and two writers can never publish the same version.
+# Readers pick the latest manifest once and only read the parts it lists, so they
+# see a consistent snapshot while later versions are being written.
+# When the same key appears in several parts, the row with the highest `_version` wins.
+
+WAREHOUSE_ROOT = "data/warehouse"
+
+META_COLUMNS = ["_row_hash", "_deleted", "_version"]
+
+# Publishing is retried when another writer took the version number first
+PUBLISH_ATTEMPTS = 20
+
+
+def dataset_path(dataset: str) -> str:
+    return f"{WAREHOUSE_ROOT}/{dataset}"
+
+
+def list_versions(dataset: str) -> list:
+    """Return the published versions of a dataset, oldest first."""
+
+    manifests = f"{dataset_path(dataset)}/manifests"
+    if not os.path.isdir(manifests):
+        return []
+
+    return sorted(int(name[:-5]) for name in os.listdir(manifests) if name.endswith(".json"))
+
+
+def read_manifest(dataset: str, version: int = None) -> dict:
+    """
+    Return the manifest of `version` (default: latest).
+    An unpublished dataset reads as an empty version 0.
+    """
+
+    versions = list_versions(dataset)
+    if version is None:
+        version = versions[-1] if versions else 0
+    if version == 0:
+        return {"version": 0, "files": []}
+
+    with open(f"{dataset_path(dataset)}/manifests/{version:08d}.json") as f:
+        return json.load(f)
+
+
+def publish_manifest(dataset: str, version: int, files: list, **metadata) -> dict:
+    """
+    Atomically publish `files` as `version`.
+    Raises FileExistsError if another writer already published that version.
+    """
+
+    manifests = f"{dataset_path(dataset)}/manifests"
+    os.makedirs(manifests, exist_ok=True)
+
+    manifest = {
+        "version": version,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "files": files,
+        **metadata,
+    }
+
+    tmp_path = f"{manifests}/.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    try:
+        os.link(tmp_path, f"{manifests}/{version:08d}.json")
+    finally:
+        os.remove(tmp_path)
+
+    return manifest
+
+
+def _file_list(dataset: str, files: list) -> str:
+    return "[" + ", ".join(f"'{dataset_path(dataset)}/{f['path']}'" for f in files) + "]"
+
+
+def snapshot_sql(dataset: str, manifest: dict, key: str, include_deleted: bool = False) -> str:
+    """SQL returning the latest row per key of a manifest, with the meta columns."""
+
+    deleted = "" if include_deleted else "WHERE NOT _deleted"
+
+    return f"""
+        SELECT * FROM (
+            SELECT *
+            FROM read_parquet({_file_list(dataset, manifest["files"])}, union_by_name = true)
+            QUALIFY ROW_NUMBER() OVER (PARTITION BY "{key}" ORDER BY _version DESC) = 1
+        ) {deleted}
+    """
+
+
+def read_snapshot_duckdb(con, dataset: str, version: int = None):
+    """
+    Return a DuckDB relation over one published version (default: latest), without meta columns.
+    Returns None when nothing has been published yet.
+    """
+
+    manifest = read_manifest(dataset, version)
+    if not manifest["files"]:
+        return None
+
+    meta = ", ".join(META_COLUMNS)
+    return con.sql(f"SELECT * EXCLUDE ({meta}) FROM ({snapshot_sql(dataset, manifest, manifest['key'])}) ORDER BY \"{manifest['key']}\"")
+
+
+def read_snapshot_pandas(dataset: str, version: int = None):
+    """Read one published version (default: latest) into a DataFrame."""
+
+    con = duckdb.connect(database=":memory:")
+    relation = read_snapshot_duckdb(con, dataset, version)
+
+    return relation.df() if relation is not None else None
+
+
+def lookup_warehouse(dataset: str, value, columns: list = None, version: int = None):
+    """
+    Return the row with key `value` in one published version (default: latest) as a dict, or None.
+    Parts are probed newest first through their key index, so only one row group per part is read.
+    """
+
+    manifest = read_manifest(dataset, version)
+    for part in reversed(manifest["files"]):
+        read_columns = None if columns is None else columns + ["_deleted"]
+        row = lookup_parquet(f"{dataset_path(dataset)}/{part['path']}", manifest["key"], value, read_columns)
+        if row is None:
+            continue
+        if row.pop("_deleted"):
+            return None
+        for col in META_COLUMNS:
+            row.pop(col, None)
+        return row
+
+    return None
+
+
+#WRITE --------------------------------------------------------------------------------------
+
+def write_delta(con, source_table: str, dataset: str, key: str) -> dict:
+    """
+    Append the rows of `source_table` that are new or changed since the latest version,
+    plus a tombstone for every key no longer present, and publish them as a new version.
+    `source_table` must hold the full current result (any table, view or registered frame).
+    Returns the published manifest, or the unchanged latest one when there is no delta.
+    """
+
+    logger = get_logger(log_level=configuration.LOG_LEVEL)
+
+    columns = [row[0] for row in con.execute(f"DESCRIBE SELECT * FROM {source_table}").fetchall()]
+    row_hash = "HASH(" + ", ".join(f'CAST("{col}" AS VARCHAR)' for col in columns) + ")"
+
+    con.execute(f"""
+        CREATE OR REPLACE TEMP TABLE _warehouse_incoming AS
+        SELECT *, {row_hash} AS _row_hash FROM {source_table}
+    """)
+
+    os.makedirs(f"{dataset_path(dataset)}/parts", exist_ok=True)
+
+    for _ in range(PUBLISH_ATTEMPTS):
+        current = read_manifest(dataset)
+        version = current["version"] + 1
+
+        if current["files"]:
+            con.execute(f"""
+                CREATE OR REPLACE TEMP TABLE _warehouse_current AS
+                SELECT "{key}", _row_hash, _deleted
+                FROM ({snapshot_sql(dataset, current, key, include_deleted=True)})
+            """)
+        else:
+            con.execute(f"""
+                CREATE OR REPLACE TEMP TABLE _warehouse_current AS
+                SELECT "{key}", _row_hash, false AS _deleted FROM _warehouse_incoming LIMIT 0
+            """)
+
+        con.execute(f"""
+            CREATE OR REPLACE TEMP TABLE _warehouse_delta AS
+            SELECT i.*, false AS _deleted, {version} AS _version
+            FROM _warehouse_incoming i
+            LEFT JOIN _warehouse_current c USING ("{key}")
+            WHERE c."{key}" IS NULL OR c._deleted OR c._row_hash <> i._row_hash
+            UNION ALL BY NAME
+            SELECT c."{key}", c._row_hash, true AS _deleted, {version} AS _version
+            FROM _warehouse_current c
+            ANTI JOIN _warehouse_incoming i USING ("{key}")
+            WHERE NOT c._deleted
+        """)
+
+        changed, deleted = con.execute(
+            "SELECT COUNT(*) FILTER (WHERE NOT _deleted), COUNT(*) FILTER (WHERE _deleted) FROM _warehouse_delta"
+        ).fetchone()
+        if not changed and not deleted:
+            logger.info(f"Warehouse {dataset}: no changes, staying at version {current['version']}")
+            return current
+
+        part = f"parts/{version:08d}-{uuid.uuid4().hex}.parquet"
+        con.execute(f"""
+            COPY (SELECT * FROM _warehouse_delta ORDER BY "{key}")
+            TO '{dataset_path(dataset)}/{part}' (FORMAT 'parquet', ROW_GROUP_SIZE {configuration.PARQUET_ROW_GROUP_SIZE})
+        """)
+        write_key_index(f"{dataset_path(dataset)}/{part}", key)
+
+        files = current["files"] + [{"path": part, "rows": changed + deleted, "version": version}]
+        try:
+            manifest = publish_manifest(dataset, version, files, key=key, parent=current["version"])
+        except FileExistsError:
+            # Someone else published this version; diff against theirs and try again
+            os.remove(f"{dataset_path(dataset)}/{part}")
+            os.remove(key_index_path(f"{dataset_path(dataset)}/{part}"))
+            continue
+
+        logger.info(f"Warehouse {dataset}: published version {version} ({changed} changed, {deleted} deleted)")
+        maybe_compact(dataset)
+        return manifest
+
+    raise RuntimeError(f"Could not publish a new version of {dataset} after {PUBLISH_ATTEMPTS} attempts")
+
+
+#COMPACTION ---------------------------------------------------------------------------------
+
+def compact_warehouse(dataset: str) -> dict:
+    """
+    Merge every part of the latest version into one file without superseded rows or tombstones,
+    publish it as a new version, then drop versions and parts past the retention window.
+    Parts published while compaction runs are kept on top of the compacted file.
+    """
+
+    logger = get_logger(log_level=configuration.LOG_LEVEL)
+    con = duckdb.connect(database=":memory:")
+
+    base = read_manifest(dataset)
+    if len(base["files"]) < 2:
+        return base
+
+    key = base["key"]
+    part = f"parts/{base['version']:08d}-compacted-{uuid.uuid4().hex}.parquet"
+    con.execute(f"""
+        COPY (SELECT * FROM ({snapshot_sql(dataset, base, key)}) ORDER BY "{key}")
+        TO '{dataset_path(dataset)}/{part}' (FORMAT 'parquet', ROW_GROUP_SIZE {configuration.PARQUET_ROW_GROUP_SIZE})
+    """)
+    write_key_index(f"{dataset_path(dataset)}/{part}", key)
+    rows = con.execute(f"SELECT COUNT(*) FROM read_parquet('{dataset_path(dataset)}/{part}')").fetchone()[0]
+
+    compacted = [p["path"] for p in base["files"]]
+    for _ in range(PUBLISH_ATTEMPTS):
+        current = read_manifest(dataset)
+        newer = [f for f in current["files"] if f["path"] not in compacted]
+        files = [{"path": part, "rows": rows, "version": base["version"]}] + newer
+        try:
+            manifest = publish_manifest(
+                dataset, current["version"] + 1, files, key=key, parent=current["version"], compacted=base["version"]
+            )
+            break
+        except FileExistsError:
+            continue
+    else:
+        os.remove(f"{dataset_path(dataset)}/{part}")
+        os.remove(key_index_path(f"{dataset_path(dataset)}/{part}"))
+        raise RuntimeError(f"Could not publish the compaction of {dataset} after {PUBLISH_ATTEMPTS} attempts")
+
+    logger.info(f"Warehouse {dataset}: compacted {len(base['files'])} parts into version {manifest['version']}")
+    expire_versions(dataset, configuration.WAREHOUSE_KEEP_VERSIONS)
+
+    return manifest
+
+
+def expire_versions(dataset: str, keep: int):
+    """
+    Delete all but the newest `keep` manifests and every part none of them reference.
+    Parts modified within WAREHOUSE_PART_GRACE_SECONDS are kept even when unreferenced:
+    they can be the output of a write_delta or a compaction, here or in another process,
+    that is about to be published. Older orphans (e.g. from a crashed writer) are deleted.
+    Readers still holding an expired version must re-read the latest manifest.
+    """
+
+    versions = list_versions(dataset)
+    kept = versions[-keep:] if keep > 0 else versions[-1:]
+
+    referenced = set()
+    for version in kept:
+        referenced.update(f["path"] for f in read_manifest(dataset, version)["files"])
+
+    for version in versions[:-len(kept)]:
+        os.remove(f"{dataset_path(dataset)}/manifests/{version:08d}.json")
+
+    cutoff = time.time() - configuration.WAREHOUSE_PART_GRACE_SECONDS
+    for name in os.listdir(f"{dataset_path(dataset)}/parts"):
+        path = f"{dataset_path(dataset)}/parts/{name}"
+        if f"parts/{name.removesuffix(KEY_INDEX_SUFFIX)}" in referenced:
+            continue
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+        except FileNotFoundError:
+            # Removed meanwhile by its writer after losing a publish race
+            pass
+
+
+_compacting = set()
+_compacting_lock = threading.Lock()
+
+
+def _compact_in_background(dataset: str):
+    try:
+        compact_warehouse(dataset)
+    except Exception as e:
+        get_logger(log_level=configuration.LOG_LEVEL).error(f"Compacting {dataset} failed. Error: {str(e)}")
+    finally:
+        with _compacting_lock:
+            _compacting.discard(dataset)
+
+
+def maybe_compact(dataset: str):
+    """
+    Start a background compaction once the latest version has WAREHOUSE_COMPACT_FILES parts.
+    At most one compaction per dataset runs at a time in this process.
+    """
+
+    if len(read_manifest(dataset)["files"]) < configuration.WAREHOUSE_COMPACT_FILES:
+        return
+
+    with _compacting_lock:
+        if dataset in _compacting:
+            return
+        _compacting.add(dataset)
+
+    threading.Thread(target=_compact_in_background, args=(dataset,), name=f"compact-{dataset}").start()